@@ -100,7 +100,7 @@ class EngineGameGUI(tk.Tk):
             self.selected_piece = False
             return 
         #  otherwise select the piece, and have the engine highlight the legal moves
-        if engine.current_position.piece_at(eng.cg.to_index(row, col))[0] == engine.current_position.whos_turn:
+        if engine.current_position.piece_at(engine.current_position.geometry.to_index(row, col))[0] == engine.current_position.whos_turn:
             self.selected_piece = (row, col)
             self.highlight_legal_moves(row, col)
     
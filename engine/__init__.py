@@ -1,3 +1,4 @@
 from .searcher import *
 from .game import *
+from .move_picker import *
 from .engine import *
\ No newline at end of file
@@ -1,7 +1,12 @@
 from .attack_tables import *
+from .standard_attack_tables import *
+from .geometry import *
+from .table_cache import *
+from .shared_tables import *
 from .bitboard import *
 from .move import *
 from .position import *
+from .fen_loader import *
 from .movement_pattern import *
 from .piece import *
 from .piece_set import *
@@ -1,9 +1,13 @@
 from typing import List
 from .bitboard import Bitboard, to_index, from_index
+from .geometry import Geometry, GENERIC_GEOMETRY
+from .table_cache import load_cached_tables, save_cached_tables, get_builder_digest
 
 '''
 This file handles the valid move generation for each piece. It uses the bitboard representation
 of the board to generate the moves for each piece based on their movememnt patterns.
+All of the masks and tables are stored as raw ints, see the note in bitboard.py, and are built
+for one geometry (see geometry.py), the generic 16x16 one unless told otherwise.
 '''
 
 '''
@@ -11,43 +15,46 @@ The MaskHandler class can be quite confusing.  The idea here is to map out the s
 That are in the same row, column, or diagonal as a given square.  This is done by creating lists
 of bitboards that represent the squares in a certain direction FROM the index of the square in question.
 
-For example, MaskHandler.north[16] will be a bitboard with all of the squares directly north of the 16th square
-marked as a 1. In this case, the 16th square is the 1st square in the 2nd row.  So the bitboard will have
-just the 0th square set to 1.
+For example, in the generic geometry MaskHandler.south[16] will be a bitboard with all of the squares directly
+south of the 16th square marked as a 1. In this case, the 16th square is the 1st square in the 2nd row.  So the
+bitboard will have just the 0th square set to 1.
 '''
 class MaskHandler:
     # Handles the bitboard masks for use with the attack tables
-    def __init__(self):
-        self.north = [Bitboard.zero() for _ in range(256)]
-        self.east = [Bitboard.zero() for _ in range(256)]
-        self.south = [Bitboard.zero() for _ in range(256)]
-        self.west = [Bitboard.zero() for _ in range(256)]
-        self.northeast = [Bitboard.zero() for _ in range(256)]
-        self.northwest = [Bitboard.zero() for _ in range(256)]
-        self.southeast = [Bitboard.zero() for _ in range(256)]
-        self.southwest = [Bitboard.zero() for _ in range(256)]
-        self.diagonals = [Bitboard.zero() for _ in range(256)]
-        self.antidiagonals = [Bitboard.zero() for _ in range(256)]
-        self.left_masks = [Bitboard.zero() for _ in range(16)] # masks for the left side of a certain column, (exclusive)
-        self.right_masks = [Bitboard.zero() for _ in range(16)]
-        self.files = [Bitboard.zero() for _ in range(16)] # masks for just the file
-        self.ranks = [Bitboard.zero() for _ in range(16)] # masks for just a rank
-        self.main_diagonal = Bitboard.zero() # mask for the main diagonal
-        self.zero = Bitboard.zero() # a zero bitboard
+    def __init__(self, geometry: Geometry = GENERIC_GEOMETRY):
+        self.geometry = geometry
+        num_squares = geometry.num_squares
+        stride = geometry.stride
+        height = geometry.height
+        to_index = geometry.to_index
+        self.north = [0] * num_squares
+        self.east = [0] * num_squares
+        self.south = [0] * num_squares
+        self.west = [0] * num_squares
+        self.northeast = [0] * num_squares
+        self.northwest = [0] * num_squares
+        self.southeast = [0] * num_squares
+        self.southwest = [0] * num_squares
+        self.diagonals = [0] * num_squares
+        self.antidiagonals = [0] * num_squares
+        self.left_masks = [0] * stride # masks for the left side of a certain column, (exclusive)
+        self.right_masks = [0] * stride
+        self.files = [0] * stride # masks for just the file
+        self.ranks = [0] * height # masks for just a rank
+        self.main_diagonal = 0 # mask for the main diagonal
+        self.zero = 0 # a zero bitboard
         
         # Create the left and right masks
-        cumulative_left = Bitboard.zero()
-        cumulative_right = Bitboard.zero()
+        cumulative_left = 0
+        cumulative_right = 0
 
-        for i in range(16):
-            new_left = Bitboard.zero()
-            new_right = Bitboard.zero()
-            new_left |= cumulative_left
-            new_right |= cumulative_right
+        for i in range(stride):
+            new_left = cumulative_left
+            new_right = cumulative_right
 
-            for j in range(16):
-                new_left.set_bit(to_index(i, j), True)
-                new_right.set_bit(to_index(15 - i, j), True)
+            for j in range(height):
+                new_left |= 1 << to_index(i, j)
+                new_right |= 1 << to_index(stride - 1 - i, j)
 
             cumulative_left |= new_left
             cumulative_right |= new_right
@@ -55,47 +62,47 @@ class MaskHandler:
             self.left_masks[i] = new_left
 
         # Iterate through indices and create the directional masks
-        for x in range(16):
-            for y in range(16):
+        for x in range(stride):
+            for y in range(height):
                 index = to_index(x, y)
 
-                for j in range(y + 1, 16):
+                for j in range(y + 1, height):
                     # set the bits to the north of the current square
-                    self.north[index].set_bit(to_index(x, j), True)
+                    self.north[index] |= 1 << to_index(x, j)
 
                 for j in range(y):
                     # set the bits to the south of the current square
-                    self.south[index].set_bit(to_index(x, j), True)
+                    self.south[index] |= 1 << to_index(x, j)
 
-                for j in range(x + 1, 16):
+                for j in range(x + 1, stride):
                     # set the bits to the east of the current square
-                    self.east[index].set_bit(to_index(j, y), True)
+                    self.east[index] |= 1 << to_index(j, y)
 
                 for j in range(x):
                     # set the bits to the west of the current square
-                    self.west[index].set_bit(to_index(j, y), True)
+                    self.west[index] |= 1 << to_index(j, y)
 
                 x2 = x + 1
                 y2 = y + 1
-                while x2 < 16 and y2 < 16:
+                while x2 < stride and y2 < height:
                     # set the bits to the northeast of the current square
-                    self.northeast[index].set_bit(to_index(x2, y2), True)
+                    self.northeast[index] |= 1 << to_index(x2, y2)
                     x2 += 1
                     y2 += 1
 
                 x2 = x - 1
                 y2 = y + 1
-                while x2 >= 0 and y2 < 16:
+                while x2 >= 0 and y2 < height:
                     # set the bits to the northwest of the current square
-                    self.northwest[index].set_bit(to_index(x2, y2), True)
+                    self.northwest[index] |= 1 << to_index(x2, y2)
                     x2 -= 1
                     y2 += 1
 
                 x2 = x + 1
                 y2 = y - 1
-                while x2 < 16 and y2 >= 0:
+                while x2 < stride and y2 >= 0:
                     # set the bits to the southeast of the current square
-                    self.southeast[index].set_bit(to_index(x2, y2), True)
+                    self.southeast[index] |= 1 << to_index(x2, y2)
                     x2 += 1
                     y2 -= 1
 
@@ -103,7 +110,7 @@ class MaskHandler:
                 y2 = y - 1
                 while x2 >= 0 and y2 >= 0:
                     # set the bits to the southwest of the current square
-                    self.southwest[index].set_bit(to_index(x2, y2), True)
+                    self.southwest[index] |= 1 << to_index(x2, y2)
                     x2 -= 1
                     y2 -= 1
 
@@ -112,18 +119,19 @@ class MaskHandler:
                 self.antidiagonals[index] = self.northwest[index] ^ self.southeast[index]
 
         # Create the main_diagonal mask
-        self.main_diagonal = Bitboard(1) ^ self.northeast[0]
+        self.main_diagonal = 1 ^ self.northeast[0]
 
         # Create the file and rank masks
-        for i in range(16):
-            file = Bitboard.zero()
-            for y in range(16):
-                file.set_bit(to_index(i, y), True)
+        for i in range(stride):
+            file = 0
+            for y in range(height):
+                file |= 1 << to_index(i, y)
             self.files[i] = file
 
-            rank = Bitboard.zero()
-            for x in range(16):
-                rank.set_bit(to_index(x, i), True)
+        for i in range(height):
+            rank = 0
+            for x in range(stride):
+                rank |= 1 << to_index(x, i)
             self.ranks[i] = rank
 
     # Mask getters
@@ -178,13 +186,13 @@ class MaskHandler:
 
     # Shifters
     def shift_north(self, amt, bitboard):
-        return bitboard << (amt * 16)
+        return (bitboard << (amt * self.geometry.stride)) & self.geometry.board_mask
 
     def shift_south(self, amt, bitboard):
-        return bitboard >> (amt * 16)
+        return bitboard >> (amt * self.geometry.stride)
 
     def shift_east(self, amt, bitboard):
-        return (bitboard << amt) & (~self.get_left_mask(amt))
+        return (bitboard << amt) & self.geometry.board_mask & (~self.get_left_mask(amt))
 
     def shift_west(self, amt, bitboard):
         return (bitboard >> amt) & (~self.get_right_mask(amt))
@@ -206,43 +214,92 @@ class MaskHandler:
 
 '''
 The AttackTables class is used to generate the attack tables for each piece.  It holds precomputed
-attack tables for the pieces, assuming a 16x16 size board, only for the standard pieceset.
+attack tables for the pieces on every square of one geometry, only for the standard pieceset.
+
+The tables listed in TABLE_NAMES are the expensive ones, they are loaded from the on disk cache
+(see table_cache.py) when possible and only built by build_tables when the cache is missing or stale.
 '''
 class AttackTables:
-    def __init__(self):
-        self.slider_attacks: List[List[int]] = [[0] * 65536 for _ in range(16)] 
-        self.knight_attacks: List[Bitboard] = [Bitboard.zero() for _ in range(256)]
-        self.king_attacks: List[Bitboard] = [Bitboard.zero() for _ in range(256)]
-        self.north_pawn_attacks: List[Bitboard] = [Bitboard.zero() for _ in range(256)]
-        self.north_pawn_single_push: List[Bitboard] = [Bitboard.zero() for _ in range(256)]
-        self.north_pawn_double_push: List[Bitboard] = [Bitboard.zero() for _ in range(256)]
-        self.south_pawn_attacks: List[Bitboard] = [Bitboard.zero() for _ in range(256)]
-        self.south_pawn_single_push: List[Bitboard] = [Bitboard.zero() for _ in range(256)]
-        self.south_pawn_double_push: List[Bitboard] = [Bitboard.zero() for _ in range(256)]
-        self.masks: MaskHandler = MaskHandler()
-
-        for x in range(16):
-            for y in range(16):
+    TABLE_NAMES = [
+        'slider_attacks', 'knight_attacks', 'king_attacks',
+        'north_pawn_attacks', 'north_pawn_single_push', 'north_pawn_double_push',
+        'south_pawn_attacks', 'south_pawn_single_push', 'south_pawn_double_push',
+    ]
+
+    def __init__(self, geometry: Geometry = GENERIC_GEOMETRY, use_cache: bool = True):
+        self.geometry = geometry
+        num_squares = geometry.num_squares
+        stride = geometry.stride
+        height = geometry.height
+        self.masks: MaskHandler = MaskHandler(geometry)
+
+        # Per square lookups, so the hot paths don't need to divide by the stride
+        self.file_of: List[int] = [index % stride for index in range(num_squares)]
+        self.rank_of: List[int] = [index // stride for index in range(num_squares)]
+        self.rank_shift: List[int] = [stride * (index // stride) for index in range(num_squares)]
+
+        # Constants for gathering lines into slider_attacks indexes, see the note below
+        self.line_mask = (1 << stride) - 1 # a full rank or diagonal line
+        self.file_line_mask = (1 << height) - 1 # a full file line
+        self.top_shift = stride * (height - 1) # index of the first square on the top rank
+        self.last_rank = height - 1
+        self.file_a = sum(1 << (stride * i) for i in range(height)) # every square on the a file
+        self.last_file = self.file_a << (height - 1) # every square on the file the file lines are laid down on
+        self.diagonal = sum(1 << ((stride + 1) * i) for i in range(height)) # the a1 diagonal
+
+        if use_cache and load_cached_tables(self):
+            return
+        self.build_tables()
+        if use_cache:
+            save_cached_tables(self)
+
+    def cache_key(self) -> str:
+        # Names the cache file of these tables, see table_cache.py
+        geometry = self.geometry
+        builder = get_builder_digest(type(self))
+        return f'{type(self).__name__}-{geometry.width}x{geometry.height}-{geometry.stride}-{builder}'
+
+    def build_tables(self):
+        # Builds every table in TABLE_NAMES from scratch
+        geometry = self.geometry
+        num_squares = geometry.num_squares
+        stride = geometry.stride
+        width = stride # the spare files of a geometry are covered too, bounds take care of them
+        height = geometry.height
+        to_index = geometry.to_index
+
+        self.slider_attacks: List[List[int]] = [[] for _ in range(stride)]
+        self.knight_attacks: List[int] = [0] * num_squares
+        self.king_attacks: List[int] = [0] * num_squares
+        self.north_pawn_attacks: List[int] = [0] * num_squares
+        self.north_pawn_single_push: List[int] = [0] * num_squares
+        self.north_pawn_double_push: List[int] = [0] * num_squares
+        self.south_pawn_attacks: List[int] = [0] * num_squares
+        self.south_pawn_single_push: List[int] = [0] * num_squares
+        self.south_pawn_double_push: List[int] = [0] * num_squares
+
+        for x in range(width):
+            for y in range(height):
                 index = to_index(x, y)
-                if y != 15:
-                    self.north_pawn_single_push[index].set_bit(to_index(x, y + 1), True)
-                    self.north_pawn_double_push[index].set_bit(to_index(x, y + 1), True)
-                    if y + 2 < 16:
-                        self.north_pawn_double_push[index].set_bit(to_index(x, y + 2), True)
-                    if x + 1 < 16:
-                        self.north_pawn_attacks[index].set_bit(to_index(x + 1, y + 1), True)
+                if y != height - 1:
+                    self.north_pawn_single_push[index] |= 1 << to_index(x, y + 1)
+                    self.north_pawn_double_push[index] |= 1 << to_index(x, y + 1)
+                    if y + 2 < height:
+                        self.north_pawn_double_push[index] |= 1 << to_index(x, y + 2)
+                    if x + 1 < width:
+                        self.north_pawn_attacks[index] |= 1 << to_index(x + 1, y + 1)
                     if x - 1 >= 0:
-                        self.north_pawn_attacks[index].set_bit(to_index(x - 1, y + 1), True)
+                        self.north_pawn_attacks[index] |= 1 << to_index(x - 1, y + 1)
 
                 if y != 0:
-                    self.south_pawn_single_push[index].set_bit(to_index(x, y - 1), True)
-                    self.south_pawn_double_push[index].set_bit(to_index(x, y - 1), True)
+                    self.south_pawn_single_push[index] |= 1 << to_index(x, y - 1)
+                    self.south_pawn_double_push[index] |= 1 << to_index(x, y - 1)
                     if y - 2 >= 0:
-                        self.south_pawn_double_push[index].set_bit(to_index(x, y - 2), True)
-                    if x + 1 < 16:
-                        self.south_pawn_attacks[index].set_bit(to_index(x + 1, y - 1), True)
+                        self.south_pawn_double_push[index] |= 1 << to_index(x, y - 2)
+                    if x + 1 < width:
+                        self.south_pawn_attacks[index] |= 1 << to_index(x + 1, y - 1)
                     if x - 1 >= 0:
-                        self.south_pawn_attacks[index].set_bit(to_index(x - 1, y - 1), True)
+                        self.south_pawn_attacks[index] |= 1 << to_index(x - 1, y - 1)
 
                 king_deltas = [(0, 1), (0, -1), (-1, 0), (1, 0),
                                (1, 1), (1, -1), (-1, 1), (-1, -1)]
@@ -250,8 +307,8 @@ class AttackTables:
                 for delta in king_deltas:
                     x2 = delta[0] + x
                     y2 = delta[1] + y
-                    if 0 <= x2 < 16 and 0 <= y2 < 16:
-                        self.king_attacks[index].set_bit(to_index(x2, y2), True)
+                    if 0 <= x2 < width and 0 <= y2 < height:
+                        self.king_attacks[index] |= 1 << to_index(x2, y2)
 
                 knight_deltas = [(2, 1), (2, -1), (-2, 1), (-2, -1),
                                  (1, 2), (1, -2), (-1, 2), (-1, -2)]
@@ -259,90 +316,82 @@ class AttackTables:
                 for delta in knight_deltas:
                     x2 = delta[0] + x
                     y2 = delta[1] + y
-                    if 0 <= x2 < 16 and 0 <= y2 < 16:
-                        self.knight_attacks[index].set_bit(to_index(x2, y2), True)
-
-        for i in range(16):
-            for occ in range(65536):
-                sq = 1 << i
-
-                def get_left_attack(src):
-                    return src - 1 if src != 0 else 0
-
-                def get_right_attack(src):
-                    return ~src & ~get_left_attack(src)
-
-                left_attack = get_left_attack(sq)
-                left_blockers = occ & left_attack
-                if left_blockers != 0:
-                    msb_blockers = 1 << (15 - left_blockers.bit_length() + 1)
-                    left_attack ^= get_left_attack(msb_blockers)
-
-                right_attack = get_right_attack(sq)
-                right_blockers = occ & right_attack
-                if right_blockers != 0:
-                    lsb_blockers = 1 << right_blockers.bit_length() - 1
-                    right_attack ^= get_right_attack(lsb_blockers)
+                    if 0 <= x2 < width and 0 <= y2 < height:
+                        self.knight_attacks[index] |= 1 << to_index(x2, y2)
+
+        # slider_attacks[i][occ] holds the attacks of a slider on square i of a stride long line
+        # for a given line occupancy.  The attacks to the right of the slider only depend on
+        # the occupancy above i and the attacks to the left only on the occupancy below i,
+        # so each row is stitched together from two much smaller tables.
+        for i in range(stride):
+            full_right = ((1 << (stride - 1 - i)) - 1) << (i + 1)
+            right = [full_right] + [
+                (((upper & -upper) << 1) - 1) << (i + 1) for upper in range(1, 1 << (stride - 1 - i))
+            ]
+            full_left = (1 << i) - 1
+            left = [full_left] + [
+                full_left & ~((1 << (lower.bit_length() - 1)) - 1) for lower in range(1, 1 << i)
+            ]
+            upper_shift = i + 1
+            self.slider_attacks[i] = [right[occ >> upper_shift] | left[occ & full_left] for occ in range(1 << stride)]
 
-                self.slider_attacks[i][occ] = right_attack ^ left_attack
-
-    def reverse_bits(self, n):
-        n &= 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF
-        return int(format(n, '0256b')[::-1], 2)
-
-    def get_slider_attacks(self, occ, s):
-        # little bit of math involved LOL - 45 mins on this line
-        # exercise for the reader?
-        return ((occ) - 2 * s) ^ self.reverse_bits(self.reverse_bits(occ) - 2 * self.reverse_bits(s))
-    
+    '''
+    Sliding attacks are served from slider_attacks.  Each line through the slider (rank, file,
+    diagonal or anti-diagonal) is gathered into a stride bit occupancy index, looked up, and the
+    resulting line attacks are spread back out onto the board:
+        - ranks are already contiguous, so a shift is enough
+        - diagonals hold one square per file, multiplying by file_a stacks every file onto the
+          top rank, where bit x is the square on file x
+        - files are shifted onto file a and multiplied by diagonal, which sends rank y to bit
+          height - 1 - y of the top rank.  Multiplying the line attacks by diagonal again lays
+          them down file height - 1, from where they are shifted onto the file of the slider.
+    None of the partial products overlap as long as the height of the board is at most the stride,
+    which Geometry guarantees, so no carries can corrupt the gathered bits.
+    '''
     def get_rank_attack(self, loc_index, occ):
-        x, y = from_index(loc_index) # get the x and y coordinates of the square
-        rank_mask = self.masks.get_rank(y) # get the mask for the rank
-        rank_occupied = (occ & rank_mask).value # get the occupied squares on the rank
-        rank_slider = 1 << loc_index # get the slider mask (the square the piece is on)
-        rank_attacks = self.get_slider_attacks(rank_occupied, rank_slider) # get the attacks for the rank
-        return rank_mask & rank_attacks # return the attacks that are on the rank
+        shift = self.rank_shift[loc_index]
+        return self.slider_attacks[self.file_of[loc_index]][(occ >> shift) & self.line_mask] << shift
     
-    # All other sliding functions work similarly
     def get_file_attack(self, loc_index, occ):
-        x, y = from_index(loc_index)
-        file_mask = self.masks.get_file(x)
-        file_occupied = (occ & file_mask).value
-        file_slider = 1 << loc_index
-        file_attacks = Bitboard(self.get_slider_attacks(file_occupied, file_slider))
-        return file_attacks & file_mask
+        x = self.file_of[loc_index]
+        diagonal = self.diagonal
+        line = ((((occ >> x) & self.file_a) * diagonal) >> self.top_shift) & self.file_line_mask
+        attacks = self.slider_attacks[self.last_rank - self.rank_of[loc_index]][line] & self.file_line_mask
+        file = (attacks * diagonal) & self.last_file
+        if x <= self.last_rank:
+            return file >> (self.last_rank - x)
+        return file << (x - self.last_rank)
 
     def get_diagonal_attack(self, loc_index, occ):
-        diag_mask = self.masks.get_diagonal(loc_index)
-        diag_occupied = (occ & diag_mask).value
-        diag_slider = 1 << loc_index
-        diag_attacks = Bitboard(self.get_slider_attacks(diag_occupied, diag_slider))
-        return diag_attacks & diag_mask
+        diag_mask = self.masks.diagonals[loc_index]
+        line = (((occ & diag_mask) * self.file_a) >> self.top_shift) & self.line_mask
+        return (self.slider_attacks[self.file_of[loc_index]][line] * self.file_a) & diag_mask
 
     def get_antidiagonal_attack(self, loc_index, occ):
-        diag_mask = self.masks.get_antidiagonal(loc_index)
-        diag_occupied = (occ & diag_mask).value
-        diag_slider = 1 << loc_index
-        diag_attacks = Bitboard(self.get_slider_attacks(diag_occupied, diag_slider))
-        return diag_attacks & diag_mask
+        diag_mask = self.masks.antidiagonals[loc_index]
+        line = (((occ & diag_mask) * self.file_a) >> self.top_shift) & self.line_mask
+        return (self.slider_attacks[self.file_of[loc_index]][line] * self.file_a) & diag_mask
 
     def get_knight_attack(self, loc_index, _occ, _enemies):
-        return self.knight_attacks[loc_index].copy()
+        return self.knight_attacks[loc_index]
 
     def get_king_attack(self, loc_index, _occ, _enemies):
-        return self.king_attacks[loc_index].copy()
+        return self.king_attacks[loc_index]
 
-    def get_north_pawn_attack(self, loc_index, occ, enemies):
-        x, y = from_index(loc_index)
-        if y == 1 and not occ.bit(to_index(x, y + 1)):
+    def get_north_pawn_attack(self, loc_index, occ, enemies, start_rank=1):
+        # Pawns on start_rank may push two squares
+        if self.rank_of[loc_index] == start_rank and not (occ >> (loc_index + self.geometry.stride)) & 1:
             return_bb = self.north_pawn_double_push[loc_index] & ~occ
         else:
             return_bb = self.north_pawn_single_push[loc_index] & ~occ
         return return_bb ^ (self.north_pawn_attacks[loc_index] & enemies)
 
-    def get_south_pawn_attack(self, loc_index, occ, enemies):
-        x, y = from_index(loc_index)
-        if y == 6 and not occ.bit(to_index(x, y - 1)):
+    def get_south_pawn_attack(self, loc_index, occ, enemies, start_rank=None):
+        # Pawns on start_rank may push two squares, the second rank from the top of the geometry by default.
+        # Boards smaller than their geometry have to pass their own start rank.
+        if start_rank is None:
+            start_rank = self.last_rank - 1
+        if self.rank_of[loc_index] == start_rank and not (occ >> (loc_index - self.geometry.stride)) & 1:
             return_bb = self.south_pawn_double_push[loc_index] & ~occ
         else:
             return_bb = self.south_pawn_single_push[loc_index] & ~occ
@@ -362,40 +411,67 @@ class AttackTables:
 
     def get_sliding_moves_bb(self, loc_index, occ, enemies, north, east, south, west, northeast, northwest, southeast, southwest):
         # Get the raw attacks for each direction and combines them into one bitboard of attacks
-        raw_attacks = Bitboard.zero()
-
-        def process_direction(get_attack_func, get_mask_func, direction_flag):
-            nonlocal raw_attacks
-            if direction_flag:
-                attacks = get_attack_func(loc_index, occ)
-                raw_attacks |= attacks & get_mask_func(loc_index)
-
-        process_direction(self.get_file_attack, self.masks.get_north, north)
-        process_direction(self.get_file_attack, self.masks.get_south, south)
-        process_direction(self.get_rank_attack, self.masks.get_east, east)
-        process_direction(self.get_rank_attack, self.masks.get_west, west)
-        process_direction(self.get_diagonal_attack, self.masks.get_northeast, northeast)
-        process_direction(self.get_diagonal_attack, self.masks.get_southwest, southwest)
-        process_direction(self.get_antidiagonal_attack, self.masks.get_northwest, northwest)
-        process_direction(self.get_antidiagonal_attack, self.masks.get_southeast, southeast)
+        masks = self.masks
+        raw_attacks = 0
+        if north or south:
+            attacks = self.get_file_attack(loc_index, occ)
+            if north:
+                raw_attacks |= attacks & masks.north[loc_index]
+            if south:
+                raw_attacks |= attacks & masks.south[loc_index]
+        if east or west:
+            attacks = self.get_rank_attack(loc_index, occ)
+            if east:
+                raw_attacks |= attacks & masks.east[loc_index]
+            if west:
+                raw_attacks |= attacks & masks.west[loc_index]
+        if northeast or southwest:
+            attacks = self.get_diagonal_attack(loc_index, occ)
+            if northeast:
+                raw_attacks |= attacks & masks.northeast[loc_index]
+            if southwest:
+                raw_attacks |= attacks & masks.southwest[loc_index]
+        if northwest or southeast:
+            attacks = self.get_antidiagonal_attack(loc_index, occ)
+            if northwest:
+                raw_attacks |= attacks & masks.northwest[loc_index]
+            if southeast:
+                raw_attacks |= attacks & masks.southeast[loc_index]
 
         return raw_attacks & ~occ
 
     def get_rook_attack(self, loc_index, occ, _enemies):
-        return self.get_file_attack(loc_index, occ) ^ self.get_rank_attack(loc_index, occ)
+        slider_attacks = self.slider_attacks
+        x = self.file_of[loc_index]
+        shift = self.rank_shift[loc_index]
+        last_rank = self.last_rank
+        diagonal = self.diagonal
+        rank = slider_attacks[x][(occ >> shift) & self.line_mask] << shift
+        line = ((((occ >> x) & self.file_a) * diagonal) >> self.top_shift) & self.file_line_mask
+        attacks = slider_attacks[last_rank - self.rank_of[loc_index]][line] & self.file_line_mask
+        file = (attacks * diagonal) & self.last_file
+        if x <= last_rank:
+            return rank | (file >> (last_rank - x))
+        return rank | (file << (x - last_rank))
 
     def get_bishop_attack(self, loc_index, occ, _enemies):
-        return self.get_diagonal_attack(loc_index, occ) ^ self.get_antidiagonal_attack(loc_index, occ)
+        row = self.slider_attacks[self.file_of[loc_index]]
+        file_a = self.file_a
+        top_shift = self.top_shift
+        line_mask = self.line_mask
+        diag_mask = self.masks.diagonals[loc_index]
+        anti_mask = self.masks.antidiagonals[loc_index]
+        diag = (row[(((occ & diag_mask) * file_a) >> top_shift) & line_mask] * file_a) & diag_mask
+        anti = (row[(((occ & anti_mask) * file_a) >> top_shift) & line_mask] * file_a) & anti_mask
+        return diag | anti
 
     def get_queen_attack(self, loc_index, occ, enemies):
-
-        return self.get_rook_attack(loc_index, occ, enemies) ^ self.get_bishop_attack(loc_index, occ, enemies)
+        return self.get_rook_attack(loc_index, occ, enemies) | self.get_bishop_attack(loc_index, occ, enemies)
     
 
 # testing
     
 if __name__ == '__main__':
-    from move_generator import *
     from bitboard import *
 
     at = AttackTables()
@@ -434,7 +510,8 @@ if __name__ == '__main__':
     '''
     print(occupancy)
 
-    print("rank_possibilities\n", at.get_rank_attack(loc_occ, occupancy))
-    print("file_possibilities\n", at.get_file_attack(loc_occ, occupancy))
-    print('diag_possibilities\n', at.get_diagonal_attack(loc_occ, occupancy))
-    print('anti_diag_possibilities\n', at.get_antidiagonal_attack(loc_occ, occupancy))
\ No newline at end of file
+    occ = occupancy.value
+    print("rank_possibilities\n", Bitboard(at.get_rank_attack(loc_occ, occ)))
+    print("file_possibilities\n", Bitboard(at.get_file_attack(loc_occ, occ)))
+    print('diag_possibilities\n', Bitboard(at.get_diagonal_attack(loc_occ, occ)))
+    print('anti_diag_possibilities\n', Bitboard(at.get_antidiagonal_attack(loc_occ, occ)))
@@ -52,7 +52,7 @@ For example, here are the indexes for an 8x8 board:
 class Bitboard:
 
     def __init__(self, value=0):
-        self.value = value & 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF
+        self.value = value & BB_MASK
     
     def set_coord(self, x, y):
         if not (0 <= x < 16 and 0 <= y < 16):
@@ -108,7 +108,7 @@ class Bitboard:
         return (self.value & -self.value).bit_length() - 1
     
     def count_ones(self):
-        return bin(self.value).count('1')
+        return self.value.bit_count()
     
     def reverse_bits(self):
         return Bitboard(int(format(self.value, '0256b')[::-1], 2))
@@ -120,7 +120,7 @@ class Bitboard:
         return Bitboard(self.value)
     
     def fill(self):
-        self.value = 0xFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF
+        self.value = BB_MASK
     
     def byte(self, index):
         return (self.value >> (8 * index)) & 0xFF
@@ -136,11 +136,17 @@ class Bitboard:
     def __repr__(self):
         return f'Bitboard(value={bin(self.value)})'
     
+    def __int__(self):
+        return self.value
+
     def __eq__(self, other):
-        return self.value == other.value
+        return self.value == bb_value(other)
     
     def __ne__(self, other):
-        return self.value != other.value
+        return self.value != bb_value(other)
+
+    def __hash__(self):
+        return hash(self.value)
     
     def __and__(self, other):
         if isinstance(other, int):
@@ -148,6 +154,8 @@ class Bitboard:
         return Bitboard(self.value & other.value)
     
     def __or__(self, other):
+        if isinstance(other, int):
+            return Bitboard(self.value | other)
         return Bitboard(self.value | other.value)
     
     def __xor__(self, other):
@@ -184,6 +192,40 @@ class Bitboard:
         # Be careful with this one, it's not a bitwise negation
         return Bitboard(-self.value)
 
+'''
+Inside the engine, bitboards are plain python ints.  Every operator on a Bitboard object allocates
+a new object, and the move generator chains dozens of those per node, so the hot paths (attack tables,
+move generation, make/unmake and evaluation) work on raw ints with the helper functions below.
+The Bitboard class is kept as a thin facade for the GUI and the external API, use bb_value to
+unwrap whatever is handed in at that boundary.
+'''
+
+BB_MASK = (1 << 256) - 1 # all 256 squares set
+
+def bb_value(bb):
+    # Returns the raw int behind a Bitboard (or the int itself)
+    if isinstance(bb, Bitboard):
+        return bb.value
+    return bb & BB_MASK
+
+def bit(bb, index):
+    # Returns 1 if the bit at index is set, 0 otherwise
+    return (bb >> index) & 1
+
+def lowest_one(bb):
+    # Returns the index of the lowest 1 bit, or -1 for an empty board
+    return (bb & -bb).bit_length() - 1
+
+def count_ones(bb):
+    return bb.bit_count()
+
+def iter_ones(bb):
+    # Yields the index of each set bit, from lowest to highest
+    while bb:
+        lsb = bb & -bb
+        yield lsb.bit_length() - 1
+        bb ^= lsb
+
 def to_rank_file(x, y):
     return_string = ""
     return_string += chr(x + 65)
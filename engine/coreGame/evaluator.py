@@ -1,9 +1,10 @@
-from typing import Dict, List 
+from typing import Dict, List, Optional, Tuple
 from .position import Position
 from .move_generator import MoveGenerator
-from .move import Move, PieceType
+from .move import (PieceType, is_capture, FROM_TO_MASK, PIECE_IDS, NUM_PIECE_IDS, KING_ID, QUEEN_ID, ROOK_ID,
+                   BISHOP_ID, KNIGHT_ID, PAWN_ID)
 from .piece_set import PieceSet
-from .bitboard import Bitboard, from_index
+from .geometry import Geometry
 
 
 # Relative Centipawn Values provided by alpha zero in 2020
@@ -28,8 +29,13 @@ There are some conceptual notes that are obvious that aren't accounted for.  For
 
 class Evaluator:
     def __init__(self):
-        self.custom_piece_value_table: Dict[PieceType, int] = {}
-        self.piece_square_table: Dict[PieceType, List[int]] = {}
+        # the value of every piece id, custom pieces are valued from their movement pattern when first seen
+        self.piece_values: List[Optional[int]] = [None] * NUM_PIECE_IDS
+        for piece_id, value in ((KING_ID, KING_SCORE), (QUEEN_ID, QUEEN_SCORE), (ROOK_ID, ROOK_SCORE),
+                                (BISHOP_ID, BISHOP_SCORE), (KNIGHT_ID, KNIGHT_SCORE), (PAWN_ID, PAWN_SCORE)):
+            self.piece_values[piece_id] = value
+        # the positional scores of every piece id, per geometry
+        self.piece_square_table: Dict[Geometry, List[Optional[List[int]]]] = {}
 
     def evaluate(self, position: Position, movegen: MoveGenerator) -> int:
         # sums the material and positional scores for each piece
@@ -55,58 +61,39 @@ class Evaluator:
 
     def get_material_score_for_pieceset(self, position: Position, piece_set: PieceSet) -> int:
         # sums the material score
+        piece_values = self.piece_values
         material_score = 0
-        material_score += piece_set.king.bitboard.count_ones() * KING_SCORE
-        material_score += piece_set.queen.bitboard.count_ones() * QUEEN_SCORE
-        material_score += piece_set.rook.bitboard.count_ones() * ROOK_SCORE
-        material_score += piece_set.knight.bitboard.count_ones() * KNIGHT_SCORE
-        material_score += piece_set.bishop.bitboard.count_ones() * BISHOP_SCORE
-        material_score += piece_set.pawn.bitboard.count_ones() * PAWN_SCORE
-
-        for custom in piece_set.custom:
-            if custom.piece_type in self.custom_piece_value_table:
-                score = self.custom_piece_value_table[custom.piece_type]
-                material_score += custom.bitboard.count_ones() * score
-            else:
-                option_mp = position.get_movement_pattern(custom.piece_type)
-                score = Evaluator.score_movement_pattern(option_mp) if option_mp else 0
-                self.custom_piece_value_table[custom.piece_type] = score
-                material_score += custom.bitboard.count_ones() * score
-
+        for piece in piece_set.get_piece_refs():
+            value = piece_values[piece.piece_id]
+            if value is None:
+                value = self.get_piece_value(piece.piece_id, position)
+            material_score += len(piece.squares) * value
         return material_score
 
-    def score_move(self, depth: int, history_moves: List[List[int]], killer_moves: List[List[Move]], position: Position, move_: Move) -> int:
+    def score_move(self, depth: int, history_moves: List[int], killer_moves: List[List[int]], position: Position, move_: int) -> int:
         # scores a move based on the history and killer moves, used to rank and prioritize moves to improve
         # The efficiency of the alpha-beta pruning process
-        if not move_.get_is_capture():
-            return 9000 if move_ == killer_moves[depth][0] or move_ == killer_moves[depth][1] else history_moves[move_.get_from()][move_.get_to()]
+        if not is_capture(move_):
+            return 9000 if move_ == killer_moves[depth][0] or move_ == killer_moves[depth][1] else history_moves[move_ & FROM_TO_MASK]
 
-        attacker: PieceType = position.piece_at(move_.get_from())[1].piece_type
-        victim: PieceType = position.piece_at(move_.get_target())[1].piece_type
+        attacker = position.mailbox[move_ & 255][1].piece_id
+        victim = position.mailbox[(move_ >> 16) & 255][1].piece_id
 
-        attack_score = self.get_material_score(attacker, position)
-        victim_score = self.get_material_score(victim, position)
+        attack_score = self.get_piece_value(attacker, position)
+        victim_score = self.get_piece_value(victim, position)
 
         return KING_SCORE + (victim_score - attack_score)
 
     def get_material_score(self, piece_type: PieceType, position: Position) -> int:
-        if piece_type.is_custom():
-            if piece_type in self.custom_piece_value_table:
-                return self.custom_piece_value_table[piece_type]
-            else:
-                option_mp = position.get_movement_pattern(piece_type)
-                score = Evaluator.score_movement_pattern(option_mp) if option_mp else 0
-                self.custom_piece_value_table[piece_type] = score
-                return score
-        else:
-            return {
-                PieceType.Pawn: PAWN_SCORE,
-                PieceType.Knight: KNIGHT_SCORE,
-                PieceType.Bishop: BISHOP_SCORE,
-                PieceType.Rook: ROOK_SCORE,
-                PieceType.Queen: QUEEN_SCORE,
-                PieceType.King: KING_SCORE,
-            }[piece_type]
+        return self.get_piece_value(PIECE_IDS[piece_type], position)
+
+    def get_piece_value(self, piece_id: int, position: Position) -> int:
+        value = self.piece_values[piece_id]
+        if value is None:
+            option_mp = position.movement_table[piece_id]
+            value = Evaluator.score_movement_pattern(option_mp) if option_mp else 0
+            self.piece_values[piece_id] = value
+        return value
 
     def can_do_null_move(self, position: Position) -> bool:
         return self.get_material_score_for_pieceset(position, position.pieces[position.whos_turn]) > KING_SCORE + ROOK_SCORE
@@ -160,31 +147,33 @@ class Evaluator:
         # Returns the positional score of a piece set
         score = 0
 
+        # square indexes depend on the geometry, so the tables are kept per geometry
+        score_tables = self.piece_square_table.get(position.geometry)
+        if score_tables is None:
+            score_tables = self.piece_square_table[position.geometry] = [None] * NUM_PIECE_IDS
+
         for p in piece_set.get_piece_refs():
-            if p.piece_type not in self.piece_square_table:
-                score_vec = Evaluator.get_positional_score_vec(position, p, movegen)
-                self.piece_square_table[p.piece_type] = score_vec
-
-            bb_copy = p.bitboard.copy()
-            score_table = self.piece_square_table[p.piece_type]
-            while not bb_copy.is_zero():
-                index = bb_copy.lowest_one()
-                if p.piece_type == PieceType.King:
-                    score += -score_table[index] * PST_MULTIPLIER if not is_endgame else score_table[index] * PST_MULTIPLIER
-                else:
-                    score += score_table[index] * PST_MULTIPLIER
-                bb_copy.set_bit(index, False)
+            score_table = score_tables[p.piece_id]
+            if score_table is None:
+                score_table = score_tables[p.piece_id] = Evaluator.get_positional_score_vec(position, p, movegen)
+            table_score = 0
+            for index in p.squares:
+                table_score += score_table[index]
+            if p.piece_id == KING_ID and not is_endgame:
+                table_score = -table_score
+            score += table_score * PST_MULTIPLIER
 
         return score
 
     @staticmethod
     def get_positional_score_vec(position: Position, piece: PieceSet, movegen: MoveGenerator) -> List[int]:
         # Returns a vector of positional scores for each square on the board
-        return_vec = [0] * 256
+        num_squares = position.geometry.num_squares
+        return_vec = [0] * num_squares
         total_entries = 0
         sum_ = 0
-        for i in range(256):
-            x, y = from_index(i)
+        for i in range(num_squares):
+            x, y = position.geometry.from_index(i)
             num_moves = movegen.get_num_moves_on_empty_board(i, position, piece, position.bounds)
             if position.xy_in_bounds(x, y):
                 total_entries += 1
@@ -0,0 +1,75 @@
+import os
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+from .movement_pattern import MovementPatternExternal
+from .position import Position, parse_fen_board
+
+'''
+Streaming loaders for FEN and EPD files, for test suites and training sets with millions of positions.
+
+Lines are read one at a time and every position is handed out as soon as it is parsed, so a file of any
+size loads in constant memory.  All the positions share the tables of shared_tables.py: standard chess
+positions are read as variant 0, and for custom boards the first position of every board shape registers
+a variant whose compiled movement patterns are shared by the positions that follow.
+
+A line is a FEN (or the extended FEN of parse_fen_board), or an EPD: the first four FEN fields followed
+by operations such as 'bm Nf3; id "test 1";'.  Empty lines and lines starting with '#' are skipped.
+'''
+
+Source = Union[str, os.PathLike, Iterable[str]]
+
+
+def iter_lines(source: Source) -> Iterator[str]:
+    # Yields the stripped lines of a file path or an iterable of strings, leaving out empty lines and comments
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'r') as f:
+            yield from iter_lines(f)
+        return
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+def split_epd(line: str) -> Tuple[str, Dict[str, str]]:
+    # Splits a FEN or EPD line into its FEN and its EPD operations (opcode to operands, quotes removed)
+    fields = line.split(None, 4)
+    fen = ' '.join(fields[:4])
+    rest = fields[4] if len(fields) > 4 else ''
+    # a full FEN has the halfmove clock and the move number where an EPD starts its operations
+    clocks = rest.split(None, 2)
+    if len(clocks) >= 2 and clocks[0].isdigit() and clocks[1].isdigit():
+        fen = f"{fen} {clocks[0]} {clocks[1]}"
+        rest = clocks[2] if len(clocks) > 2 else ''
+    operations = {}
+    for operation in rest.split(';'):
+        operation = operation.strip()
+        if operation:
+            opcode, _, operands = operation.partition(' ')
+            operations[opcode] = operands.strip().strip('"')
+    return fen, operations
+
+
+def iter_epd(source: Source) -> Iterator[Tuple[str, Dict[str, str]]]:
+    # Yields the FEN and the operations of every line of a FEN or EPD source
+    for line in iter_lines(source):
+        yield split_epd(line)
+
+
+def load_positions(source: Source, movement_patterns: Optional[Dict[str, MovementPatternExternal]] = None,
+                   snapshots: bool = False) -> Iterator[Union[Position, bytes]]:
+    # Yields a Position for every line of a FEN or EPD source, or its snapshot (see Position.to_bytes)
+    # when snapshots is set.  movement_patterns are the custom pieces of the extended FENs, see Position.from_fen.
+    variant_ids: Dict[Tuple[int, int, Tuple[Tuple[int, int], ...]], int] = {}
+    for fen, _ in iter_epd(source):
+        if movement_patterns:
+            width, height, _, holes = parse_fen_board(fen.split(None, 1)[0])
+            shape = (width, height, tuple(holes))
+            variant_id = variant_ids.get(shape)
+            if variant_id is None:
+                position = Position.from_fen(fen, movement_patterns)
+                variant_ids[shape] = position.get_variant_id()
+            else:
+                position = Position.from_fen(fen, variant_id=variant_id)
+        else:
+            position = Position.from_fen(fen)
+        yield position.to_bytes() if snapshots else position
@@ -0,0 +1,79 @@
+from typing import Dict, Optional, Tuple
+from .bitboard import iter_ones
+
+'''
+A Geometry describes how the squares of a board are laid out in the bits of a bitboard.  Square (x, y)
+lives at bit stride * y + x, so the stride is the distance between two vertically adjacent squares.
+
+Boards are compiled into the smallest layout that still fits them, see Geometry.compile.  A 6x6 board
+uses 36 bit bitboards and 36 entry tables, plain 8x8 chess uses the 64 bit STANDARD_GEOMETRY (which
+also gets magic bitboards, see standard_attack_tables.py), and the GENERIC_GEOMETRY is the 16x16 index
+space described in bitboard.py.  The generic layout is also what the external API speaks: bounds and
+piece indexes handed to Position.custom and Position.set_bounds are built with the module level
+to_index, and are converted to the compiled geometry of the position.
+
+The stride is never smaller than the height of the board.  The attack tables gather files and
+diagonals into a single line with a multiplication, and that is only free of carries while every
+rank index fits in a stride.  Squares in the bounding box that are not part of the board (holes,
+or the spare files of a tall board) are simply out of bounds, just like in the generic layout.
+
+Positions carry their geometry around, so anything that converts between coordinates and indexes
+should go through position.geometry rather than the module level to_index/from_index helpers.
+'''
+class Geometry:
+    def __init__(self, width: int, height: int, stride: Optional[int] = None):
+        self.width = width # number of files that can be addressed
+        self.height = height # number of ranks that can be addressed
+        self.stride = stride if stride is not None else max(width, height) # index distance between two ranks
+        self.num_squares = self.stride * height
+        self.board_mask = (1 << self.num_squares) - 1 # every index of the layout
+
+    @classmethod
+    def compile(cls, width: int, height: int) -> 'Geometry':
+        # Returns the geometry for a width x height board.  Geometries are cached, so every
+        # position of a variant shares the same object, and with it the same attack tables.
+        if not (0 < width <= 16 and 0 < height <= 16):
+            raise ValueError(f"Boards must fit in 16x16, got {width}x{height}")
+        geometry = COMPILED_GEOMETRIES.get((width, height))
+        if geometry is None:
+            geometry = cls(width, height)
+            COMPILED_GEOMETRIES[(width, height)] = geometry
+        return geometry
+
+    def to_index(self, x: int, y: int) -> int:
+        return self.stride * y + x
+
+    def from_index(self, index: int) -> Tuple[int, int]:
+        return index % self.stride, index // self.stride
+
+    def __repr__(self):
+        return f"Geometry({self.width}x{self.height}, stride={self.stride})"
+
+
+GENERIC_GEOMETRY = Geometry(16, 16)
+STANDARD_GEOMETRY = Geometry(8, 8)
+STANDARD_BOUNDS = STANDARD_GEOMETRY.board_mask # every square of the standard geometry
+
+COMPILED_GEOMETRIES: Dict[Tuple[int, int], Geometry] = {
+    (16, 16): GENERIC_GEOMETRY,
+    (8, 8): STANDARD_GEOMETRY,
+}
+
+
+def convert_bitboard(bitboard: int, source: Geometry, dest: Geometry) -> int:
+    # Moves every set square of a bitboard from one geometry to another,
+    # squares that don't exist in the destination geometry are dropped
+    if source is dest:
+        return bitboard
+    converted = 0
+    for index in iter_ones(bitboard):
+        x, y = source.from_index(index)
+        if x < dest.width and y < dest.height:
+            converted |= 1 << dest.to_index(x, y)
+    return converted
+
+
+def convert_index(index: int, source: Geometry, dest: Geometry) -> int:
+    # Converts a single square index from one geometry to another
+    x, y = source.from_index(index)
+    return dest.to_index(x, y)
@@ -2,27 +2,72 @@ from .bitboard import *
 from .constants import *
 from enum import Enum
 
+# Move types, stored in bits 24-26 of a move
+MOVE_QUIET = 0
+MOVE_CAPTURE = 1
+MOVE_QUEENSIDE_CASTLE = 2
+MOVE_KINGSIDE_CASTLE = 3
+MOVE_PROMOTION = 4
+MOVE_PROMOTION_CAPTURE = 5
+MOVE_NULL = 6
+
 MoveType = {
-    'Quiet': 0,
-    'Capture': 1,
-    'QueensideCastle': 2,
-    'KingsideCastle': 3,
-    'Promotion': 4,
-    'PromotionCapture': 5,
-    'Null': 6,
+    'Quiet': MOVE_QUIET,
+    'Capture': MOVE_CAPTURE,
+    'QueensideCastle': MOVE_QUEENSIDE_CASTLE,
+    'KingsideCastle': MOVE_KINGSIDE_CASTLE,
+    'Promotion': MOVE_PROMOTION,
+    'PromotionCapture': MOVE_PROMOTION_CAPTURE,
+    'Null': MOVE_NULL,
 }
 
-# MoveTypeReversed = {
-#     0: 'Quiet',
-#     1: 'Capture',
-#     2: 'QueensideCastle',
-#     3: 'KingsideCastle',
-#     4: 'Promotion',
-#     5: 'PromotionCapture',
-#     6: 'Null',
-# }
-
-class Move:
+MOVE_TYPE_SHIFT = 24
+PROMO_SHIFT = 27
+SQUARE_MASK = 255
+FROM_TO_MASK = 0xFFFF # the from and to squares, used to index the history table
+CAPTURE_TYPES = (1 << MOVE_CAPTURE) | (1 << MOVE_PROMOTION_CAPTURE) # bit set of the move types that capture
+PROMOTION_TYPES = (1 << MOVE_PROMOTION) | (1 << MOVE_PROMOTION_CAPTURE)
+
+# Promotion pieces are stored as their index in PROMOTION_CHARS, 0 means no promotion
+PROMOTION_CHARS = (None, 'q', 'r', 'b', 'n', 'k', 'p', 'a', 'c', 'd', 'e', 'f', 'g')
+PROMOTION_CODES = {char: code for code, char in enumerate(PROMOTION_CHARS) if char is not None}
+
+NULL_MOVE = MOVE_NULL << MOVE_TYPE_SHIFT
+
+'''
+Inside the engine, moves are plain python ints laid out as described in the Move docstring, so
+comparing, hashing and storing them (killer moves, history tables, the transposition table) is a
+single integer operation.  The hot paths build and read them with the helpers below, and the Move
+class is only kept as a thin facade for the GUI, the external API and the tests.
+'''
+
+def new_move(from_index, to_index, target_loc=0, move_type=MOVE_QUIET, promo=0):
+    # Packs a move into an int, promo is a code from PROMOTION_CODES
+    return from_index | (to_index << 8) | (target_loc << 16) | (move_type << MOVE_TYPE_SHIFT) | (promo << PROMO_SHIFT)
+
+def move_from(move_):
+    return move_ & SQUARE_MASK
+
+def move_to(move_):
+    return (move_ >> 8) & SQUARE_MASK
+
+def move_target(move_):
+    return (move_ >> 16) & SQUARE_MASK
+
+def move_type(move_):
+    return (move_ >> MOVE_TYPE_SHIFT) & 7
+
+def move_promo(move_):
+    # Returns the promotion character of a move, None if it doesn't promote
+    return PROMOTION_CHARS[move_ >> PROMO_SHIFT]
+
+def is_capture(move_):
+    return (CAPTURE_TYPES >> ((move_ >> MOVE_TYPE_SHIFT) & 7)) & 1
+
+def is_promotion(move_):
+    return (PROMOTION_TYPES >> ((move_ >> MOVE_TYPE_SHIFT) & 7)) & 1
+
+class Move(int):
     '''
     Stores the move data in a single 32 bit integer
     0-7: from square
@@ -30,56 +75,57 @@ class Move:
     16-23: target square
     24-26: move type
     27-31: promotion piece type
+    A Move is an int, so it can be handed to anything in the engine, which returns plain ints.
     '''
-    def __init__(self, value, promo=None):
-        self.value = value
-        self.promo = promo
-    
     @classmethod
-    def new(cls, from_index, to_index, target_loc=None, move_type='Quiet', promo=None):
-        value = (
-            from_index |
-            (to_index << 8) |
-            (target_loc << 16 if target_loc is not None else 0) |
-            (MoveType[move_type] << 24)
-        )
-        return cls(value, promo)
-    
+    def new(cls, from_index, to_index, target_loc=None, move_type=MOVE_QUIET, promo=None):
+        # Move types can be given as MOVE_* constants or by their MoveType name
+        if isinstance(move_type, str):
+            move_type = MoveType[move_type]
+        return cls(new_move(
+            from_index,
+            to_index,
+            target_loc if target_loc is not None else 0,
+            move_type,
+            PROMOTION_CODES[promo] if promo is not None else 0,
+        ))
+
     @classmethod
     def null(cls):
-        return cls.new(0, 0, None, 'Null', None)
-    
+        return cls(NULL_MOVE)
+
     def get_from(self):
-        return self.value & 255
-    
+        return self & SQUARE_MASK
+
     def get_to(self):
-        return (self.value >> 8) & 255
-    
+        return (self >> 8) & SQUARE_MASK
+
     def get_is_capture(self):
-        return ((self.value >> 24) & 1) != 0
-    
+        return is_capture(self) != 0
+
     def get_move_type(self):
-        move_type_value = (self.value >> 24) & 7
-        for move_type, value in MoveType.items():
-            if value == move_type_value:
-                return move_type
-        return 'Quiet'
-    
+        return move_type(self)
+
     def get_promotion_char(self):
-        return self.promo
-    
+        return move_promo(self)
+
     def get_target(self):
-        return (self.value >> 16) & 255
-    
-    def __str__(self):
-        x1, y1 = from_index(self.get_from())
-        x2, y2 = from_index(self.get_to())
+        return (self >> 16) & SQUARE_MASK
+
+    def to_string(self, geometry=None) -> str:
+        # Describes the move with the squares of a geometry (see geometry.py), positions keep theirs in
+        # position.geometry.  Without one the squares are read in the generic 16x16 layout.
+        to_xy = geometry.from_index if geometry is not None else from_index
+        x1, y1 = to_xy(self.get_from())
+        x2, y2 = to_xy(self.get_to())
         return f"(from: {to_rank_file(x1, y1)}, to:{to_rank_file(x2, y2)})"
-    
-    def __eq__(self, other):
-        if isinstance(other, Move):
-            return self.value == other.value and self.promo == other.promo
-        return False
+
+    def __str__(self):
+        # The squares are read in the generic 16x16 layout, use to_string for a move of a position
+        return self.to_string()
+
+    def __repr__(self):
+        return f"Move({int(self)})"
 
 class PieceType(Enum):
     '''
@@ -107,7 +153,30 @@ class PieceType(Enum):
             return c
     
     def is_custom(self):
-        return self in [PieceType.Custom1, PieceType.Custom2, PieceType.Custom3, PieceType.Custom4, PieceType.Custom5, PieceType.Custom6]
+        return PIECE_IDS[self] >= FIRST_CUSTOM_ID
+
+'''
+Inside the engine every piece type is known by a small integer id, its index in PIECE_TYPES.  The
+standard pieces always have the first six ids and the custom pieces get the following ones in the
+order they are registered with a position (Custom1 first), so per piece data (the pieces of a
+PieceSet, zobrist keys, material values, piece square tables and movement patterns) is kept in
+lists indexed by the id, or by [owner][piece id], instead of dicts keyed on the enum.
+'''
+KING_ID = 0
+QUEEN_ID = 1
+ROOK_ID = 2
+BISHOP_ID = 3
+KNIGHT_ID = 4
+PAWN_ID = 5
+FIRST_CUSTOM_ID = 6
+
+PIECE_TYPES = (PieceType.King, PieceType.Queen, PieceType.Rook, PieceType.Bishop, PieceType.Knight, PieceType.Pawn,
+               PieceType.Custom1, PieceType.Custom2, PieceType.Custom3, PieceType.Custom4, PieceType.Custom5, PieceType.Custom6)
+CUSTOM_PIECE_TYPES = PIECE_TYPES[FIRST_CUSTOM_ID:]
+NUM_PIECE_IDS = len(PIECE_TYPES)
+PIECE_IDS = {piece_type: piece_id for piece_id, piece_type in enumerate(PIECE_TYPES)}
+# the piece id of every promotion code, see PROMOTION_CHARS
+PROMOTION_PIECE_IDS = tuple(None if c is None else PIECE_IDS[PieceType(c)] for c in PROMOTION_CHARS)
 
 class Dimensions:
     '''
@@ -1,160 +1,340 @@
-from .bitboard import Bitboard
-from .move import Move, MoveType, PieceType
+from .move import (PieceType, ROOK_ID, new_move, is_capture, move_target, NULL_MOVE, PROMOTION_CODES, MOVE_TYPE_SHIFT, PROMO_SHIFT, CAPTURE_TYPES,
+                   MOVE_QUIET, MOVE_CAPTURE, MOVE_NULL, MOVE_PROMOTION, MOVE_PROMOTION_CAPTURE, MOVE_KINGSIDE_CASTLE, MOVE_QUEENSIDE_CASTLE)
 from .attack_tables import AttackTables, MaskHandler
-from .bitboard import Bitboard, from_index, to_index
+from .shared_tables import get_shared_attack_tables
+from .bitboard import Bitboard, iter_ones
 from .position import Position
 from .piece import Piece
+from .movement_pattern import MovementPattern
 
+from array import array
 from itertools import chain
-from typing import Optional, List, Tuple, Iterator
-
-# Iterator that converts a Bitboard of move possibilities to Move objects
-class BitboardMoves:
-    def __init__(self, enemies: Bitboard, moves: Bitboard, source_index: int,
-                 promotion_squares: Optional[Bitboard], promo_vals: Optional[List[str]]):
-        self.enemies = enemies # Bitboard of enemy pieces
-        self.moves = moves # Bitboard of possible move destinations
-        self.source_index = source_index # Index of the piece making the moves
-        self.promotion_squares = promotion_squares # Bitboard of promotion squares
-        self.promo_vals = promo_vals # List of promotion values
-        self.current_promo_vals: Optional[List[str]] = None
-
-    def __iter__(self):
-        return self
-
-    def __next__(self) -> Move:
-        if (to := self.moves.lowest_one()) >= 0:
-            promo_here = self.promotion_squares.bit(to) if self.promotion_squares else False
-            capture_here = self.enemies.bit(to)
-
-            move_type = {
-                (True, True): "PromotionCapture",
-                (True, False): "Capture",
-                (False, True): "Promotion",
-                (False, False): "Quiet",
-            }[(capture_here, promo_here)]
-
-            target = to if capture_here else 0
-
-            if promo_here:
-                if self.current_promo_vals:
-                    promo_options = self.current_promo_vals
-                else:
-                    self.current_promo_vals = self.promo_vals.copy() if self.promo_vals else None
-                    promo_options = self.current_promo_vals
-
-                next_char = promo_options.pop()
-
-                if len(promo_options) == 0:
-                    self.current_promo_vals = None
-                    self.moves.set_bit(to, False)
-
-                promo_char = next_char
+from typing import Optional, List, Tuple
+
+'''
+Moves are generated into move buffers, arrays of 32 bit move ints (see move.py) that the caller owns
+and reuses.  Every generate_* method writes its moves into the buffer starting at n and returns the new
+number of moves, so a search can keep one buffer per ply and generate a node without allocating
+anything per move.  Buffers grow when a position has more moves than they fit, which only happens on
+large boards full of custom pieces.
+
+The get_* methods return the moves as a list, for the GUI, perft and the tests.
+
+The kinds argument of the generators picks which moves are written, GEN_CAPTURES (every move with
+is_capture, en passant included), GEN_QUIETS (everything else, castling and quiet promotions included)
+or both, so the staged move picker of the searcher only generates the quiet moves when it needs them.
+'''
+
+MAX_MOVES = 256 # initial size of a move buffer
+GEN_CAPTURES = 1
+GEN_QUIETS = 2
+GEN_ALL = GEN_CAPTURES | GEN_QUIETS
+CAPTURE_SQUARES = 0x10100 # to * CAPTURE_SQUARES sets both the to and the target square of a move
+PAWN_PROMO_CODES = tuple(PROMOTION_CODES[c] for c in 'qnbr')
+
+
+def new_move_buffer(size: int = MAX_MOVES) -> array:
+    return array('I', bytes(4 * size))
+
+
+def reserve(moves: array, needed: int):
+    # Makes sure the buffer can hold needed moves
+    if needed > len(moves):
+        moves.frombytes(bytes(4 * max(needed - len(moves), len(moves))))
+
+
+def write_moves(moves: array, n: int, index: int, attacks: int, enemies: int,
+                promotion_squares: int = 0, promo_codes: Tuple[int, ...] = ()) -> int:
+    # Writes the moves of the piece on index to every square of attacks, returns the new move count
+    reserve(moves, n + attacks.bit_count() * max(1, len(promo_codes)))
+    promotions = attacks & promotion_squares if promo_codes else 0
+    if promotions:
+        attacks ^= promotions
+        while promotions:
+            lsb = promotions & -promotions
+            to = lsb.bit_length() - 1
+            promotions ^= lsb
+            if enemies & lsb:
+                base = index | to * CAPTURE_SQUARES | (MOVE_PROMOTION_CAPTURE << MOVE_TYPE_SHIFT)
             else:
-                self.moves.set_bit(to, False)
-                promo_char = None
-
-            return Move.new(self.source_index, to, target, move_type, promo_char)
+                base = index | (to << 8) | (MOVE_PROMOTION << MOVE_TYPE_SHIFT)
+            for code in promo_codes:
+                moves[n] = base | (code << PROMO_SHIFT)
+                n += 1
+    captures = attacks & enemies
+    quiets = attacks ^ captures
+    base = index | (MOVE_CAPTURE << MOVE_TYPE_SHIFT)
+    while captures:
+        lsb = captures & -captures
+        moves[n] = base | (lsb.bit_length() - 1) * CAPTURE_SQUARES
+        n += 1
+        captures ^= lsb
+    while quiets:
+        lsb = quiets & -quiets
+        moves[n] = index | ((lsb.bit_length() - 1) << 8)
+        n += 1
+        quiets ^= lsb
+    return n
+
+
+def write_pawn_moves(moves: array, n: int, targets: int, offset: int, capture: bool, promotion_squares: int) -> int:
+    # Writes a pawn move to every square of targets, each from the square offset indexes behind it,
+    # the moves onto promotion_squares are written once for every promotion piece
+    reserve(moves, n + targets.bit_count() * len(PAWN_PROMO_CODES))
+    if capture:
+        squares, move_type, promo_type = CAPTURE_SQUARES, MOVE_CAPTURE << MOVE_TYPE_SHIFT, MOVE_PROMOTION_CAPTURE << MOVE_TYPE_SHIFT
+    else:
+        squares, move_type, promo_type = 1 << 8, MOVE_QUIET << MOVE_TYPE_SHIFT, MOVE_PROMOTION << MOVE_TYPE_SHIFT
+    while targets:
+        lsb = targets & -targets
+        targets ^= lsb
+        to = lsb.bit_length() - 1
+        move_ = (to - offset) | to * squares
+        if lsb & promotion_squares:
+            move_ |= promo_type
+            for code in PAWN_PROMO_CODES:
+                moves[n] = move_ | (code << PROMO_SHIFT)
+                n += 1
         else:
-            raise StopIteration
+            moves[n] = move_ | move_type
+            n += 1
+    return n
+
+
+def write_move(moves: array, n: int, move_: int) -> int:
+    # Writes a single move, returns the new move count
+    reserve(moves, n + 1)
+    moves[n] = move_
+    return n + 1
 
 # MOVE GENERATOR CLASS BELOW
         
 class MoveGenerator:
     def __init__(self):
-        self.attack_tables = AttackTables()
+        # Scratch buffer for the custom piece replies looked at by the legality checks
+        self.reply_buffer = new_move_buffer()
+
+    def get_attack_tables(self, position: Position) -> AttackTables:
+        # Returns the attack tables matching the geometry of the position,
+        # they are shared by every move generator in the process, see shared_tables.py
+        return get_shared_attack_tables(position.geometry)
 
     def get_legal_moves_as_tuples(self, position: Position) -> List[Tuple[Tuple[int, int], Tuple[int, int]]]:
         # Returns a list of tuples of the form ((from_x, from_y), (to_x, to_y))
         # This is used for the GUI to display possible moves
         legal_tuples = []
-        for move_ in self.get_pseudo_moves(position):
-            if not self.is_move_legal(move_, position):
-                continue
-            legal_tuples.append((from_index(move_.get_from()), from_index(move_.get_to())))
+        from_index = position.geometry.from_index
+        for move_ in self.get_legal_moves(position):
+            legal_tuples.append((from_index(move_ & 255), from_index((move_ >> 8) & 255)))
         return legal_tuples
 
-    def get_pseudo_moves(self, position: Position) -> Iterator[Move]:
-        # Returns an iterator of all possible moves that can be made,
+    def get_pseudo_moves(self, position: Position) -> List[int]:
+        # Returns a list of all possible moves that can be made,
         # including illegal moves that would put the player in check
-        return chain(self.get_classical_pseudo_moves(position), self.get_custom_psuedo_moves(position))
-
-    def get_capture_moves(self, position: Position) -> Iterator[Move]:
-        # Returns an iterator of all possible capture moves that can be made
-        return chain(
-            filter(lambda x: x.get_is_capture(), self.get_classical_pseudo_moves(position)),
-            filter(lambda x: x.get_is_capture(), self.get_custom_psuedo_moves(position))
-        )
-
-    def get_classical_pseudo_moves(self, position: Position) -> Iterator[Move]:
-        # Returns an iterator of all possible moves that can be made by traditional chess pieces
+        moves = new_move_buffer()
+        return moves[:self.generate_pseudo_moves(position, moves)].tolist()
+
+    def get_capture_moves(self, position: Position) -> List[int]:
+        # Returns a list of all possible capture moves that can be made
+        moves = new_move_buffer()
+        return moves[:self.generate_capture_moves(position, moves)].tolist()
+
+    def get_classical_pseudo_moves(self, position: Position) -> List[int]:
+        moves = new_move_buffer()
+        return moves[:self.generate_classical_moves(position, moves)].tolist()
+
+    def get_custom_psuedo_moves(self, position: Position) -> List[int]:
+        moves = new_move_buffer()
+        return moves[:self.generate_custom_moves(position, moves)].tolist()
+
+    def generate_pseudo_moves(self, position: Position, moves: array, n: int = 0, kinds: int = GEN_ALL) -> int:
+        # Writes every possible move into moves, including illegal moves that would put the player in check
+        n = self.generate_classical_moves(position, moves, n, kinds)
+        return self.generate_custom_moves(position, moves, n, kinds)
+
+    def generate_capture_moves(self, position: Position, moves: array, n: int = 0) -> int:
+        # Writes every possible capture into moves, most valuable victim first and least valuable attacker
+        # first for each victim (MVV/LVA), so the quiescence search can take them in the order written.
+        # The attack sets are intersected with the enemies up front and computed once per attacker.
+        attack_tables = self.get_attack_tables(position)
+        my_player_num = position.whos_turn
+        my_pieces = position.pieces[my_player_num]
+        occupied = position.occupied
+        enemies = occupied & ~my_pieces.occupied & position.bounds
+        if not enemies:
+            return n
+        occ_or_not_in_bounds = occupied | ~position.bounds
+
+        # The pawn captures are found for all pawns at once, see generate_classical_moves
+        masks = attack_tables.masks
+        pawns = my_pieces.pawn.bitboard
+        if my_player_num == 0:
+            push = position.geometry.stride
+            east_captures = masks.shift_northeast(1, pawns) & enemies
+            west_captures = masks.shift_northwest(1, pawns) & enemies
+            pawn_promotions = masks.get_rank(position.dimensions.height - 1)
+            ep_attackers = attack_tables.south_pawn_attacks
+        else:
+            push = -position.geometry.stride
+            east_captures = masks.shift_southeast(1, pawns) & enemies
+            west_captures = masks.shift_southwest(1, pawns) & enemies
+            pawn_promotions = masks.get_rank(0)
+            ep_attackers = attack_tables.north_pawn_attacks
+
+        # (index, captures, promotion squares, promotion codes) of every other attacker, least valuable first
+        attackers = []
+        knight_attacks = attack_tables.knight_attacks
+        for index in my_pieces.knight.squares:
+            captures = knight_attacks[index] & enemies
+            if captures:
+                attackers.append((index, captures, 0, ()))
+        for index in my_pieces.bishop.squares:
+            captures = attack_tables.get_bishop_attack(index, occ_or_not_in_bounds, enemies) & enemies
+            if captures:
+                attackers.append((index, captures, 0, ()))
+        for p in my_pieces.custom:
+            movement = position.movement_table[p.piece_id]
+            if movement is None:
+                continue
+            for index in p.squares:
+                captures = self.get_custom_moves_bb(position, movement, index, occupied, enemies) & enemies
+                if captures:
+                    attackers.append((index, captures, movement.promotion_squares or 0, movement.promo_codes))
+        for index in my_pieces.rook.squares:
+            captures = attack_tables.get_rook_attack(index, occ_or_not_in_bounds, enemies) & enemies
+            if captures:
+                attackers.append((index, captures, 0, ()))
+        for index in my_pieces.queen.squares:
+            captures = attack_tables.get_queen_attack(index, occ_or_not_in_bounds, enemies) & enemies
+            if captures:
+                attackers.append((index, captures, 0, ()))
+        king_attacks = attack_tables.king_attacks
+        for index in my_pieces.king.squares:
+            captures = king_attacks[index] & enemies
+            if captures:
+                attackers.append((index, captures, 0, ()))
+
+        if attackers or east_captures or west_captures:
+            for victims in self.get_victims(position):
+                if not victims & enemies:
+                    continue
+                if east_captures & victims:
+                    n = write_pawn_moves(moves, n, east_captures & victims, push + 1, True, pawn_promotions)
+                if west_captures & victims:
+                    n = write_pawn_moves(moves, n, west_captures & victims, push - 1, True, pawn_promotions)
+                for index, captures, promotion_squares, promo_codes in attackers:
+                    if captures & victims:
+                        n = write_moves(moves, n, index, captures & victims, enemies, promotion_squares, promo_codes)
+
+        # En passant moves, the victim is a pawn and so are the attackers
+        ep_sq = position.properties.ep_square
+        if ep_sq is not None and not (occupied >> ep_sq) & 1:
+            capt_index = ep_sq - push
+            for index in iter_ones(ep_attackers[ep_sq] & pawns):
+                n = write_move(moves, n, new_move(index, ep_sq, capt_index, MOVE_CAPTURE))
+        return n
+
+    def get_victims(self, position: Position) -> List[int]:
+        # Returns the pieces of the other players grouped by type, most valuable first.
+        # Custom pieces are ranked between the rooks and the bishops.
+        my_player_num = position.whos_turn
+        groups = [0] * 6
+        custom = []
+        for player_num, pieces in enumerate(position.pieces):
+            if player_num == my_player_num:
+                continue
+            groups[0] |= pieces.king.bitboard
+            groups[1] |= pieces.queen.bitboard
+            groups[2] |= pieces.rook.bitboard
+            groups[3] |= pieces.bishop.bitboard
+            groups[4] |= pieces.knight.bitboard
+            groups[5] |= pieces.pawn.bitboard
+            for i, p in enumerate(pieces.custom):
+                if i == len(custom):
+                    custom.append(0)
+                custom[i] |= p.bitboard
+        return groups[:3] + custom + groups[3:]
+
+    def generate_quiet_moves(self, position: Position, moves: array, n: int = 0) -> int:
+        # Writes every possible move that isn't a capture into moves
+        return self.generate_pseudo_moves(position, moves, n, GEN_QUIETS)
+
+    def generate_classical_moves(self, position: Position, moves: array, n: int = 0, kinds: int = GEN_ALL, targets: int = -1) -> int:
+        # Writes the moves of the traditional chess pieces into moves,
+        # pieces other than the king only move to the targets squares (see generate_legal_moves)
+        attack_tables = self.get_attack_tables(position)
+        to_index = position.geometry.to_index
+        from_index = position.geometry.from_index
         my_pieces = position.pieces[position.whos_turn]
-        enemies = position.occupied & ~my_pieces.occupied
-
-        # create a list of BitboardMoves objects
-        iters: List[BitboardMoves] = []
-        occ_or_not_in_bounds = position.occupied | ~position.bounds
-        
-        # function that gets the moves for each piece type
-        def apply_to_each(pieceset: Bitboard, func):
-            while not pieceset.is_zero():
-                index = pieceset.lowest_one()
-                raw_attacks = func(self.attack_tables, index, occ_or_not_in_bounds, enemies)
+        my_occupied = my_pieces.occupied
+        enemies = position.occupied & ~my_occupied
+        bounds = position.bounds
+        not_mine_in_bounds = bounds & ~my_occupied
+        occ_or_not_in_bounds = position.occupied | ~bounds
+        if not kinds & GEN_CAPTURES:
+            not_mine_in_bounds &= ~enemies
+        if not kinds & GEN_QUIETS:
+            not_mine_in_bounds &= enemies
+
+        for index in my_pieces.king.squares:
+            raw_attacks = attack_tables.get_king_attack(index, occ_or_not_in_bounds, enemies) & not_mine_in_bounds
+            n = write_moves(moves, n, index, raw_attacks, enemies)
+        not_mine_in_bounds &= targets
+
+        for squares, func in (
+            (my_pieces.queen.squares, attack_tables.get_queen_attack),
+            (my_pieces.rook.squares, attack_tables.get_rook_attack),
+            (my_pieces.bishop.squares, attack_tables.get_bishop_attack),
+            (my_pieces.knight.squares, attack_tables.get_knight_attack),
+        ):
+            for index in squares:
                 # Stop the piece from attacking its own piece and make sure it stays in bounds
-                raw_attacks &= ~my_pieces.occupied
-                raw_attacks &= position.bounds
-                # Add the moves to the list of BitboardMoves objects
-                iters.append(BitboardMoves(enemies.copy(), raw_attacks, index, None, None))
-                pieceset.set_bit(index, False)
-
-
-        apply_to_each(my_pieces.king.bitboard.copy(), AttackTables.get_king_attack)
-        apply_to_each(my_pieces.queen.bitboard.copy(), AttackTables.get_queen_attack)
-        apply_to_each(my_pieces.rook.bitboard.copy(), AttackTables.get_rook_attack)
-        apply_to_each(my_pieces.bishop.bitboard.copy(), AttackTables.get_bishop_attack)
-        apply_to_each(my_pieces.knight.bitboard.copy(), AttackTables.get_knight_attack)
-
-        extra_moves = [] # list of moves that are not generated by the above functions, promos, en passant, castling
-        p_copy = my_pieces.pawn.bitboard.copy()
-        while not p_copy.is_zero():
-            # Promotion moves
-            index = p_copy.lowest_one()
-            raw_attacks = (
-                self.attack_tables.get_north_pawn_attack(index, position.occupied, enemies)
-                if position.whos_turn == 0
-                else self.attack_tables.get_south_pawn_attack(index, position.occupied, enemies)
-            )
-            raw_attacks &= ~my_pieces.occupied
-            raw_attacks &= position.bounds
-            promotion_squares = (
-                self.attack_tables.masks.get_rank(position.dimensions.height - 1).copy()
-                if position.whos_turn == 0
-                else self.attack_tables.masks.get_rank(0).copy()
-            )
-            promo_vals = ['r', 'b', 'n', 'q']
-            iters.append(BitboardMoves(enemies.copy(), raw_attacks, index, promotion_squares, promo_vals))
-
-            # En passant moves
-            if position.properties.ep_square is not None:
-                ep_sq = position.properties.ep_square
-                attack_only = (
-                    self.attack_tables.get_north_pawn_attack_raw(index) & ~my_pieces.occupied
-                    if position.whos_turn == 0
-                    else self.attack_tables.get_south_pawn_attack_raw(index) & ~my_pieces.occupied
-                )
-                if attack_only.bit(ep_sq):
-                    cap_x, cap_y = from_index(ep_sq)
-                    if position.whos_turn == 0:
-                        cap_y -= 1
-                    else:
-                        cap_y += 1
-                    move_ = Move.new(index, ep_sq, to_index(cap_x, cap_y), 'Capture', None)
-                    extra_moves.append(move_)
-            p_copy.set_bit(index, False)
-
-        if my_pieces.king.bitboard.lowest_one() >= 0:
-            # Castling moves
-            king_index = my_pieces.king.bitboard.lowest_one()
+                raw_attacks = func(index, occ_or_not_in_bounds, enemies) & not_mine_in_bounds
+                n = write_moves(moves, n, index, raw_attacks, enemies)
+
+        # Pawn moves are generated for all pawns at once by shifting the pawn bitboard
+        masks = attack_tables.masks
+        pawns = my_pieces.pawn.bitboard
+        height = position.dimensions.height
+        stride = position.geometry.stride
+        empty = ~position.occupied & bounds
+        if position.whos_turn == 0:
+            single = masks.shift_north(1, pawns) & empty
+            # pawns on the second rank may push twice, if both squares are free
+            double = masks.shift_north(1, single & masks.get_rank(2)) & empty if height > 3 else 0
+            east_captures = masks.shift_northeast(1, pawns)
+            west_captures = masks.shift_northwest(1, pawns)
+            promotion_squares = masks.get_rank(height - 1)
+            push = stride
+            ep_attackers = attack_tables.south_pawn_attacks
+        else:
+            single = masks.shift_south(1, pawns) & empty
+            double = masks.shift_south(1, single & masks.get_rank(height - 3)) & empty if height > 3 else 0
+            east_captures = masks.shift_southeast(1, pawns)
+            west_captures = masks.shift_southwest(1, pawns)
+            promotion_squares = masks.get_rank(0)
+            push = -stride
+            ep_attackers = attack_tables.north_pawn_attacks
+        if pawns:
+            captures = enemies & not_mine_in_bounds
+            n = write_pawn_moves(moves, n, single & not_mine_in_bounds, push, False, promotion_squares)
+            n = write_pawn_moves(moves, n, double & not_mine_in_bounds, 2 * push, False, promotion_squares)
+            n = write_pawn_moves(moves, n, east_captures & captures, push + 1, True, promotion_squares)
+            n = write_pawn_moves(moves, n, west_captures & captures, push - 1, True, promotion_squares)
+
+        # En passant moves, the pawns that could capture on the ep square are found from the square itself
+        ep_sq = position.properties.ep_square
+        if ep_sq is not None and kinds & GEN_CAPTURES and not (my_occupied >> ep_sq) & 1:
+            capt_index = ep_sq - push
+            for index in iter_ones(ep_attackers[ep_sq] & pawns):
+                n = write_move(moves, n, new_move(index, ep_sq, capt_index, MOVE_CAPTURE))
+
+        king_bb = my_pieces.king.bitboard
+        if king_bb and kinds & GEN_QUIETS and position.properties.castling_rights.can_player_castle(position.whos_turn):
+            # Castling moves, the king can't castle out of or through check
+            king_bb &= -king_bb
+            king_index = king_bb.bit_length() - 1
+            enemy_attacks = self.get_attack_map(position, (position.whos_turn + 1) % position.num_players)
             kx, ky = from_index(king_index)
             whos_turn = position.whos_turn
             if position.properties.castling_rights.can_player_castle_kingside(position.whos_turn):
@@ -162,192 +342,143 @@ class MoveGenerator:
                 piece_info = position.piece_at(rook_index)
                 if piece_info is not None:
                     owner, pt = piece_info
-                    if owner == whos_turn and pt.piece_type == PieceType.Rook:
-                        east = self.attack_tables.masks.get_east(king_index)
-                        occ = east & position.occupied
-                        occ.set_bit(rook_index, False)
-                        if occ.is_zero():
+                    if owner == whos_turn and pt.piece_id == ROOK_ID:
+                        east = attack_tables.masks.get_east(king_index)
+                        occ = east & position.occupied & ~(1 << rook_index)
+                        if not occ:
                             king_one_step_indx = to_index(kx + 1, ky)
-                            if self.is_move_legal(Move.null(), position) and self.is_move_legal(
-                                Move.new(king_index, king_one_step_indx, None, 'Quiet', None), position
-                            ):
+                            if not enemy_attacks & (king_bb | (1 << king_one_step_indx)):
                                 to_index_ = to_index(kx + 2, ky)
-                                extra_moves.append(Move.new(king_index, to_index_, rook_index, 'KingsideCastle', None))
+                                n = write_move(moves, n, new_move(king_index, to_index_, rook_index, MOVE_KINGSIDE_CASTLE))
 
             if position.properties.castling_rights.can_player_castle_queenside(position.whos_turn):
                 rook_index = to_index(0, ky)
                 piece_info = position.piece_at(rook_index)
                 if piece_info is not None:
                     owner, pt = piece_info
-                    if owner == whos_turn and pt.piece_type == PieceType.Rook:
-                        west = self.attack_tables.masks.get_west(king_index)
-                        occ = west & position.occupied
-                        occ.set_bit(rook_index, False)
-                        if occ.is_zero():
+                    if owner == whos_turn and pt.piece_id == ROOK_ID:
+                        west = attack_tables.masks.get_west(king_index)
+                        occ = west & position.occupied & ~(1 << rook_index)
+                        if not occ:
                             king_one_step_indx = to_index(kx - 1, ky)
-                            if self.is_move_legal(Move.null(), position) and self.is_move_legal(
-                                Move.new(king_index, king_one_step_indx, None, 'Quiet', None), position
-                            ):
+                            if not enemy_attacks & (king_bb | (1 << king_one_step_indx)):
                                 to_index_ = to_index(kx - 2, ky)
-                                extra_moves.append(Move.new(king_index, to_index_, rook_index, 'QueensideCastle', None))
+                                n = write_move(moves, n, new_move(king_index, to_index_, rook_index, MOVE_QUEENSIDE_CASTLE))
 
-        return chain(*(iter(moves) for moves in iters), extra_moves)
+        return n
         
-    def get_custom_psuedo_moves(self, position: Position) -> Iterator[Move]:
-        # Returns an iterator of all possible moves that can be made by custom pieces
+    def generate_custom_moves(self, position: Position, moves: array, n: int = 0, kinds: int = GEN_ALL, targets: int = -1) -> int:
+        # Writes the moves of the custom pieces into moves
         my_pieces = position.pieces[position.whos_turn]
 
-        iters: List[BitboardMoves] = []
-        moves = []
-
-        if len(my_pieces.custom) == 0: # If there are no custom pieces, return an empty iterator
-            return chain(*(iter(moves) for moves in iters), moves)
+        if len(my_pieces.custom) == 0: # If there are no custom pieces, there is nothing to write
+            return n
 
         enemies = position.occupied & ~my_pieces.occupied
-        occ_or_not_in_bounds = position.occupied | ~position.bounds
+        occupied = position.occupied
+        wanted = (enemies if kinds & GEN_CAPTURES else 0) | (~occupied if kinds & GEN_QUIETS else 0)
+        wanted &= targets
 
         for p in my_pieces.custom:
-            movement = position.get_movement_pattern(p.piece_type)
+            movement = position.movement_table[p.piece_id]
             if movement is None:
                 continue
+            promotion_squares = movement.promotion_squares or 0
+            promo_codes = movement.promo_codes
+
+            for index in p.squares:
+                jumps = self.get_custom_moves_bb(position, movement, index, occupied, enemies)
+                n = write_moves(moves, n, index, jumps & wanted, enemies, promotion_squares, promo_codes)
+
+        return n
+
+    def get_custom_moves_bb(self, position: Position, movement: MovementPattern, index: int, occupied: int, enemies: int) -> int:
+        # Returns every square the custom piece on index can move to, captures of the enemies included
+        attack_tables = self.get_attack_tables(position)
+        bounds = position.bounds
+        occ_or_not_in_bounds = occupied | ~bounds
+
+        raw_attacks = attack_tables.get_sliding_moves_bb(
+            index,
+            occ_or_not_in_bounds,
+            enemies,
+            movement.attack_north,
+            movement.attack_east,
+            movement.attack_south,
+            movement.attack_west,
+            movement.attack_northeast,
+            movement.attack_northwest,
+            movement.attack_southeast,
+            movement.attack_southwest
+        )
+        raw_attacks &= enemies & bounds
+        raw_moves = attack_tables.get_sliding_moves_bb(
+            index,
+            occ_or_not_in_bounds,
+            enemies,
+            movement.translate_north,
+            movement.translate_east,
+            movement.translate_south,
+            movement.translate_west,
+            movement.translate_northeast,
+            movement.translate_northwest,
+            movement.translate_southeast,
+            movement.translate_southwest
+        )
+        raw_moves &= ~occupied & bounds
+
+        # Jumps and sliding runs are gathered into the same bitboard as the slides
+        jumps = raw_attacks | raw_moves
+        jumps |= movement.translate_jumps[index] & ~occupied
+        jumps |= movement.attack_jumps[index] & enemies
+
+        for run_mask, run_bits in movement.attack_runs[index]:
+            if run_mask & occupied:
+                for bit in run_bits:
+                    if occupied & bit:
+                        jumps |= bit & enemies
+                        break
+
+        for run_mask, run_bits in movement.translate_runs[index]:
+            if not run_mask & occupied:
+                jumps |= run_mask
+                continue
+            for bit in run_bits:
+                if occupied & bit:
+                    break
+                jumps |= bit
 
-            bb = p.bitboard
-            bb_copy = bb.copy()
-            while not bb_copy.is_zero():
-                index = bb_copy.lowest_one()
-                raw_attacks = self.attack_tables.get_sliding_moves_bb(
-                    index,
-                    occ_or_not_in_bounds,
-                    enemies,
-                    movement.attack_north,
-                    movement.attack_east,
-                    movement.attack_south,
-                    movement.attack_west,
-                    movement.attack_northeast,
-                    movement.attack_northwest,
-                    movement.attack_southeast,
-                    movement.attack_southwest
-                )
-                raw_attacks &= enemies
-                raw_attacks &= position.bounds
-                iters.append(BitboardMoves(
-                    enemies.copy(),
-                    raw_attacks,
-                    index,
-                    movement.promotion_squares.copy() if movement.promotion_squares else None,
-                    movement.promo_vals.copy() if movement.promo_vals else None,
-                ))
-                raw_moves = self.attack_tables.get_sliding_moves_bb(
-                    index,
-                    occ_or_not_in_bounds,
-                    enemies,
-                    movement.translate_north,
-                    movement.translate_east,
-                    movement.translate_south,
-                    movement.translate_west,
-                    movement.translate_northeast,
-                    movement.translate_northwest,
-                    movement.translate_southeast,
-                    movement.translate_southwest
-                )
-                raw_moves &= ~position.occupied
-                raw_moves &= position.bounds
-                iters.append(BitboardMoves(
-                    enemies.copy(),
-                    raw_moves,
-                    index,
-                    movement.promotion_squares.copy() if movement.promotion_squares else None,
-                    movement.promo_vals.copy() if movement.promo_vals else None,
-                ))
-
-                x, y = from_index(index)
-                for dx, dy in movement.translate_jump_deltas:
-                    x2, y2 = x + dx, y + dy
-                    if not (0 <= x2 < 16 and 0 <= y2 < 16):
-                        continue
-                    to = to_index(x2, y2)
-                    if position.xy_in_bounds(x2, y2) and not position.occupied.bit(to):
-                        if movement.promotion_at(to):
-                            for c in movement.promo_vals:
-                                moves.append(Move.new(index, to, None, 'Promotion', c))
-                        else:
-                            moves.append(Move.new(index, to, None, 'Quiet', None))
-
-                for dx, dy in movement.attack_jump_deltas:
-                    x2, y2 = x + dx, y + dy
-                    if not (0 <= x2 < 16 and 0 <= y2 < 16):
-                        continue
-                    to = to_index(x2, y2)
-                    if enemies.bit(to):
-                        if movement.promotion_at(to):
-                            for c in movement.promo_vals:
-                                moves.append(Move.new(index, to, to, 'PromotionCapture', c))
-                        else:
-                            moves.append(Move.new(index, to, to, 'Capture', None))
-
-                for run in movement.attack_sliding_deltas:
-                    for dx, dy in run:
-                        x2, y2 = x + dx, y + dy
-                        if not (0 <= x2 < 16 and 0 <= y2 < 16):
-                            break
-                        to = to_index(x2, y2)
-                        if not position.xy_in_bounds(x2, y2):
-                            break
-                        if enemies.bit(to):
-                            if movement.promotion_at(to):
-                                for c in movement.promo_vals:
-                                    moves.append(Move.new(index, to, to, 'PromotionCapture', c))
-                            else:
-                                moves.append(Move.new(index, to, to, 'Capture', None))
-                            break
-                        if position.occupied.bit(to):
-                            break
-
-                for run in movement.translate_sliding_deltas:
-                    for dx, dy in run:
-                        x2, y2 = x + dx, y + dy
-                        if not (0 <= x2 < 16 and 0 <= y2 < 16):
-                            break
-                        to = to_index(x2, y2)
-                        if not position.xy_in_bounds(x2, y2) or position.occupied.bit(to):
-                            break
-                        if movement.promotion_at(to):
-                            for c in movement.promo_vals:
-                                moves.append(Move.new(index, to, None, 'Quiet', c))
-                        else:
-                            moves.append(Move.new(index, to, None, 'Quiet', None))
-
-                bb_copy.set_bit(index, False)
-
-        return chain(*(iter(moves) for moves in iters), moves)
+        return jumps
     
-    def get_num_moves_on_empty_board(self, index: int, position: Position, piece: Piece, bounds: Bitboard) -> int:
+    def get_num_moves_on_empty_board(self, index: int, position: Position, piece: Piece, bounds: int) -> int:
         # Returns the number of moves a piecetyee can make on an otherwise empty board,
         # This is used for building the positional score arrays in the evaluator
-        x, y = from_index(index)
+        attack_tables = self.get_attack_tables(position)
+        x, y = position.geometry.from_index(index)
         if not position.xy_in_bounds(x, y):
             return 0
-        zero = Bitboard.zero()
+        zero = 0
         not_in_bounds = ~position.bounds
         if piece.piece_type == PieceType.Queen:
-            moves = self.attack_tables.get_queen_attack(index, not_in_bounds, zero)
+            moves = attack_tables.get_queen_attack(index, not_in_bounds, zero)
         elif piece.piece_type == PieceType.Bishop:
-            moves = self.attack_tables.get_bishop_attack(index, not_in_bounds, zero)
+            moves = attack_tables.get_bishop_attack(index, not_in_bounds, zero)
         elif piece.piece_type == PieceType.Rook:
-            moves = self.attack_tables.get_rook_attack(index, not_in_bounds, zero)
+            moves = attack_tables.get_rook_attack(index, not_in_bounds, zero)
         elif piece.piece_type == PieceType.Knight:
-            moves = self.attack_tables.get_knight_attack(index, not_in_bounds, zero)
+            moves = attack_tables.get_knight_attack(index, not_in_bounds, zero)
         elif piece.piece_type == PieceType.King:
-            moves = self.attack_tables.get_king_attack(index, not_in_bounds, zero)
+            moves = attack_tables.get_king_attack(index, not_in_bounds, zero)
         elif piece.piece_type == PieceType.Pawn:
-            moves = self.attack_tables.get_north_pawn_attack(index, not_in_bounds, zero)
-        elif isinstance(piece.piece_type, PieceType.Custom):
+            moves = attack_tables.get_north_pawn_attack(index, not_in_bounds, zero, 1)
+        elif piece.piece_type.is_custom():
             mp = position.get_movement_pattern(piece.piece_type)
             if mp is None:
                 return 0
-            slides = self.attack_tables.get_sliding_moves_bb(
+            slides = attack_tables.get_sliding_moves_bb(
                 index,
                 not_in_bounds,
+                zero,
                 mp.translate_north or mp.attack_north,
                 mp.translate_east or mp.attack_east,
                 mp.translate_south or mp.attack_south,
@@ -357,108 +488,315 @@ class MoveGenerator:
                 mp.translate_southeast or mp.attack_southeast,
                 mp.translate_southwest or mp.attack_southwest
             )
-            x, y = from_index(index)
-            for dx, dy in chain(mp.translate_jump_deltas, mp.attack_jump_deltas):
-                x2, y2 = x + dx, y + dy
-                if not (0 <= x2 < 16 and 0 <= y2 < 16):
-                    continue
-                to = to_index(x2, y2)
-                if bounds.bit(to):
-                    slides.set_bit(to, True)
-            for run in chain(mp.attack_sliding_deltas, mp.translate_sliding_deltas):
-                for dx, dy in run:
-                    x2, y2 = x + dx, y + dy
-                    if not (0 <= x2 < 16 and 0 <= y2 < 16):
-                        break
-                    to = to_index(x2, y2)
-                    if not bounds.bit(to):
-                        break
-                    slides.set_bit(to, True)
+            slides |= mp.translate_jumps[index] | mp.attack_jumps[index]
+            for run_mask, _ in chain(mp.attack_runs[index], mp.translate_runs[index]):
+                slides |= run_mask
             moves = slides
 
         moves &= bounds
-        return moves.count_ones()
-
-    def is_in_check_from_king(self, position: Position, my_player_num: int) -> bool:
-        # Returns True if either player is in check
-        my_pieces = position.pieces[my_player_num]
+        return moves.bit_count()
+
+    def is_pseudo_legal(self, position: Position, move_: int) -> bool:
+        # Returns True if move_ is one of the pseudo moves of the position, used to check hash and killer moves
+        # before they are searched.  Plain moves of the classical pieces are checked against the attack
+        # tables directly, everything else is looked up in the generated moves.
+        move_type = (move_ >> MOVE_TYPE_SHIFT) & 7
+        if move_type == MOVE_NULL:
+            return False
+        from_bit = 1 << (move_ & 255)
+        my_pieces = position.pieces[position.whos_turn]
+        if not my_pieces.occupied & from_bit:
+            return False
+        to = (move_ >> 8) & 255
+        to_bit = 1 << to
         enemies = position.occupied & ~my_pieces.occupied
-        occ_or_not_in_bounds = position.occupied | ~position.bounds
-        enemy_pieces = position.pieces[position.whos_turn]
-        enemy_pawns = enemy_pieces.pawn.bitboard
-        enemy_knights = enemy_pieces.knight.bitboard
-        enemy_bishops = enemy_pieces.bishop.bitboard
-        enemy_queens = enemy_pieces.queen.bitboard
-        enemy_rooks = enemy_pieces.rook.bitboard
-        enemy_kings = enemy_pieces.king.bitboard
+        if move_ >> PROMO_SHIFT == 0 and ((move_type == MOVE_QUIET and move_ >> 16 == 0 and not position.occupied & to_bit) or
+                                          (move_type == MOVE_CAPTURE and (move_ >> 16) & 255 == to and enemies & to_bit)):
+            attack_tables = self.get_attack_tables(position)
+            occ_or_not_in_bounds = position.occupied | ~position.bounds
+            if my_pieces.pawn.bitboard & from_bit:
+                if position.whos_turn == 0:
+                    promotion_squares = attack_tables.masks.get_rank(position.dimensions.height - 1)
+                    attacks = attack_tables.get_north_pawn_attack(move_ & 255, position.occupied, enemies, 1)
+                else:
+                    promotion_squares = attack_tables.masks.get_rank(0)
+                    attacks = attack_tables.get_south_pawn_attack(move_ & 255, position.occupied, enemies,
+                                                                  position.dimensions.height - 2)
+                return bool(attacks & position.bounds & ~promotion_squares & to_bit)
+            for pieceset, func in (
+                (my_pieces.knight.bitboard, attack_tables.get_knight_attack),
+                (my_pieces.bishop.bitboard, attack_tables.get_bishop_attack),
+                (my_pieces.rook.bitboard, attack_tables.get_rook_attack),
+                (my_pieces.queen.bitboard, attack_tables.get_queen_attack),
+                (my_pieces.king.bitboard, attack_tables.get_king_attack),
+            ):
+                if pieceset & from_bit:
+                    return bool(func(move_ & 255, occ_or_not_in_bounds, enemies) & position.bounds & to_bit)
+        moves = self.reply_buffer
+        n = self.generate_pseudo_moves(position, moves)
+        for i in range(n):
+            if moves[i] == move_:
+                return True
+        return False
 
-        loc_index = my_pieces.king.bitboard.lowest_one()
+    def get_check_info(self, position: Position) -> 'CheckInfo':
+        # Returns the CheckInfo of the position, it is computed once and kept on the position properties
+        info = position.properties.check_info
+        if info is None or info.occupied != position.occupied:
+            info = CheckInfo(self, position)
+            position.properties.check_info = info
+        return info
+
+    def get_attackers(self, position: Position, index: int, occupied: int, removed: int = 0) -> int:
+        # Returns the pieces of the next player that could capture on index if the board was occupied by
+        # occupied, pieces on the removed squares (captured by the move being tested) are left out.
+        # The classical pieces are looked up from index, the custom pieces each check their own moves.
+        attack_tables = self.get_attack_tables(position)
+        my_player_num = position.whos_turn
+        enemy_pieces = position.pieces[(my_player_num + 1) % position.num_players]
+        occ_or_not_in_bounds = occupied | ~position.bounds
 
         if my_player_num == 0:
-            patt = self.attack_tables.get_north_pawn_attack_masked(loc_index, occ_or_not_in_bounds, enemies)
+            attackers = attack_tables.north_pawn_attacks[index] & enemy_pieces.pawn.bitboard
         else:
-            patt = self.attack_tables.get_south_pawn_attack_masked(loc_index, occ_or_not_in_bounds, enemies)
-
-        if not (patt & enemy_pawns).is_zero():
-            return True
-
-        natt = self.attack_tables.get_knight_attack(loc_index, occ_or_not_in_bounds, enemies)
-        if not (natt & enemy_knights).is_zero():
-            return True
-
-        katt = self.attack_tables.get_king_attack(loc_index, occ_or_not_in_bounds, enemies)
-        if not (katt & enemy_kings).is_zero():
-            return True
-
-        ratt = self.attack_tables.get_rook_attack(loc_index, occ_or_not_in_bounds, enemies)
-        if not (ratt & enemy_queens).is_zero() or not (ratt & enemy_rooks).is_zero():
-            return True
-
-        batt = self.attack_tables.get_bishop_attack(loc_index, occ_or_not_in_bounds, enemies)
-        if not (batt & enemy_queens).is_zero() or not (batt & enemy_bishops).is_zero():
-            return True
-
-        return False
+            attackers = attack_tables.south_pawn_attacks[index] & enemy_pieces.pawn.bitboard
+        attackers |= attack_tables.knight_attacks[index] & enemy_pieces.knight.bitboard
+        attackers |= attack_tables.king_attacks[index] & enemy_pieces.king.bitboard
+        enemy_queens = enemy_pieces.queen.bitboard
+        rooks = enemy_queens | enemy_pieces.rook.bitboard
+        if rooks:
+            attackers |= attack_tables.get_rook_attack(index, occ_or_not_in_bounds, 0) & rooks
+        bishops = enemy_queens | enemy_pieces.bishop.bitboard
+        if bishops:
+            attackers |= attack_tables.get_bishop_attack(index, occ_or_not_in_bounds, 0) & bishops
+        attackers &= ~removed
+
+        if enemy_pieces.custom:
+            target = 1 << index
+            for p in enemy_pieces.custom:
+                movement = position.movement_table[p.piece_id]
+                if movement is None:
+                    continue
+                for sq in iter_ones(p.bitboard & ~removed):
+                    if self.get_custom_moves_bb(position, movement, sq, occupied, target) & target:
+                        attackers |= 1 << sq
+        return attackers
+
+    def get_attack_map(self, position: Position, player_num: int) -> int:
+        # Returns every square the pieces of player_num attack, the squares they could capture on if an
+        # enemy stood there (their own pieces included, so the map doubles as the defended squares).
+        # The maps are computed when first asked for and kept on the position properties.
+        attack_maps = position.properties.attack_maps
+        if attack_maps is None:
+            attack_maps = position.properties.attack_maps = [None] * position.num_players
+        attack_map = attack_maps[player_num]
+        if attack_map is not None:
+            return attack_map
+
+        attack_tables = self.get_attack_tables(position)
+        pieces = position.pieces[player_num]
+        occupied = position.occupied
+        occ_or_not_in_bounds = occupied | ~position.bounds
+        masks = attack_tables.masks
+        pawns = pieces.pawn.bitboard
+        if player_num == 0:
+            attack_map = masks.shift_northeast(1, pawns) | masks.shift_northwest(1, pawns)
+        else:
+            attack_map = masks.shift_southeast(1, pawns) | masks.shift_southwest(1, pawns)
+        knight_attacks = attack_tables.knight_attacks
+        for index in pieces.knight.squares:
+            attack_map |= knight_attacks[index]
+        king_attacks = attack_tables.king_attacks
+        for index in pieces.king.squares:
+            attack_map |= king_attacks[index]
+        for index in iter_ones(pieces.rook.bitboard | pieces.queen.bitboard):
+            attack_map |= attack_tables.get_rook_attack(index, occ_or_not_in_bounds, 0)
+        for index in iter_ones(pieces.bishop.bitboard | pieces.queen.bitboard):
+            attack_map |= attack_tables.get_bishop_attack(index, occ_or_not_in_bounds, 0)
+        for p in pieces.custom:
+            movement = position.movement_table[p.piece_id]
+            if movement is None:
+                continue
+            for index in p.squares:
+                attack_map |= self.get_custom_attacks_bb(position, movement, index, occupied)
+
+        attack_map &= position.bounds
+        attack_maps[player_num] = attack_map
+        return attack_map
+
+    def get_custom_attacks_bb(self, position: Position, movement: MovementPattern, index: int, occupied: int) -> int:
+        # Returns the squares the custom piece on index could capture on, see get_custom_moves_bb.
+        # The directional attacks stop in front of the first piece (get_sliding_moves_bb leaves the
+        # blocker out), so only the jumps and the sliding runs capture.
+        attacks = movement.attack_jumps[index]
+        for run_mask, run_bits in movement.attack_runs[index]:
+            if not run_mask & occupied:
+                attacks |= run_mask
+                continue
+            for bit in run_bits:
+                attacks |= bit
+                if occupied & bit:
+                    break
+        return attacks
 
     def in_check(self, position: Position) -> bool:
         # Returns True if the player is in check
-        my_player_num = position.whos_turn
-        in_check = False
-        position.make_move(Move.null())
-        if self.is_in_check_from_king(position, my_player_num):
-            in_check = True
-        for move_ in self.get_custom_psuedo_moves(position):
-            if move_.get_is_capture() and position.piece_at(move_.get_target())[1] == PieceType.King:
-                in_check = True
-                break
-        position.unmake_move()
-        return in_check
-
-    def is_move_legal(self, move_: Move, position: Position) -> bool:
-        #kings cannot be captured
-        if move_.get_move_type() in ['PromotionCapture', 'Capture']:
-            if position.piece_at(move_.get_target())[1] == PieceType.King:
+        king_bb = position.pieces[position.whos_turn].king.bitboard
+        return (self.get_attack_map(position, (position.whos_turn + 1) % position.num_players) & king_bb & -king_bb) != 0
+
+    def is_legal(self, position: Position, move_: int) -> bool:
+        # Returns True if the pseudo move move_ doesn't leave the king of the player in check.
+        # Only king moves, en passant, moves of pinned pieces and check evasions are tested against
+        # the board they leave behind, every other move is legal as soon as it is pseudo legal.
+        info = self.get_check_info(position)
+        move_type = (move_ >> MOVE_TYPE_SHIFT) & 7
+        from_bit = 1 << (move_ & 255)
+        to = (move_ >> 8) & 255
+        to_bit = 1 << to
+        captured = 0
+        if (CAPTURE_TYPES >> move_type) & 1:
+            captured = 1 << ((move_ >> 16) & 255)
+            # kings cannot be captured
+            if captured & info.enemy_kings:
+                return False
+        king_bb = info.king_bb
+        if not king_bb:
+            return True
+        occupied = (position.occupied & ~from_bit & ~captured) | to_bit
+
+        if from_bit & king_bb:
+            if move_type == MOVE_KINGSIDE_CASTLE or move_type == MOVE_QUEENSIDE_CASTLE:
+                x, y = position.geometry.from_index(to)
+                rook_x = x - 1 if move_type == MOVE_KINGSIDE_CASTLE else x + 1
+                occupied = (occupied & ~(1 << ((move_ >> 16) & 255))) | (1 << position.geometry.to_index(rook_x, y))
+            elif not info.checkers:
+                # Out of check no attacker reaches the king, so moving it away opens no new lines
+                return not (self.get_attack_map(position, (position.whos_turn + 1) % position.num_players) >> to) & 1
+            return not self.get_attackers(position, to, occupied, captured)
+
+        checkers = info.checkers
+        en_passant = captured and captured != to_bit
+        if checkers:
+            if checkers & (checkers - 1):
+                return False # only the king can get out of a double check
+            if not en_passant and not to_bit & info.evasion_mask:
                 return False
+        elif not en_passant and not from_bit & info.blockers:
+            return True
+        return not self.get_attackers(position, info.king_square, occupied, captured)
+
+    def is_move_legal(self, move_: int, position: Position) -> bool:
+        return self.is_legal(position, move_)
+
+    def generate_legal_moves(self, position: Position, moves: array, n: int = 0, kinds: int = GEN_ALL) -> int:
+        # Writes every legal move into moves.  In check only king moves and moves that capture or block
+        # the checker are generated (just king moves in double check) before the legality test.
+        info = self.get_check_info(position)
+        start = n
+        if info.checkers:
+            targets = info.evasion_mask if not info.checkers & (info.checkers - 1) else 0
+            n = self.generate_classical_moves(position, moves, n, kinds, targets)
+            n = self.generate_custom_moves(position, moves, n, kinds, targets)
+        else:
+            n = self.generate_pseudo_moves(position, moves, n, kinds)
+        is_legal = self.is_legal
+        legal = start
+        for i in range(start, n):
+            move_ = moves[i]
+            if is_legal(position, move_):
+                moves[legal] = move_
+                legal += 1
+        return legal
+
+    def get_legal_moves(self, position: Position) -> List[int]:
+        moves = new_move_buffer()
+        return moves[:self.generate_legal_moves(position, moves)].tolist()
+
+    def count_legal_moves(self, position: Position, moves: Optional[array] = None) -> int:
+        if moves is None:
+            moves = self.reply_buffer
+        return self.generate_legal_moves(position, moves)
+
+
+class CheckInfo:
+    '''
+    What the legality test needs to know about a position, computed once per position by
+    MoveGenerator.get_check_info and kept on its properties:
+        king_bb, king_square: the king of the player to move (the lowest one if there are several)
+        checkers: the pieces of the next player giving check
+        evasion_mask: the squares a move other than a king move has to land on to answer a single check,
+            the checker and the squares between it and the king (every square for a custom checker,
+            whose path isn't known)
+        blockers: the pieces of the player that are the only thing between their king and an attacker
+            (pinned pieces), so only their moves need testing when the player isn't in check
+        enemy_kings: the kings of the other players, which cannot be captured
+    '''
+    __slots__ = ('occupied', 'king_bb', 'king_square', 'checkers', 'evasion_mask', 'blockers', 'enemy_kings')
+
+    def __init__(self, movegen: MoveGenerator, position: Position):
         my_player_num = position.whos_turn
-        legality = True
-        position.make_move(move_)
-        if self.is_in_check_from_king(position, my_player_num):
-            legality = False
-        # custom pieces cannot capture kings either haha
-        for move_ in self.get_custom_psuedo_moves(position):
-            if move_.get_is_capture() and position.piece_at(move_.get_target())[1] == PieceType.King:
-                legality = False
-                break
-        position.unmake_move()
-        return legality
-
-    def count_legal_moves(self, position: Position) -> int:
-        nodes = 0
-        for move_ in self.get_pseudo_moves(position):
-            if not self.is_move_legal(move_, position):
+        my_pieces = position.pieces[my_player_num]
+        occupied = position.occupied
+        self.occupied = occupied
+        enemy_kings = 0
+        for player_num, pieces in enumerate(position.pieces):
+            if player_num != my_player_num:
+                enemy_kings |= pieces.king.bitboard
+        self.enemy_kings = enemy_kings
+        king_bb = my_pieces.king.bitboard
+        king_bb &= -king_bb
+        self.king_bb = king_bb
+        self.checkers = 0
+        self.evasion_mask = 0
+        self.blockers = 0
+        if not king_bb:
+            self.king_square = -1
+            return
+        king_square = king_bb.bit_length() - 1
+        self.king_square = king_square
+
+        attack_tables = movegen.get_attack_tables(position)
+        occ_or_not_in_bounds = occupied | ~position.bounds
+        enemy_pieces = position.pieces[(my_player_num + 1) % position.num_players]
+        checkers = movegen.get_attackers(position, king_square, occupied)
+        self.checkers = checkers
+
+        if checkers and not checkers & (checkers - 1):
+            sliders = enemy_pieces.queen.bitboard | enemy_pieces.rook.bitboard | enemy_pieces.bishop.bitboard
+            if checkers & sliders:
+                checker_square = checkers.bit_length() - 1
+                self.evasion_mask = checkers | (attack_tables.get_queen_attack(king_square, occ_or_not_in_bounds, 0) &
+                                                attack_tables.get_queen_attack(checker_square, occ_or_not_in_bounds, 0))
+            elif checkers & ~(enemy_pieces.pawn.bitboard | enemy_pieces.knight.bitboard | enemy_pieces.king.bitboard):
+                self.evasion_mask = position.bounds
+            else:
+                self.evasion_mask = checkers
+
+        # The pieces that might stand between the king and an attacker: the first piece on every line
+        # from the king, and the pieces on the sliding runs of the custom pieces that end on the king
+        candidates = attack_tables.get_queen_attack(king_square, occ_or_not_in_bounds, 0) & my_pieces.occupied
+        for p in enemy_pieces.custom:
+            movement = position.movement_table[p.piece_id]
+            if movement is None or not movement.attack_sliding_deltas:
                 continue
-            nodes += 1
-        return nodes
+            for index in p.squares:
+                for run_mask, run_bits in movement.attack_runs[index]:
+                    if run_mask & king_bb:
+                        path = 0
+                        for bit in run_bits:
+                            if bit == king_bb:
+                                break
+                            path |= bit
+                        candidates |= path & my_pieces.occupied
+        candidates &= ~king_bb
+
+        # A candidate is a blocker if the king is attacked once it's gone
+        if candidates and movegen.get_attackers(position, king_square, occupied & ~candidates) & ~checkers:
+            blockers = 0
+            for index in iter_ones(candidates):
+                if movegen.get_attackers(position, king_square, occupied & ~(1 << index)) & ~checkers:
+                    blockers |= 1 << index
+            self.blockers = blockers
 
 # Testing
     
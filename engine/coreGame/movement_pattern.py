@@ -1,5 +1,7 @@
 from typing import List, Tuple, Optional
-from .bitboard import Bitboard, to_index, from_index
+from .bitboard import iter_ones
+from .geometry import Geometry, GENERIC_GEOMETRY
+from .move import PROMOTION_CODES
 '''
 These classes are used to represent the movement patterns of pieces. In the
 Position class, there is a dictionary of these pattern objects, indexed on 
@@ -27,6 +29,13 @@ The x, y values are again the offsets from the piece's current position.
 The attack vs. translate items are used to destinguish whether a piece can attack in a certain
 direction, or whether it can only translate in that direction.  For example, a pawn can only attack
 diagonally, and it can only translate forward.
+
+Before a MovementPattern is used for move generation it is compiled for the geometry and the bounds
+of its position (see MovementPattern.compile, the Position does this whenever either changes).  The
+jumps become one bitboard per square, and every sliding run becomes a (mask, bits) pair per square:
+the mask of all of its squares and the single square bits in the order the run visits them, cut off
+where the run leaves the board.  A run whose mask misses every piece can be taken whole, only blocked
+runs are walked bit by bit.
 '''
 
 class MovementPatternExternal:
@@ -54,6 +63,8 @@ class MovementPatternExternal:
                  translate_southwest: bool = False):
         self.promotion_squares = promotion_squares
         self.promo_vals = promo_vals
+        # the promotion pieces as they are packed into moves, see move.py
+        self.promo_codes = tuple(PROMOTION_CODES[c] for c in promo_vals) if promo_vals else ()
         self.attack_sliding_deltas = attack_sliding_deltas or []
         self.attack_jump_deltas = attack_jump_deltas or []
         self.attack_north = attack_north
@@ -79,7 +90,7 @@ class MovementPatternExternal:
         return f'MovementPatternExternal(promotion_squares={self.promotion_squares}, promo_vals={self.promo_vals}, attack_sliding_deltas={self.attack_sliding_deltas}, attack_jump_deltas={self.attack_jump_deltas}, attack_north={self.attack_north}, attack_south={self.attack_south}, attack_east={self.attack_east}, attack_west={self.attack_west}, attack_northeast={self.attack_northeast}, attack_northwest={self.attack_northwest}, attack_southeast={self.attack_southeast}, attack_southwest={self.attack_southwest}, translate_jump_deltas={self.translate_jump_deltas}, translate_sliding_deltas={self.translate_sliding_deltas}, translate_north={self.translate_north}, translate_south={self.translate_south}, translate_east={self.translate_east}, translate_west={self.translate_west}, translate_northeast={self.translate_northeast}, translate_northwest={self.translate_northwest}, translate_southeast={self.translate_southeast}, translate_southwest={self.translate_southwest})'
 
 class MovementPattern:
-    def __init__(self, promotion_squares: Optional[Bitboard] = None,
+    def __init__(self, promotion_squares: Optional[int] = None,
                  promo_vals: Optional[List[str]] = None,
                  attack_sliding_deltas: List[List[Tuple[int, int]]] = None,
                  attack_jump_deltas: List[Tuple[int, int]] = None,
@@ -103,6 +114,8 @@ class MovementPattern:
                  translate_southwest: bool = False):
         self.promotion_squares = promotion_squares
         self.promo_vals = promo_vals
+        # the promotion pieces as they are packed into moves, see move.py
+        self.promo_codes = tuple(PROMOTION_CODES[c] for c in promo_vals) if promo_vals else ()
         self.attack_sliding_deltas = attack_sliding_deltas or []
         self.attack_jump_deltas = attack_jump_deltas or []
         self.attack_north = attack_north
@@ -124,23 +137,83 @@ class MovementPattern:
         self.translate_southeast = translate_southeast
         self.translate_southwest = translate_southwest
 
+        # per square tables, filled in by compile
+        self.geometry: Optional[Geometry] = None
+        self.bounds: Optional[int] = None
+        self.translate_jumps: List[int] = []
+        self.attack_jumps: List[int] = []
+        self.translate_runs: List[Tuple[Tuple[int, Tuple[int, ...]], ...]] = []
+        self.attack_runs: List[Tuple[Tuple[int, Tuple[int, ...]], ...]] = []
+
+    def compile(self, geometry: Geometry, bounds: int):
+        # Builds the per square jump bitboards and run tables for a board
+        if self.geometry is geometry and self.bounds == bounds:
+            return
+        num_squares = geometry.num_squares
+
+        def target(x, y):
+            # Returns the index of x, y or None if the square isn't on the board
+            if 0 <= x < geometry.width and 0 <= y < geometry.height:
+                index = geometry.to_index(x, y)
+                if (bounds >> index) & 1:
+                    return index
+            return None
+
+        def jump_table(deltas):
+            table = [0] * num_squares
+            for index in range(num_squares):
+                x, y = geometry.from_index(index)
+                for dx, dy in deltas:
+                    to = target(x + dx, y + dy)
+                    if to is not None:
+                        table[index] |= 1 << to
+            return table
+
+        def run_table(runs):
+            table = []
+            for index in range(num_squares):
+                x, y = geometry.from_index(index)
+                square_runs = []
+                for run in runs:
+                    bits = []
+                    for dx, dy in run:
+                        to = target(x + dx, y + dy)
+                        if to is None:
+                            break
+                        bits.append(1 << to)
+                    if bits:
+                        square_runs.append((sum(bits), tuple(bits)))
+                table.append(tuple(square_runs))
+            return table
+
+        self.translate_jumps = jump_table(self.translate_jump_deltas)
+        self.attack_jumps = jump_table(self.attack_jump_deltas)
+        self.translate_runs = run_table(self.translate_sliding_deltas)
+        self.attack_runs = run_table(self.attack_sliding_deltas)
+        self.geometry = geometry
+        self.bounds = bounds
+
     def promotion_at(self, index: int) -> bool:
         if self.promotion_squares:
-            return self.promotion_squares.bit(index)
+            return (self.promotion_squares >> index) & 1
         return False
 
     def __str__(self) -> str:
         return f'MovementPattern(promotion_squares={self.promotion_squares}, promo_vals={self.promo_vals}, attack_sliding_deltas={self.attack_sliding_deltas}, attack_jump_deltas={self.attack_jump_deltas}, attack_north={self.attack_north}, attack_south={self.attack_south}, attack_east={self.attack_east}, attack_west={self.attack_west}, attack_northeast={self.attack_northeast}, attack_northwest={self.attack_northwest}, attack_southeast={self.attack_southeast}, attack_southwest={self.attack_southwest}, translate_jump_deltas={self.translate_jump_deltas}, translate_sliding_deltas={self.translate_sliding_deltas}, translate_north={self.translate_north}, translate_south={self.translate_south}, translate_east={self.translate_east}, translate_west={self.translate_west}, translate_northeast={self.translate_northeast}, translate_northwest={self.translate_northwest}, translate_southeast={self.translate_southeast}, translate_southwest={self.translate_southwest})'
 
-def external_mp_to_internal(mpe: MovementPatternExternal) -> MovementPattern:
+def external_mp_to_internal(mpe: MovementPatternExternal, geometry: Geometry = GENERIC_GEOMETRY,
+                            bounds: Optional[int] = None) -> MovementPattern:
+    # The promotion squares are converted to a bitboard in the layout of the given geometry,
+    # the pattern is compiled for the board when its bounds are given
     promotion_squares = None
     if mpe.promotion_squares:
-        bb = Bitboard.zero()
+        bb = 0
         for x, y in mpe.promotion_squares:
-            bb.set_bit(to_index(x, y), True)
+            if x < geometry.width and y < geometry.height:
+                bb |= 1 << geometry.to_index(x, y)
         promotion_squares = bb
 
-    return MovementPattern(
+    mp = MovementPattern(
         promotion_squares=promotion_squares,
         promo_vals=mpe.promo_vals,
         attack_sliding_deltas=mpe.attack_sliding_deltas,
@@ -164,16 +237,14 @@ def external_mp_to_internal(mpe: MovementPatternExternal) -> MovementPattern:
         translate_southeast=mpe.translate_southeast,
         translate_southwest=mpe.translate_southwest
     )
+    if bounds is not None:
+        mp.compile(geometry, bounds)
+    return mp
 
-def internal_mp_to_external(mp: MovementPattern) -> MovementPatternExternal:
+def internal_mp_to_external(mp: MovementPattern, geometry: Geometry = GENERIC_GEOMETRY) -> MovementPatternExternal:
     promotion_squares = None
     if mp.promotion_squares:
-        bb = mp.promotion_squares.copy()
-        sq = []
-        while not bb.is_zero():
-            index = bb.lowest_one()
-            sq.append(from_index(index))
-            bb.set_bit(index, False)
+        sq = [geometry.from_index(index) for index in iter_ones(mp.promotion_squares)]
         if sq:
             promotion_squares = sq
 
@@ -1,65 +1,72 @@
-from .bitboard import Bitboard
 from .move import *
 
 class Piece:
     '''
-    A class to represent a piece of a certain type, occupancy is represented as a bitboard.
+    A class to represent a piece of a certain type, occupancy is represented as a bitboard (a raw int).
+    The squares of the bitboard are also kept as a piece list, which the position updates along with it.
     '''
     def __init__(self, player_num, char_rep, piece_type, bitboard):
         self.player_num = player_num
         self.char_rep = char_rep
         self.piece_type = piece_type
         self.bitboard = bitboard
+        self.squares = []
+        self.piece_id = PIECE_IDS.get(piece_type) # see move.py
     
+    def copy(self) -> 'Piece':
+        piece = Piece(self.player_num, self.char_rep, self.piece_type, self.bitboard)
+        piece.squares = self.squares.copy()
+        return piece
+
     # Below are methods to create a blank piece of a certain type
     @classmethod
     def blank_custom(cls, player_num, char_rep):
-        return cls(player_num, char_rep, char_rep, Bitboard.zero())
+        return cls(player_num, char_rep, char_rep, 0)
     
     @classmethod
     def blank_pawn(cls, player_num):
-        return cls(player_num, 'p', PieceType.Pawn, Bitboard.zero())
+        return cls(player_num, 'p', PieceType.Pawn, 0)
     
     @classmethod
     def blank_knight(cls, player_num):
-        return cls(player_num, 'n', PieceType.Knight, Bitboard.zero())
+        return cls(player_num, 'n', PieceType.Knight, 0)
     
     @classmethod
     def blank_king(cls, player_num):
-        return cls(player_num, 'k', PieceType.King, Bitboard.zero())
+        return cls(player_num, 'k', PieceType.King, 0)
     
     @classmethod
     def blank_rook(cls, player_num):
-        return cls(player_num, 'r', PieceType.Rook, Bitboard.zero())
+        return cls(player_num, 'r', PieceType.Rook, 0)
     
     @classmethod
     def blank_bishop(cls, player_num):
-        return cls(player_num, 'b', PieceType.Bishop, Bitboard.zero())
+        return cls(player_num, 'b', PieceType.Bishop, 0)
     
     @classmethod
     def blank_queen(cls, player_num):
-        return cls(player_num, 'q', PieceType.Queen, Bitboard.zero())
+        return cls(player_num, 'q', PieceType.Queen, 0)
     
     @classmethod
     def blank_custom1(cls, player_num):
-        return cls(player_num, 'a', PieceType.Custom1, Bitboard.zero())
+        return cls(player_num, 'a', PieceType.Custom1, 0)
     
     @classmethod
     def blank_custom2(cls, player_num):
-        return cls(player_num, 'c', PieceType.Custom2, Bitboard.zero())
+        return cls(player_num, 'c', PieceType.Custom2, 0)
     
     @classmethod
     def blank_custom3(cls, player_num):
-        return cls(player_num, 'd', PieceType.Custom3, Bitboard.zero())
+        return cls(player_num, 'd', PieceType.Custom3, 0)
     
     @classmethod
     def blank_custom4(cls, player_num):
-        return cls(player_num, 'e', PieceType.Custom4, Bitboard.zero())
+        return cls(player_num, 'e', PieceType.Custom4, 0)
     
     @classmethod
     def blank_custom5(cls, player_num):
-        return cls(player_num, 'f', PieceType.Custom5, Bitboard.zero())
+        return cls(player_num, 'f', PieceType.Custom5, 0)
     
     @classmethod
     def blank_custom6(cls, player_num):
-        return cls(player_num, 'g', PieceType.Custom6, Bitboard.zero())
\ No newline at end of file
+        return cls(player_num, 'g', PieceType.Custom6, 0)
\ No newline at end of file
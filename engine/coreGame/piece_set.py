@@ -1,12 +1,13 @@
-from .bitboard import Bitboard
 from .piece import Piece
+from .move import NUM_PIECE_IDS
 
 class PieceSet:
     '''
     A class to represent a set of pieces for a player.
+    The pieces are also kept in pieces_by_id, indexed by their piece id (see move.py).
     '''
     def __init__(self, player_num):
-        self.occupied = Bitboard.zero()
+        self.occupied = 0
         self.king = Piece.blank_king(player_num)
         self.queen = Piece.blank_queen(player_num)
         self.bishop = Piece.blank_bishop(player_num)
@@ -15,27 +16,51 @@ class PieceSet:
         self.pawn = Piece.blank_pawn(player_num)
         self.custom = []
         self.player_num = player_num
+        self.index_pieces()
 
     @classmethod
     def new(cls, player_num):
         return cls(player_num)
 
+    def copy(self):
+        piece_set = PieceSet(self.player_num)
+        piece_set.occupied = self.occupied
+        piece_set.king = self.king.copy()
+        piece_set.queen = self.queen.copy()
+        piece_set.bishop = self.bishop.copy()
+        piece_set.knight = self.knight.copy()
+        piece_set.rook = self.rook.copy()
+        piece_set.pawn = self.pawn.copy()
+        piece_set.custom = [p.copy() for p in self.custom]
+        piece_set.index_pieces()
+        return piece_set
+
+    def index_pieces(self):
+        pieces_by_id = [None] * NUM_PIECE_IDS
+        for piece in self.get_piece_refs():
+            pieces_by_id[piece.piece_id] = piece
+        self.pieces_by_id = pieces_by_id
+
+    def add_custom(self, piece):
+        self.custom.append(piece)
+        self.pieces_by_id[piece.piece_id] = piece
+
     def piece_at(self, index):
-        if self.pawn.bitboard.bit(index):
+        if (self.pawn.bitboard >> index) & 1:
             return self.pawn
-        elif self.rook.bitboard.bit(index):
+        elif (self.rook.bitboard >> index) & 1:
             return self.rook
-        elif self.bishop.bitboard.bit(index):
+        elif (self.bishop.bitboard >> index) & 1:
             return self.bishop
-        elif self.knight.bitboard.bit(index):
+        elif (self.knight.bitboard >> index) & 1:
             return self.knight
-        elif self.queen.bitboard.bit(index):
+        elif (self.queen.bitboard >> index) & 1:
             return self.queen
-        elif self.king.bitboard.bit(index):
+        elif (self.king.bitboard >> index) & 1:
             return self.king
         else:
             for p in self.custom:
-                if p.bitboard.bit(index):
+                if (p.bitboard >> index) & 1:
                     return p
         return None
 
@@ -52,12 +77,8 @@ class PieceSet:
         return return_vec
 
     def update_occupied(self):
-        self.occupied = Bitboard.zero()
-        self.occupied |= self.king.bitboard
-        self.occupied |= self.queen.bitboard
-        self.occupied |= self.bishop.bitboard
-        self.occupied |= self.knight.bitboard
-        self.occupied |= self.rook.bitboard
-        self.occupied |= self.pawn.bitboard
+        occupied = (self.king.bitboard | self.queen.bitboard | self.bishop.bitboard |
+                    self.knight.bitboard | self.rook.bitboard | self.pawn.bitboard)
         for p in self.custom:
-            self.occupied |= p.bitboard
\ No newline at end of file
+            occupied |= p.bitboard
+        self.occupied = occupied
\ No newline at end of file
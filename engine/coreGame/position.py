@@ -1,30 +1,106 @@
+import copy
+import hashlib
+import struct
 from typing import Dict, List, Optional, Tuple
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from .bitboard import *
 from .piece_set import PieceSet
-from .position_properties import PositionProperties
+from .position_properties import PositionProperties, UndoRecord, new_undo_stack, UNDO_STACK_SIZE
 from .movement_pattern import MovementPattern, MovementPatternExternal, external_mp_to_internal, internal_mp_to_external
 from .piece import Piece
-from .move import PieceType, Dimensions, Move, MoveType
-from .zobrist_table import ZobristTable
+from .move import (PieceType, Dimensions, MOVE_TYPE_SHIFT, PROMO_SHIFT, MOVE_NULL, PIECE_IDS, PIECE_TYPES,
+                   NUM_PIECE_IDS, FIRST_CUSTOM_ID, CUSTOM_PIECE_TYPES, PROMOTION_PIECE_IDS, KING_ID, ROOK_ID, PAWN_ID,
+                   MOVE_KINGSIDE_CASTLE, MOVE_QUEENSIDE_CASTLE, CAPTURE_TYPES, PROMOTION_TYPES)
+from .zobrist_table import ZobristTable, ZOBRIST_SEED, get_custom_definitions
+from .shared_tables import Variant, STANDARD_VARIANT, get_shared_zobrist_table, get_shared_variant_id, get_shared_variant
+from .geometry import Geometry, GENERIC_GEOMETRY, STANDARD_GEOMETRY, STANDARD_BOUNDS, convert_bitboard, convert_index
 from .constants import *
 
+'''
+Positions can be packed into a compact binary snapshot with to_bytes or pack_into and read back with
+from_bytes, to hand them to worker processes or keep them in caches.  A snapshot is a fixed header
+followed by the bitboard of every piece of every player, in PieceSet.get_piece_refs order, each stored
+little endian in as many bytes as the geometry needs.  The rules of the game are not in the snapshot,
+only the id of its variant in the registry of shared_tables.py.  from_bytes reads straight from any
+buffer, so snapshots can live in a bytearray, an mmap or a multiprocessing.shared_memory block.
+'''
+
+SNAPSHOT_VERSION = 1
+# version, variant id, players, player to move, boards per player, bytes per board, ep square,
+# kingside rights, queenside rights, castled, zobrist key
+SNAPSHOT_HEADER = struct.Struct('<BHBBBBHBBBQ')
+NO_EP_SQUARE = 0xFFFF
+
+FEN_PIECE_CHARS = frozenset(pt.value for pt in PieceType) | frozenset(pt.value.upper() for pt in PieceType)
+
+
+def parse_fen_board(board: str) -> Tuple[int, int, List[Tuple[int, int, str]], List[Tuple[int, int]]]:
+    # Parses the board field of a FEN into its width, height, pieces as (x, y, char) and holes as (x, y).
+    # The extended FEN allows any board up to 16x16: ranks of any (equal) width, empty runs of more
+    # than one digit, the custom piece letters of PieceType, and 'x' for a square that is not part of the board.
+    ranks = board.split('/')
+    height = len(ranks)
+    width = None
+    placements = []
+    holes = []
+    for row, rank in enumerate(ranks):
+        y = height - 1 - row
+        x = 0
+        empty = 0
+        for c in rank:
+            if c.isdigit():
+                empty = empty * 10 + int(c)
+                continue
+            x += empty
+            empty = 0
+            if c == 'x':
+                holes.append((x, y))
+            elif c in FEN_PIECE_CHARS:
+                placements.append((x, y, c))
+            else:
+                raise ValueError(f"Invalid FEN piece '{c}'")
+            x += 1
+        x += empty
+        if width is None:
+            width = x
+        elif x != width:
+            raise ValueError(f"FEN rank {row + 1} has {x} squares, expected {width}")
+    return width, height, placements, holes
+
 
 
 @dataclass
 class Position:
     '''
     A class to represent a position on the board.
+    Square indexes depend on the geometry of the position, which is compiled from its dimensions
+    with Geometry.compile (see geometry.py).  Plain 8x8 chess gets the 64 bit STANDARD_GEOMETRY,
+    other boards the smallest dense layout that fits them.
+    Alongside the bitboards the position keeps a mailbox, mapping each square to the (owner, piece)
+    standing on it or None, and the piece list of every piece, both updated incrementally by
+    move_piece, _remove_piece and _add_piece, which also keep the occupied bitboards up to date.
+    Moves are taken back with the undo stack, a list of UndoRecords of which the first ply are in use.
+    The records are allocated when the position makes its first move, the stack doubles whenever it runs out
+    and the records are reused after that.
     '''
     dimensions: Dimensions
-    bounds: Bitboard
+    bounds: int
     num_players: int
     whos_turn: int
     movement_rules: Dict[PieceType, MovementPattern]
     pieces: List[PieceSet]
-    occupied: Bitboard
+    occupied: int
     properties: PositionProperties
     ZOBRIST_TABLE: ZobristTable
+    geometry: Geometry
+    mailbox: List[Optional[Tuple[int, Piece]]] = field(default_factory=list)
+    undo_stack: List[UndoRecord] = field(default_factory=list)
+    ply: int = 0
+    variant_id: Optional[int] = None # see get_variant_id, None until a snapshot needs it
+    movement_table: List[Optional[MovementPattern]] = field(default_factory=list) # movement_rules indexed by piece id
+
+    def __post_init__(self):
+        self.update_movement_table()
 
     @classmethod
     def default(cls) -> 'Position':
@@ -33,37 +109,24 @@ class Position:
 
     def register_piecetype(self, char_rep: str, mpe: MovementPatternExternal):
         # Registers a custom piece type with a movement pattern.
-        mp = external_mp_to_internal(mpe)
+        mp = external_mp_to_internal(mpe, self.geometry, self.bounds)
+        self.variant_id = None
 
         for i, p in enumerate(self.pieces):
-            match len(p.custom):
-                case 0:
-                    p.custom.append(Piece.blank_custom1(i))
-                    self.movement_rules[PieceType.Custom1] = mp
-                case 1:
-                    p.custom.append(Piece.blank_custom2(i))
-                    self.movement_rules[PieceType.Custom2] = mp
-                case 2:
-                    p.custom.append(Piece.blank_custom3(i))
-                    self.movement_rules[PieceType.Custom3] = mp
-                case 3:
-                    p.custom.append(Piece.blank_custom4(i))
-                    self.movement_rules[PieceType.Custom4] = mp
-                case 4:
-                    p.custom.append(Piece.blank_custom5(i))
-                    self.movement_rules[PieceType.Custom5] = mp
-                case 5:
-                    p.custom.append(Piece.blank_custom6(i))
-                    self.movement_rules[PieceType.Custom6] = mp
-                case _:
-                    raise ValueError("Too many custom pieces")
+            if len(p.custom) == len(CUSTOM_PIECE_TYPES):
+                raise ValueError("Too many custom pieces")
+            piece_type = CUSTOM_PIECE_TYPES[len(p.custom)]
+            p.add_custom(Piece(i, piece_type.value, piece_type, 0))
+            self.movement_rules[piece_type] = mp
+        self.update_movement_table()
+        self.update_zobrist_table()
 
     def get_char_movementpattern_map(self) -> Dict[str, MovementPatternExternal]:
         # Returns a map of piece type characters to their movement patterns.
         return_map = {}
         for piece_type, movement_pattern in self.movement_rules.items():
-            if isinstance(piece_type, PieceType.Custom):
-                return_map[piece_type.value] = internal_mp_to_external(movement_pattern)
+            if piece_type.is_custom():
+                return_map[piece_type.value] = internal_mp_to_external(movement_pattern, self.geometry)
         return return_map
 
     def get_movement_pattern(self, piece_type: PieceType) -> Optional[MovementPattern]:
@@ -71,164 +134,288 @@ class Position:
         return self.movement_rules.get(piece_type)
 
     def set_bounds(self, dims: Dimensions, bounds: Bitboard):
-        # Sets the bounds of the position.
+        # Sets the bounds of the position, bounds are given in the generic 16x16 layout.
+        self.relayout(GENERIC_GEOMETRY)
         self.dimensions = dims
-        self.bounds = bounds
+        self.bounds = bb_value(bounds)
+        self.variant_id = None
+        self.relayout(self.compile_geometry())
+        self.compile_movement_rules()
+
+    def compile_movement_rules(self):
+        # Compiles the movement patterns for the geometry and bounds of the position.
+        # Patterns can be shared with clones and variants, so a pattern is copied before it is recompiled.
+        for piece_type, mp in self.movement_rules.items():
+            if mp.geometry is not self.geometry or mp.bounds != self.bounds:
+                mp = self.movement_rules[piece_type] = copy.copy(mp)
+                mp.compile(self.geometry, self.bounds)
+        self.update_movement_table()
+
+    def update_movement_table(self):
+        # Rebuilds movement_table from movement_rules
+        movement_table = [None] * NUM_PIECE_IDS
+        for piece_type, mp in self.movement_rules.items():
+            movement_table[PIECE_IDS[piece_type]] = mp
+        self.movement_table = movement_table
+
+    def compile_geometry(self) -> Geometry:
+        # Returns the smallest geometry that fits the dimensions of the position.
+        return Geometry.compile(self.dimensions.width, self.dimensions.height)
+
+    def relayout(self, geometry: Geometry):
+        # Moves the position over to another geometry, converting every bitboard and rebuilding
+        # the zobrist table for the new squares.
+        # The move history is dropped since the moves in it refer to the old indexes.
+        old = self.geometry
+        if geometry is old:
+            return
+        for ps in self.pieces:
+            for piece in ps.get_piece_refs():
+                piece.bitboard = convert_bitboard(piece.bitboard, old, geometry)
+        for piece_type, mp in self.movement_rules.items():
+            if mp.promotion_squares:
+                mp = self.movement_rules[piece_type] = copy.copy(mp)
+                mp.promotion_squares = convert_bitboard(mp.promotion_squares, old, geometry)
+        self.bounds = convert_bitboard(self.bounds, old, geometry)
+        if self.properties.ep_square is not None:
+            self.properties.ep_square = convert_index(self.properties.ep_square, old, geometry)
+        self.properties.move_played = None
+        self.ply = 0
+        self.variant_id = None
+        self.properties.check_info = None
+        self.properties.attack_maps = None
+        self.geometry = geometry
+        self.update_mailbox()
+        self.update_occupied()
+        self.compile_movement_rules()
+        self.update_zobrist_table()
+
+    def update_zobrist_table(self):
+        # Looks up the shared zobrist table for the geometry and the custom pieces of the position,
+        # and recomputes the keys with it
+        custom_types = [p.piece_type for p in self.pieces[0].custom]
+        self.ZOBRIST_TABLE = get_shared_zobrist_table(
+            self.geometry.num_squares, get_custom_definitions(self.movement_rules, custom_types, self.geometry))
+        self.update_keys()
+
+    def update_keys(self):
+        # Recomputes the zobrist, pawn and material keys from scratch, after the board was set directly
+        props = self.properties
+        props.zobrist_key = self.compute_zobrist_key()
+        props.pawn_key = self.compute_pawn_key()
+        props.material_key = self.compute_material_key()
+
+    def compute_zobrist_key(self) -> int:
+        # Computes the zobrist key of the position from scratch,
+        # from the pieces, the castling rights, the ep square and the player to move.
+        # make_move flips the to move key every ply, so it is in the key when the second player is to move.
+        zobrist_table = self.ZOBRIST_TABLE
+        castling_rights = self.properties.castling_rights
+        zobrist_key = 0
+        if self.whos_turn % 2:
+            zobrist_key ^= zobrist_table.get_to_move_zobrist(self.whos_turn)
+        for player_num in range(self.num_players):
+            if castling_rights.can_player_castle_kingside(player_num):
+                zobrist_key ^= zobrist_table.get_castling_zobrist(player_num, True)
+            if castling_rights.can_player_castle_queenside(player_num):
+                zobrist_key ^= zobrist_table.get_castling_zobrist(player_num, False)
 
-    def make_move(self, move_: Move):
-        # Makes a move on the board.
+        for ps in self.pieces:
+            for piece in ps.get_piece_refs():
+                for index in piece.squares:
+                    zobrist_key ^= zobrist_table.get_zobrist_sq(piece, index)
+
+        if self.properties.ep_square is not None:
+            zobrist_key ^= zobrist_table.get_ep_zobrist_file(self.geometry.from_index(self.properties.ep_square)[0])
+        return zobrist_key
+
+    def compute_pawn_key(self) -> int:
+        # Computes the pawn key of the position from scratch, the keys of every pawn on its square
+        zobrist = self.ZOBRIST_TABLE.zobrist
+        pawn_key = 0
+        for player_num, ps in enumerate(self.pieces):
+            pawn_keys = zobrist[player_num][PAWN_ID]
+            for index in ps.pawn.squares:
+                pawn_key ^= pawn_keys[index]
+        return pawn_key
+
+    def compute_material_key(self) -> int:
+        # Computes the material key of the position from scratch, for n pieces of a kind the keys of squares 0 to n - 1
+        zobrist = self.ZOBRIST_TABLE.zobrist
+        material_key = 0
+        for player_num, ps in enumerate(self.pieces):
+            for piece in ps.get_piece_refs():
+                piece_keys = zobrist[player_num][piece.piece_id]
+                for count in range(len(piece.squares)):
+                    material_key ^= piece_keys[count]
+        return material_key
+
+    def make_move(self, move_: int):
+        # Makes a move on the board, moves are plain ints (see move.py).
+        # The properties are updated in place, after saving them to the next record of the undo stack.
         zobrist_table = self.ZOBRIST_TABLE
+        to_index = self.geometry.to_index
+        from_index = self.geometry.from_index
+        props = self.properties
         my_player_num = self.whos_turn  # player who's making the move
         self.whos_turn = (self.whos_turn + 1) % self.num_players # opponent becomes the next player
 
-        new_props = self.properties.copy() # copy the properties to pass to the new position
-        new_props.zobrist_key ^= zobrist_table.get_to_move_zobrist(self.whos_turn) # invert the turn zonbrist signature
-
-        move_type = move_.get_move_type()
-
-        if move_type == 'Null':
-            new_props.ep_square = None
-            new_props.move_played = move_
-            new_props.prev_properties = self.properties
-            self.properties = new_props
+        undo_stack = self.undo_stack
+        if self.ply == len(undo_stack):
+            undo_stack.extend(new_undo_stack(max(UNDO_STACK_SIZE, len(undo_stack))))
+        undo_stack[self.ply].save(props)
+        self.ply += 1
+
+        zobrist_key = props.zobrist_key ^ zobrist_table.get_to_move_zobrist(self.whos_turn) # invert the turn zobrist signature
+        ep_square = props.ep_square
+        props.move_played = move_
+        props.promote_from = None
+        props.captured_piece = None
+        props.check_info = None
+        props.attack_maps = None
+
+        move_type = (move_ >> MOVE_TYPE_SHIFT) & 7
+
+        if move_type == MOVE_NULL:
+            if ep_square is not None:
+                zobrist_key ^= zobrist_table.get_ep_zobrist_file(from_index(ep_square)[0])
+                props.ep_square = None
+            props.zobrist_key = zobrist_key
             return
 
+        from_ = move_ & 255
+        to = (move_ >> 8) & 255
+        from_id = self.mailbox[from_][1].piece_id
+        my_keys = zobrist_table.zobrist[my_player_num]
+        castling_rights = props.castling_rights
+        rook_info = None
+
         # Handle the capture of a piece
-        if move_type in ['Capture', 'PromotionCapture']:
-            capt_index = move_.get_target()
-            owner, captd = self.piece_at(capt_index)
-            captd_piece_type = captd.piece_type
-            captd_owner = captd.player_num
-            new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(captd_piece_type, captd_owner, capt_index)
-            new_props.captured_piece = (owner, captd_piece_type)
+        if (CAPTURE_TYPES >> move_type) & 1:
+            capt_index = (move_ >> 16) & 255
+            captured = self.mailbox[capt_index]
+            captd = captured[1]
+            captd_keys = zobrist_table.zobrist[captd.player_num][captd.piece_id]
+            zobrist_key ^= captd_keys[capt_index]
+            if captd.piece_id == PAWN_ID:
+                props.pawn_key ^= captd_keys[capt_index]
+            props.captured_piece = captured
             self._remove_piece(capt_index)
-
-        # Handle castling
-        elif move_type == 'KingsideCastle':
-            rook_from = move_.get_target()
-            x, y = from_index(move_.get_to())
-            rook_to = to_index(x - 1, y)
-            new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(PieceType.Rook, my_player_num, rook_from)
-            new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(PieceType.Rook, my_player_num, rook_to)
-            self.move_piece(rook_from, rook_to)
-            new_props.castling_rights.set_player_castled(my_player_num)
-
-        elif move_type == 'QueensideCastle':
-            rook_from = move_.get_target()
-            x, y = from_index(move_.get_to())
-            rook_to = to_index(x + 1, y)
-            new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(PieceType.Rook, my_player_num, rook_from)
-            new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(PieceType.Rook, my_player_num, rook_to)
-            self.move_piece(rook_from, rook_to)
-            new_props.castling_rights.set_player_castled(my_player_num)
+            props.material_key ^= captd_keys[len(captd.squares)]
+
+        # Handle castling, the rook is lifted off the board while the king moves, as either piece may
+        # land on the square the other one left
+        elif move_type == MOVE_KINGSIDE_CASTLE or move_type == MOVE_QUEENSIDE_CASTLE:
+            rook_from = (move_ >> 16) & 255
+            x, y = from_index(to)
+            rook_to = to_index(x - 1, y) if move_type == MOVE_KINGSIDE_CASTLE else to_index(x + 1, y)
+            zobrist_key ^= my_keys[ROOK_ID][rook_from] ^ my_keys[ROOK_ID][rook_to]
+            rook_info = self.mailbox[rook_from]
+            self._remove_piece(rook_from)
+            castling_rights.set_player_castled(my_player_num)
 
         # Handle the movement of a piece - happens for all non-null moves
-        from_ = move_.get_from()
-        to = move_.get_to()
-        from_piece = self.piece_at(from_)[1]
-        from_piece_type = from_piece.piece_type
-        new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(from_piece_type, my_player_num, from_)
-        new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(from_piece_type, my_player_num, to)
+        zobrist_key ^= my_keys[from_id][from_] ^ my_keys[from_id][to]
+        if from_id == PAWN_ID:
+            props.pawn_key ^= my_keys[PAWN_ID][from_] ^ my_keys[PAWN_ID][to]
 
         self.move_piece(from_, to)
 
+        if rook_info is not None:
+            self._place_piece(rook_info, rook_to)
+
         # Handle promotion
-        if move_type in ['PromotionCapture', 'Promotion']:
-            new_props.promote_from = from_piece_type
-            new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(from_piece_type, my_player_num, to)
+        if (PROMOTION_TYPES >> move_type) & 1:
+            props.promote_from = from_id
+            if from_id == PAWN_ID:
+                props.pawn_key ^= my_keys[PAWN_ID][to]
+            pieces_by_id = self.pieces[my_player_num].pieces_by_id
             self._remove_piece(to)
-            promote_to_pt = PieceType.from_char(move_.get_promotion_char())
-            new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(promote_to_pt, my_player_num, to)
-            self._add_piece(my_player_num, promote_to_pt, to)
+            promote_to = PROMOTION_PIECE_IDS[move_ >> PROMO_SHIFT]
+            zobrist_key ^= my_keys[from_id][to] ^ my_keys[promote_to][to]
+            props.material_key ^= (my_keys[from_id][len(pieces_by_id[from_id].squares)] ^
+                                   my_keys[promote_to][len(pieces_by_id[promote_to].squares)])
+            self._add_piece_id(my_player_num, promote_to, to)
 
         x1, y1 = from_index(from_)
         x2, y2 = from_index(to)
 
         # revert the ep square if needed
-        if self.properties.ep_square is not None:
-            epx, _ = from_index(self.properties.ep_square)
-            new_props.zobrist_key ^= zobrist_table.get_ep_zobrist_file(epx)
+        if ep_square is not None:
+            zobrist_key ^= zobrist_table.get_ep_zobrist_file(from_index(ep_square)[0])
 
         # Handle en passant if 2-square pawn move
-        if from_piece_type == PieceType.Pawn and abs(y2 - y1) == 2 and x1 == x2:
+        if from_id == PAWN_ID and abs(y2 - y1) == 2 and x1 == x2:
             if y2 > y1:
-                new_props.ep_square = to_index(x1, y2 - 1)
+                props.ep_square = to_index(x1, y2 - 1)
             else:
-                new_props.ep_square = to_index(x1, y2 + 1)
-            new_props.zobrist_key ^= zobrist_table.get_ep_zobrist_file(x1)
+                props.ep_square = to_index(x1, y2 + 1)
+            zobrist_key ^= zobrist_table.get_ep_zobrist_file(x1)
         else:
-            new_props.ep_square = None
-
-        # Handle castling rights
-        if new_props.castling_rights.can_player_castle(my_player_num):
-            if from_piece_type == PieceType.King:
-                new_props.zobrist_key ^= zobrist_table.get_castling_zobrist(my_player_num, True)
-                new_props.zobrist_key ^= zobrist_table.get_castling_zobrist(my_player_num, False)
-                new_props.castling_rights.disable_kingside_castle(my_player_num)
-                new_props.castling_rights.disable_queenside_castle(my_player_num)
-            elif from_piece_type == PieceType.Rook:
+            props.ep_square = None
+
+        # Handle castling rights, only the rights the player still holds are taken out of the key
+        if castling_rights.can_player_castle(my_player_num):
+            kingside = castling_rights.can_player_castle_kingside(my_player_num)
+            queenside = castling_rights.can_player_castle_queenside(my_player_num)
+            if from_id == KING_ID:
+                if kingside:
+                    zobrist_key ^= zobrist_table.get_castling_zobrist(my_player_num, True)
+                if queenside:
+                    zobrist_key ^= zobrist_table.get_castling_zobrist(my_player_num, False)
+                castling_rights.disable_kingside_castle(my_player_num)
+                castling_rights.disable_queenside_castle(my_player_num)
+            elif from_id == ROOK_ID:
                 if x1 >= self.dimensions.width // 2:
-                    new_props.castling_rights.disable_kingside_castle(my_player_num)
-                    new_props.zobrist_key ^= zobrist_table.get_castling_zobrist(my_player_num, True)
-                else:
-                    new_props.castling_rights.disable_queenside_castle(my_player_num)
-                    new_props.zobrist_key ^= zobrist_table.get_castling_zobrist(my_player_num, False)
+                    if kingside:
+                        castling_rights.disable_kingside_castle(my_player_num)
+                        zobrist_key ^= zobrist_table.get_castling_zobrist(my_player_num, True)
+                elif queenside:
+                    castling_rights.disable_queenside_castle(my_player_num)
+                    zobrist_key ^= zobrist_table.get_castling_zobrist(my_player_num, False)
 
-        # Update the properties
-        new_props.prev_properties = self.properties
-        new_props.move_played = move_
-        self.properties = new_props
-        self.update_occupied()
+        props.zobrist_key = zobrist_key
 
     def unmake_move(self):
-        # Reverts the last move made on the board.
-        if self.whos_turn == 0:
-            self.whos_turn = self.num_players - 1
-        else:
-            self.whos_turn = (self.whos_turn - 1) % self.num_players
+        # Reverts the last move made on the board, restoring the properties from the undo stack.
+        to_index = self.geometry.to_index
+        from_index = self.geometry.from_index
+        props = self.properties
+        self.whos_turn = (self.whos_turn - 1) % self.num_players
+        self.ply -= 1
 
-        # revert the properties of the position
         my_player_num = self.whos_turn
-        move_ = self.properties.move_played
-        move_type = move_.get_move_type()
-
-        if move_type == 'Null':
-            self.properties = self.properties.get_prev()
-            return
-
-        from_ = move_.get_from()
-        to = move_.get_to()
-
-        self.move_piece(to, from_)
-
-        # Handle special moves
-        if move_type in ['PromotionCapture', 'Promotion']:
-            self._remove_piece(from_)
-            self._add_piece(my_player_num, self.properties.promote_from, from_)
-
-        if move_type in ['Capture', 'PromotionCapture']:
-            capt = move_.get_target()
-            owner, pt = self.properties.captured_piece
-            self._add_piece(owner, pt, capt)
+        move_ = props.move_played
+        move_type = (move_ >> MOVE_TYPE_SHIFT) & 7
+
+        if move_type != MOVE_NULL:
+            from_ = move_ & 255
+            to = (move_ >> 8) & 255
+
+            if move_type == MOVE_KINGSIDE_CASTLE or move_type == MOVE_QUEENSIDE_CASTLE:
+                rook_from = (move_ >> 16) & 255
+                x, y = from_index(to)
+                rook_to = to_index(x - 1, y) if move_type == MOVE_KINGSIDE_CASTLE else to_index(x + 1, y)
+                rook_info = self.mailbox[rook_to]
+                self._remove_piece(rook_to)
+                self.move_piece(to, from_)
+                self._place_piece(rook_info, rook_from)
+            else:
+                self.move_piece(to, from_)
 
-        elif move_type == 'KingsideCastle':
-            rook_from = move_.get_target()
-            x, y = from_index(move_.get_to())
-            rook_to = to_index(x - 1, y)
-            self.move_piece(rook_to, rook_from)
+                if (PROMOTION_TYPES >> move_type) & 1:
+                    self._remove_piece(from_)
+                    self._add_piece_id(my_player_num, props.promote_from, from_)
 
-        elif move_type == 'QueensideCastle':
-            rook_from = move_.get_target()
-            x, y = from_index(move_.get_to())
-            rook_to = to_index(x + 1, y)
-            self.move_piece(rook_to, rook_from)
+                if (CAPTURE_TYPES >> move_type) & 1:
+                    self._place_piece(props.captured_piece, (move_ >> 16) & 255)
 
-        self.properties = self.properties.get_prev()
-        self.update_occupied()
+        self.undo_stack[self.ply].restore(props)
 
     def to_string(self) -> str:
         # Returns a string representation of the board.
         return_str = ""
+        to_index = self.geometry.to_index
         for y in range(self.dimensions.height - 1, -1, -1):
             return_str = f"{return_str} {y} "
             for x in range(self.dimensions.width):
@@ -253,12 +440,9 @@ class Position:
         tuples = []
         for i, ps in enumerate(self.pieces):
             for piece in ps.get_piece_refs():
-                bb_copy = piece.bitboard.copy()
-                while not bb_copy.is_zero():
-                    indx = bb_copy.lowest_one()
-                    x, y = from_index(indx)
+                for indx in sorted(piece.squares):
+                    x, y = self.geometry.from_index(indx)
                     tuples.append((i, x, y, piece.char_rep))
-                    bb_copy.set_bit(indx, False)
         return tuples
 
     def tiles_as_tuples(self) -> List[Tuple[int, int, str]]:
@@ -273,163 +457,250 @@ class Position:
                     squares.append((x, y, "x"))
         return squares
     
+    @classmethod
+    def empty(cls, dims: Dimensions, bounds: int, geometry: Geometry, movement_rules: Optional[Dict[PieceType, MovementPattern]] = None,
+              custom_types: Tuple[PieceType, ...] = (), variant_id: Optional[int] = None,
+              zobrist_table: Optional[ZobristTable] = None) -> 'Position':
+        # Creates a position for two players without any pieces, bounds are given in the layout of the geometry.
+        # Custom pieces are created for the custom_types, whose patterns have to be in movement_rules already.
+        if movement_rules is None:
+            movement_rules = {}
+        if zobrist_table is None:
+            zobrist_table = get_shared_zobrist_table(geometry.num_squares,
+                                                     get_custom_definitions(movement_rules, custom_types, geometry))
+        pieces = [PieceSet.new(0), PieceSet.new(1)]
+        for player_num, ps in enumerate(pieces):
+            for pt in custom_types:
+                ps.add_custom(Piece(player_num, pt.value, pt, 0))
+        pos = cls(
+            whos_turn=0,
+            num_players=2,
+            dimensions=dims,
+            pieces=pieces,
+            occupied=0,
+            bounds=bounds,
+            properties=PositionProperties.default(),
+            movement_rules=movement_rules,
+            ZOBRIST_TABLE=zobrist_table,
+            geometry=geometry,
+            mailbox=[None] * geometry.num_squares,
+            variant_id=variant_id
+        )
+        return pos
+
+    @classmethod
+    def from_variant(cls, variant_id: int) -> 'Position':
+        # Creates an empty position with the rules of a registered variant, see shared_tables.py
+        variant = get_shared_variant(variant_id)
+        return cls.empty(variant.dimensions, variant.bounds, variant.geometry, dict(variant.movement_rules),
+                         variant.custom_types, variant_id, variant.zobrist_table)
+
     @classmethod
     def custom(cls, dims: Dimensions, bounds: Bitboard, movement_patterns: Dict[str, MovementPatternExternal], pieces: List[Tuple[int, int, PieceType]]):
         # Creates a new position with custom parameters.
         # Movement patterns are represented as a dictionary of piece type characters to movement patterns for custom pieces.
-        pos = Position.from_fen(EMPTY_FEN)
-        pos.dimensions = dims
-        pos.bounds = bounds
-        
+        # Bounds and piece indexes are given in the generic 16x16 layout, they are converted to the
+        # compiled geometry of the dimensions before anything is placed.
+        geometry = Geometry.compile(dims.width, dims.height)
+        pos = cls.empty(dims, convert_bitboard(bb_value(bounds), GENERIC_GEOMETRY, geometry), geometry)
+        for player_num in range(pos.num_players):
+            pos.properties.castling_rights.disable_kingside_castle(player_num)
+            pos.properties.castling_rights.disable_queenside_castle(player_num)
+
         # Register the movement patterns
         for chr, mpe in movement_patterns.items():
             pos.register_piecetype(chr, mpe)
-        
+
         # Add the pieces
         for owner, index, piece_type in pieces:
-            pos.add_piece(owner, piece_type, index)
-        
-        return pos  
-    
-    @classmethod
-    def from_fen(cls, fen: str) -> 'Position':
-        # Creates a new position from a FEN string.
-        dims = Dimensions(width=DEFAULT_WIDTH, height=DEFAULT_HEIGHT)
-
-        # Initialize the pieces
-        wb_pieces = []
-        w_pieces = PieceSet.new(0)
-        b_pieces = PieceSet.new(1)
-
-        x = 0
-        y = 7
-        field = 0
-
-        whos_turn = 0
-        can_w_castle_k = False
-        can_b_castle_k = False
-        can_w_castle_q = False
-        can_b_castle_q = False
-
-        # Parse the FEN string and place all of the pieces
-        for c in fen:
-            if c == ' ':
-                field += 1
-            elif field == 0:  # position
-                if c == '/':
-                    x = 0
-                    y -= 1
-                    continue
-                elif c.isdigit():
-                    x += int(c)
-                    continue
-
-                index = to_index(x, y)
-                piece_map = {
-                    'k': (w_pieces.king.bitboard, b_pieces.king.bitboard),
-                    'q': (w_pieces.queen.bitboard, b_pieces.queen.bitboard),
-                    'r': (w_pieces.rook.bitboard, b_pieces.rook.bitboard),
-                    'b': (w_pieces.bishop.bitboard, b_pieces.bishop.bitboard),
-                    'n': (w_pieces.knight.bitboard, b_pieces.knight.bitboard),
-                    'p': (w_pieces.pawn.bitboard, b_pieces.pawn.bitboard)
-                }
-                if c.lower() in piece_map:
-                    bitboard = piece_map[c.lower()][0] if c.isupper() else piece_map[c.lower()][1]
-                    bitboard.set_bit(index, True)
-                    if c.isupper():
-                        w_pieces.occupied.set_bit(index, True)
-                    else:
-                        b_pieces.occupied.set_bit(index, True)
-                    x += 1
-
-            elif field == 1:  # next to move
-                if c == 'w':
-                    whos_turn = 0
-                else:
-                    whos_turn = 1
-            elif field == 2:  # Castling rights
-                if c == 'K':
-                    can_w_castle_k = True
-                elif c == 'Q':
-                    can_w_castle_q = True
-                elif c == 'k':
-                    can_b_castle_k = True
-                elif c == 'q':
-                    can_b_castle_q = True
-            elif field == 3:  # EP square
-                # TODO: Implement EP square
-                continue
+            pos._add_piece(owner, piece_type, convert_index(index, GENERIC_GEOMETRY, geometry))
 
-        # Create the occupied bitboard
-        occupied = Bitboard.zero()
-        occupied |= w_pieces.occupied
-        occupied |= b_pieces.occupied
-        zobrist_table = ZobristTable()
-        zobrist_key = 0
-
-        # set the zobrist key
-        properties = PositionProperties.default()
-        zobrist_key ^= zobrist_table.get_castling_zobrist(0, True)
-        zobrist_key ^= zobrist_table.get_castling_zobrist(0, False)
-        zobrist_key ^= zobrist_table.get_castling_zobrist(1, True)
-        zobrist_key ^= zobrist_table.get_castling_zobrist(1, False)
-
-        if not can_w_castle_k:
-            properties.castling_rights.disable_kingside_castle(0)
-            zobrist_key ^= zobrist_table.get_castling_zobrist(0, True)
-        if not can_b_castle_k:
-            properties.castling_rights.disable_kingside_castle(1)
-            zobrist_key ^= zobrist_table.get_castling_zobrist(1, True)
-        if not can_w_castle_q:
-            properties.castling_rights.disable_queenside_castle(0)
-            zobrist_key ^= zobrist_table.get_castling_zobrist(0, False)
-        if not can_b_castle_q:
-            properties.castling_rights.disable_queenside_castle(1)
-            zobrist_key ^= zobrist_table.get_castling_zobrist(1, False)
-
-        for piece in w_pieces.get_piece_refs() + b_pieces.get_piece_refs():
-            bb_copy = piece.bitboard.copy()
-            while not bb_copy.is_zero():
-                indx = bb_copy.lowest_one()
-                zobrist_key ^= zobrist_table.get_zobrist_sq(piece, indx)
-                bb_copy.set_bit(indx, False)
-
-        properties.zobrist_key = zobrist_key
+        pos.update_keys()
+        return pos
 
-        wb_pieces.append(w_pieces)
-        wb_pieces.append(b_pieces)
+    @classmethod
+    def from_fen(cls, fen: str, movement_patterns: Optional[Dict[str, MovementPatternExternal]] = None,
+                 variant_id: Optional[int] = None) -> 'Position':
+        # Creates a new position from a FEN string, or from the extended FEN described at parse_fen_board.
+        # A plain 8x8 board without custom pieces is standard chess, which uses the standard geometry.
+        # Any other board gets its own geometry, with the custom pieces of movement_patterns registered
+        # in order like Position.custom does.  Positions of an already registered variant can be read
+        # by passing its id instead, which shares the compiled movement patterns of the variant.
+        fields = fen.split()
+        width, height, placements, holes = parse_fen_board(fields[0])
+        if variant_id is None and not movement_patterns and width == DEFAULT_WIDTH and height == DEFAULT_HEIGHT and not holes:
+            variant_id = STANDARD_VARIANT
+
+        if variant_id is not None:
+            pos = cls.from_variant(variant_id)
+            if pos.dimensions != Dimensions(width, height):
+                raise ValueError(f"FEN board is {width}x{height}, the variant is {pos.dimensions.width}x{pos.dimensions.height}")
+            geometry = pos.geometry
+        else:
+            geometry = Geometry.compile(width, height)
+        to_index = geometry.to_index
+        rank = (1 << width) - 1
+        bounds = 0
+        for y in range(height):
+            bounds |= rank << to_index(0, y)
+        for x, y in holes:
+            bounds &= ~(1 << to_index(x, y))
+
+        if variant_id is None:
+            pos = cls.empty(Dimensions(width, height), bounds, geometry)
+            for chr, mpe in (movement_patterns or {}).items():
+                pos.register_piecetype(chr, mpe)
+        elif bounds != pos.bounds:
+            raise ValueError("FEN holes don't match the bounds of the variant")
+
+        # Place the pieces, white pieces are upper case
+        fen_pieces = {}
+        for owner, ps in enumerate(pos.pieces[:2]):
+            for piece in ps.get_piece_refs():
+                fen_pieces[piece.piece_type.value.upper() if owner == 0 else piece.piece_type.value] = piece
+        for x, y, c in placements:
+            piece = fen_pieces.get(c)
+            if piece is None:
+                raise ValueError(f"FEN has a custom piece '{c}' without a movement pattern")
+            piece.bitboard |= 1 << to_index(x, y)
+        pos.update_occupied()
+        pos.update_mailbox()
+
+        # Next to move, castling rights and the EP square
+        pos.whos_turn = 1 if len(fields) > 1 and fields[1] == 'b' else 0
+        castling = fields[2] if len(fields) > 2 else '-'
+        castling_rights = pos.properties.castling_rights
+        if 'K' not in castling:
+            castling_rights.disable_kingside_castle(0)
+        if 'k' not in castling:
+            castling_rights.disable_kingside_castle(1)
+        if 'Q' not in castling:
+            castling_rights.disable_queenside_castle(0)
+        if 'q' not in castling:
+            castling_rights.disable_queenside_castle(1)
+        if len(fields) > 3 and fields[3] != '-':
+            ep = fields[3]
+            if ep[0] not in FILE_TO_INT or not ep[1:].isdigit():
+                raise ValueError(f"Invalid FEN en passant square '{ep}'")
+            pos.properties.ep_square = to_index(FILE_TO_INT[ep[0]], int(ep[1:]) - 1)
+
+        pos.update_keys()
+        return pos
 
-        bounds = Bitboard.zero()
-        for x in range(8):
-            for y in range(8):
-                bounds.set_bit(to_index(x, y), True)
+    def get_zobrist(self) -> int:
+        return self.properties.zobrist_key
 
-        pos = cls(
-            whos_turn=whos_turn,
-            num_players=2,
-            dimensions=dims,
-            pieces=wb_pieces,
-            occupied=occupied,
-            bounds=bounds,
+    def clone(self) -> 'Position':
+        # Returns a copy of the position that shares its movement patterns and tables.
+        # Like relayout it drops the move history, the undo stack of the clone grows as moves are made on it.
+        properties = self.properties.copy()
+        properties.move_played = None
+        properties.promote_from = None
+        properties.captured_piece = None
+        pos = Position(
+            dimensions=self.dimensions,
+            bounds=self.bounds,
+            num_players=self.num_players,
+            whos_turn=self.whos_turn,
+            movement_rules=dict(self.movement_rules),
+            pieces=[ps.copy() for ps in self.pieces],
+            occupied=self.occupied,
             properties=properties,
-            movement_rules={},
-            ZOBRIST_TABLE=zobrist_table
+            ZOBRIST_TABLE=self.ZOBRIST_TABLE,
+            geometry=self.geometry,
+            variant_id=self.variant_id
         )
-
+        pos.update_mailbox()
         return pos
 
-    def get_zobrist(self) -> int:
-        return self.properties.zobrist_key
+    def get_variant_id(self) -> int:
+        # Returns the id of the rules of the position in the shared variant registry, registering them if needed
+        if self.variant_id is None:
+            custom_types = tuple(p.piece_type for p in self.pieces[0].custom)
+            key = (self.dimensions.width, self.dimensions.height, self.bounds, self.geometry, self.num_players,
+                   tuple((pt.value, str(internal_mp_to_external(self.movement_rules[pt], self.geometry)))
+                         for pt in custom_types))
+            variant = Variant(self.dimensions, self.bounds, self.geometry, self.num_players,
+                              custom_types, dict(self.movement_rules), self.ZOBRIST_TABLE)
+            self.variant_id = get_shared_variant_id(key, variant)
+        return self.variant_id
+
+    def get_variant_digest(self) -> bytes:
+        # Returns a digest of the rules of the position and of its zobrist keys that is the same in every process,
+        # for data keyed by zobrist keys that outlives the process, like a saved transposition table
+        definition = repr((ZOBRIST_SEED, self.dimensions.width, self.dimensions.height, self.bounds,
+                           self.geometry.num_squares, self.num_players, self.ZOBRIST_TABLE.custom_definitions))
+        return hashlib.blake2b(definition.encode(), digest_size=16).digest()
+
+    def snapshot_size(self) -> int:
+        # Returns the number of bytes to_bytes and pack_into write for the position
+        board_bytes = (self.geometry.num_squares + 7) // 8
+        return SNAPSHOT_HEADER.size + board_bytes * sum(len(ps.get_piece_refs()) for ps in self.pieces)
+
+    def pack_into(self, buffer, offset: int = 0) -> int:
+        # Writes a snapshot of the position into a writable buffer at offset, returns its size
+        props = self.properties
+        castling_rights = props.castling_rights
+        board_bytes = (self.geometry.num_squares + 7) // 8
+        start = offset
+        SNAPSHOT_HEADER.pack_into(
+            buffer, offset, SNAPSHOT_VERSION, self.get_variant_id(), self.num_players, self.whos_turn,
+            len(self.pieces[0].get_piece_refs()), board_bytes,
+            NO_EP_SQUARE if props.ep_square is None else props.ep_square,
+            castling_rights.kingside_rights, castling_rights.queenside_rights, castling_rights.castled,
+            props.zobrist_key)
+        offset += SNAPSHOT_HEADER.size
+        with memoryview(buffer) as view:
+            for ps in self.pieces:
+                for piece in ps.get_piece_refs():
+                    view[offset:offset + board_bytes] = piece.bitboard.to_bytes(board_bytes, 'little')
+                    offset += board_bytes
+        return offset - start
+
+    def to_bytes(self) -> bytes:
+        # Returns a snapshot of the position, see from_bytes
+        buffer = bytearray(self.snapshot_size())
+        self.pack_into(buffer)
+        return bytes(buffer)
+
+    @classmethod
+    def from_bytes(cls, buffer, offset: int = 0) -> 'Position':
+        # Creates a position from a snapshot written by to_bytes or pack_into, reading it in place from the buffer.
+        (version, variant_id, num_players, whos_turn, num_boards, board_bytes, ep_square,
+         kingside_rights, queenside_rights, castled, zobrist_key) = SNAPSHOT_HEADER.unpack_from(buffer, offset)
+        if version != SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported snapshot version {version}")
+        variant = get_shared_variant(variant_id)
+        if (num_players != variant.num_players or num_boards != FIRST_CUSTOM_ID + len(variant.custom_types) or
+                board_bytes != (variant.geometry.num_squares + 7) // 8):
+            raise ValueError("Snapshot does not match its variant")
+        offset += SNAPSHOT_HEADER.size
+
+        pos = cls.from_variant(variant_id)
+        with memoryview(buffer) as view:
+            for ps in pos.pieces:
+                for piece in ps.get_piece_refs():
+                    piece.bitboard = int.from_bytes(view[offset:offset + board_bytes], 'little')
+                    offset += board_bytes
+        pos.update_occupied()
+        pos.update_mailbox()
+
+        pos.whos_turn = whos_turn
+        properties = pos.properties
+        properties.zobrist_key = zobrist_key
+        properties.pawn_key = pos.compute_pawn_key()
+        properties.material_key = pos.compute_material_key()
+        properties.ep_square = None if ep_square == NO_EP_SQUARE else ep_square
+        properties.castling_rights.kingside_rights = kingside_rights
+        properties.castling_rights.queenside_rights = queenside_rights
+        properties.castling_rights.castled = castled
+        return pos
 
     def piece_at(self, index: int) -> Optional[Tuple[int, Piece]]:
-        # Returns the piece at a given index.
-        for i, ps in enumerate(self.pieces):
-            piece = ps.piece_at(index)
-            if piece:
-                return i, piece
-        return None
+        # Returns the (owner, piece) at a given index, or None for an empty square.
+        return self.mailbox[index]
 
-    def piece_bb_at(self, index: int) -> Optional[Bitboard]:
+    def piece_bb_at(self, index: int) -> Optional[int]:
         # Returns the bitboard of the piece at a given index.
         piece_info = self.piece_at(index)
         if piece_info:
@@ -440,82 +711,110 @@ class Position:
     def xy_in_bounds(self, x: int, y: int) -> bool:
         # Returns whether a given x, y coordinate is in bounds.
         if x < self.dimensions.width and y < self.dimensions.height:
-            return self.bounds.bit(to_index(x, y))
+            return (self.bounds >> self.geometry.to_index(x, y)) & 1
         return False
 
     def move_piece(self, from_: int, to: int):
         # Moves a piece from one index to another.
-        source_bb = self.piece_bb_at(from_)
-        if source_bb:
-            source_bb.set_bit(from_, False)
-            source_bb.set_bit(to, True)
+        mailbox = self.mailbox
+        piece_info = mailbox[from_]
+        if piece_info:
+            owner, piece = piece_info
+            move_bits = (1 << from_) | (1 << to)
+            piece.bitboard ^= move_bits
+            self.pieces[owner].occupied ^= move_bits
+            self.occupied ^= move_bits
+            squares = piece.squares
+            squares[squares.index(from_)] = to
+            mailbox[from_] = None
+            mailbox[to] = piece_info
         else:
             print("nothing to move??")
-            print(f"from {from_index(from_)[0]} {from_index(from_)[1]}")
-            print(f"to {from_index(to)[0]} {from_index(to)[1]}")
+            print(f"from {self.geometry.from_index(from_)[0]} {self.geometry.from_index(from_)[1]}")
+            print(f"to {self.geometry.from_index(to)[0]} {self.geometry.from_index(to)[1]}")
             print("==")
 
     def _remove_piece(self, index: int):
         # Removes a piece from the board at specified index.
-        capd_bb = self.piece_bb_at(index)
-        if capd_bb:
-            capd_bb.set_bit(index, False)
+        piece_info = self.mailbox[index]
+        if piece_info:
+            owner, piece = piece_info
+            bit = 1 << index
+            piece.bitboard ^= bit
+            self.pieces[owner].occupied ^= bit
+            self.occupied ^= bit
+            piece.squares.remove(index)
+            self.mailbox[index] = None
+
+    def _place_piece(self, piece_info: Tuple[int, Piece], index: int):
+        # Puts an (owner, piece) taken from the mailbox back on the board at specified index.
+        owner, piece = piece_info
+        bit = 1 << index
+        piece.bitboard |= bit
+        self.pieces[owner].occupied |= bit
+        self.occupied |= bit
+        piece.squares.append(index)
+        self.mailbox[index] = piece_info
 
     def _add_piece(self, owner: int, pt: PieceType, index: int):
         # Adds a piece to the board at specified index.
-        piece_map = {
-            PieceType.King: self.pieces[owner].king.bitboard,
-            PieceType.Queen: self.pieces[owner].queen.bitboard,
-            PieceType.Rook: self.pieces[owner].rook.bitboard,
-            PieceType.Bishop: self.pieces[owner].bishop.bitboard,
-            PieceType.Knight: self.pieces[owner].knight.bitboard,
-            PieceType.Pawn: self.pieces[owner].pawn.bitboard,
-        }
-        if pt in piece_map:
-            piece_map[pt].set_bit(index, True)
+        piece_id = PIECE_IDS.get(pt)
+        if piece_id is None:
+            raise ValueError("Invalid PieceType")
+        self._add_piece_id(owner, piece_id, index)
+
+    def _add_piece_id(self, owner: int, piece_id: int, index: int):
+        # Adds the piece with a piece id (see move.py) to the board at specified index.
+        piece = self.pieces[owner].pieces_by_id[piece_id]
+        if piece is None:
+            print("Unregistered Custom PieceType")
             return
+        self._place_piece((owner, piece), index)
 
-        try:
-            match pt:
-                case PieceType.Custom1:
-                    self.pieces[owner].custom[0].bitboard.set_bit(index, True)
-                case PieceType.Custom2:
-                    self.pieces[owner].custom[1].bitboard.set_bit(index, True)
-                case PieceType.Custom3:
-                    self.pieces[owner].custom[2].bitboard.set_bit(index, True)
-                case PieceType.Custom4:
-                    self.pieces[owner].custom[3].bitboard.set_bit(index, True)
-                case PieceType.Custom5:
-                    self.pieces[owner].custom[4].bitboard.set_bit(index, True)
-                case PieceType.Custom6:
-                    self.pieces[owner].custom[5].bitboard.set_bit(index, True)
-                case _:
-                    raise ValueError("Invalid PieceType")
-        except IndexError as e:
-            print("Unregistered Custom PieceType")
-            
+    def update_mailbox(self):
+        # Rebuilds the mailbox and the piece lists from the bitboards, after the bitboards were set directly.
+        mailbox = [None] * self.geometry.num_squares
+        for owner, ps in enumerate(self.pieces):
+            for piece in ps.get_piece_refs():
+                piece.squares = list(iter_ones(piece.bitboard))
+                for index in piece.squares:
+                    mailbox[index] = (owner, piece)
+        self.mailbox = mailbox
 
     def update_occupied(self):
         # Updates the occupied bitboard to reflect the current state of the board.
-        self.occupied = Bitboard.zero()
+        occupied = 0
         for ps in self.pieces:
             ps.update_occupied()
-            self.occupied |= ps.occupied
+            occupied |= ps.occupied
+        self.occupied = occupied
 
     def add_piece(self, owner: int, pt: PieceType, index: int):
         # Adds a piece to the board at specified index.
-        new_props = self.properties.copy()
-        zobrist_table = self.ZOBRIST_TABLE
-        new_props.zobrist_key ^= zobrist_table.get_zobrist_sq_from_pt(pt, owner, index)
         self._add_piece(owner, pt, index)
-        self.update_occupied()
-        new_props.prev_properties = self.properties
-        self.properties = new_props
+        self.update_piece_keys(self.mailbox[index][1], index)
+        self.properties.check_info = None
+        self.properties.attack_maps = None
 
     def remove_piece(self, index: int):
         # Removes a piece from the board at specified index.
+        piece_info = self.mailbox[index]
         self._remove_piece(index)
-        self.update_occupied()
+        if piece_info:
+            self.update_piece_keys(piece_info[1], index)
+        self.properties.check_info = None
+        self.properties.attack_maps = None
+
+    def update_piece_keys(self, piece: Piece, index: int):
+        # Toggles a piece on index in the keys of the position, after the piece was added or removed.
+        # The material key changes by the key of the count the piece had without the one on index.
+        props = self.properties
+        piece_keys = self.ZOBRIST_TABLE.zobrist[piece.player_num][piece.piece_id]
+        props.zobrist_key ^= piece_keys[index]
+        if piece.piece_id == PAWN_ID:
+            props.pawn_key ^= piece_keys[index]
+        count = len(piece.squares)
+        props.material_key ^= piece_keys[count - 1 if (piece.bitboard >> index) & 1 else count]
 
 
 
@@ -1,5 +1,6 @@
-from typing import Optional, Tuple
-from .move import Move, PieceType
+from typing import List, Optional, Tuple
+from .move import PieceType
+from .piece import Piece
 
 class CastleRights:
     '''
@@ -32,34 +33,104 @@ class CastleRights:
     def disable_queenside_castle(self, playernum: int):
         self.queenside_rights &= ~(1 << playernum)
 
+    def copy(self) -> 'CastleRights':
+        new_rights = CastleRights()
+        new_rights.kingside_rights = self.kingside_rights
+        new_rights.queenside_rights = self.queenside_rights
+        new_rights.castled = self.castled
+        return new_rights
+
 
 class PositionProperties:
     '''
     Stores the properties of a board that do not include the positions of the pieces.
+    A position owns a single PositionProperties which make_move and unmake_move update in place,
+    the values needed to take a move back are kept in the UndoRecords of the position's undo stack.
     '''
     def __init__(self):
         self.zobrist_key: int = 0
-        self.move_played: Optional[Move] = None
-        self.promote_from: Optional[PieceType] = None
+        self.pawn_key: int = 0 # the zobrist keys of the pawns alone, see zobrist_table.py
+        self.material_key: int = 0 # the zobrist key of the piece counts, see zobrist_table.py
+        self.move_played: Optional[int] = None # a move, see move.py
+        self.promote_from: Optional[int] = None # the piece id of a promoted piece, see move.py
         self.castling_rights: CastleRights = CastleRights()
         self.ep_square: Optional[int] = None
-        self.captured_piece: Optional[Tuple[int, PieceType]] = None
-        self.prev_properties: Optional[PositionProperties] = None
+        self.captured_piece: Optional[Tuple[int, Piece]] = None # the (owner, piece) taken by move_played
+        self.check_info = None # pins and checkers, filled in by MoveGenerator.get_check_info
+        self.attack_maps: Optional[List[Optional[int]]] = None # squares attacked by each player, see MoveGenerator.get_attack_map
 
     @classmethod
     def default(cls) -> 'PositionProperties':
         return cls()
 
-    def get_prev(self) -> Optional['PositionProperties']:
-        return self.prev_properties
-
     def copy(self) -> 'PositionProperties':
         new_props = PositionProperties()
         new_props.zobrist_key = self.zobrist_key
+        new_props.pawn_key = self.pawn_key
+        new_props.material_key = self.material_key
         new_props.move_played = self.move_played
         new_props.promote_from = self.promote_from
-        new_props.castling_rights = self.castling_rights
+        new_props.castling_rights = self.castling_rights.copy()
         new_props.ep_square = self.ep_square
         new_props.captured_piece = self.captured_piece
-        new_props.prev_properties = self.prev_properties
-        return new_props
\ No newline at end of file
+        return new_props
+
+
+UNDO_STACK_SIZE = 64 # undo records allocated by the first move of a position, the stack doubles when it runs out
+
+
+class UndoRecord:
+    '''
+    The properties of a position before a move was made, saved by make_move and restored by unmake_move.
+    The records of a position are allocated once and overwritten, castling rights are kept as plain ints.
+    '''
+    __slots__ = ('zobrist_key', 'pawn_key', 'material_key', 'move_played', 'promote_from', 'captured_piece', 'ep_square',
+                 'kingside_rights', 'queenside_rights', 'castled', 'check_info', 'attack_maps')
+
+    def __init__(self):
+        self.zobrist_key = 0
+        self.pawn_key = 0
+        self.material_key = 0
+        self.move_played = None
+        self.promote_from = None
+        self.captured_piece = None
+        self.ep_square = None
+        self.kingside_rights = 0
+        self.queenside_rights = 0
+        self.castled = 0
+        self.check_info = None
+        self.attack_maps = None
+
+    def save(self, props: PositionProperties):
+        castling_rights = props.castling_rights
+        self.zobrist_key = props.zobrist_key
+        self.pawn_key = props.pawn_key
+        self.material_key = props.material_key
+        self.move_played = props.move_played
+        self.promote_from = props.promote_from
+        self.captured_piece = props.captured_piece
+        self.ep_square = props.ep_square
+        self.kingside_rights = castling_rights.kingside_rights
+        self.queenside_rights = castling_rights.queenside_rights
+        self.castled = castling_rights.castled
+        self.check_info = props.check_info
+        self.attack_maps = props.attack_maps
+
+    def restore(self, props: PositionProperties):
+        castling_rights = props.castling_rights
+        props.zobrist_key = self.zobrist_key
+        props.pawn_key = self.pawn_key
+        props.material_key = self.material_key
+        props.move_played = self.move_played
+        props.promote_from = self.promote_from
+        props.captured_piece = self.captured_piece
+        props.ep_square = self.ep_square
+        castling_rights.kingside_rights = self.kingside_rights
+        castling_rights.queenside_rights = self.queenside_rights
+        castling_rights.castled = self.castled
+        props.check_info = self.check_info
+        props.attack_maps = self.attack_maps
+
+
+def new_undo_stack(size: int = UNDO_STACK_SIZE) -> List[UndoRecord]:
+    return [UndoRecord() for _ in range(size)]
\ No newline at end of file
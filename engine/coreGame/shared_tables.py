@@ -0,0 +1,152 @@
+import gc
+import sys
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+from .attack_tables import AttackTables
+from .standard_attack_tables import StandardAttackTables
+from .zobrist_table import ZobristTable
+from .geometry import Geometry, STANDARD_GEOMETRY, STANDARD_BOUNDS
+from .movement_pattern import MovementPattern
+from .move import Dimensions, PieceType
+
+'''
+Attack tables and zobrist tables only depend on the geometry of a board, so one copy is enough for
+every engine in the process.  The registry below hands out that copy, building (or loading, see
+table_cache.py) it the first time a geometry is asked for.
+
+The shared tables are read only.  Every list held by a registered table (the attack tables, their masks
+and per square lookups, and the zobrist keys) is converted to a tuple, so a stray write fails loudly
+instead of corrupting every engine at once.  Zobrist tables are seeded, so the shared table holds
+exactly the keys a private one would.  There is a zobrist table per geometry size and set of custom
+piece definitions, see zobrist_table.py.
+
+When worker processes are forked from a parent that already built its tables, call
+freeze_shared_tables() right before forking.  It moves everything allocated so far out of reach of the
+garbage collector, which would otherwise touch (and so copy) every page of the tables in each child.
+
+The rules of a game, its board, players and custom piece patterns, are registered here as well, so a
+position snapshot (see Position.to_bytes) only has to carry the index of its Variant.  Standard chess is
+always variant 0, any other variant has to be registered before the worker processes reading its
+snapshots are forked.
+'''
+
+SHARED_ATTACK_TABLES: Dict[Geometry, AttackTables] = {}
+SHARED_ZOBRIST_TABLES: Dict[Tuple[int, Tuple[Optional[str], ...]], ZobristTable] = {}
+SHARED_TABLES_LOCK = threading.Lock()
+
+
+class Variant:
+    '''
+    The parts of a position that stay fixed for a whole game.  The movement patterns and the zobrist table
+    are shared with every position made from the variant, positions copy a pattern before compiling it
+    for other bounds.  Without a zobrist table the positions look up the shared one of their geometry.
+    '''
+    def __init__(self, dimensions: Dimensions, bounds: int, geometry: Geometry, num_players: int,
+                 custom_types: Tuple[PieceType, ...], movement_rules: Dict[PieceType, MovementPattern],
+                 zobrist_table: Optional[ZobristTable] = None):
+        self.dimensions = dimensions
+        self.bounds = bounds
+        self.geometry = geometry
+        self.num_players = num_players
+        self.custom_types = custom_types
+        self.movement_rules = movement_rules
+        self.zobrist_table = zobrist_table
+
+
+STANDARD_VARIANT = 0
+SHARED_VARIANTS: List[Variant] = [Variant(Dimensions(8, 8), STANDARD_BOUNDS, STANDARD_GEOMETRY, 2, (), {})]
+SHARED_VARIANT_IDS: Dict[tuple, int] = {(8, 8, STANDARD_BOUNDS, STANDARD_GEOMETRY, 2, ()): STANDARD_VARIANT}
+
+
+def to_tuple(table):
+    # Converts a list, or a list of lists, into nested tuples
+    if isinstance(table, list):
+        return tuple(to_tuple(row) for row in table)
+    return table
+
+
+def freeze_lists(obj):
+    # Replaces every list attribute of an object with tuples, so the object can be shared read only
+    for name, value in list(vars(obj).items()):
+        if isinstance(value, list):
+            setattr(obj, name, to_tuple(value))
+
+
+def get_shared_attack_tables(geometry: Geometry) -> AttackTables:
+    # Returns the attack tables of a geometry, the 8x8 geometry gets the magic bitboard tables
+    attack_tables = SHARED_ATTACK_TABLES.get(geometry)
+    if attack_tables is None:
+        with SHARED_TABLES_LOCK:
+            attack_tables = SHARED_ATTACK_TABLES.get(geometry)
+            if attack_tables is None:
+                if geometry is STANDARD_GEOMETRY:
+                    attack_tables = StandardAttackTables()
+                else:
+                    attack_tables = AttackTables(geometry)
+                freeze_lists(attack_tables)
+                freeze_lists(attack_tables.masks)
+                SHARED_ATTACK_TABLES[geometry] = attack_tables
+    return attack_tables
+
+
+def get_shared_zobrist_table(num_squares: int, custom_definitions: Tuple[Optional[str], ...] = ()) -> ZobristTable:
+    # Returns the zobrist table for a geometry with num_squares squares and the custom pieces with the
+    # given definitions (see zobrist_table.get_custom_definitions)
+    key = (num_squares, custom_definitions)
+    zobrist_table = SHARED_ZOBRIST_TABLES.get(key)
+    if zobrist_table is None:
+        with SHARED_TABLES_LOCK:
+            zobrist_table = SHARED_ZOBRIST_TABLES.get(key)
+            if zobrist_table is None:
+                zobrist_table = ZobristTable(num_squares, custom_definitions)
+                freeze_lists(zobrist_table)
+                SHARED_ZOBRIST_TABLES[key] = zobrist_table
+    return zobrist_table
+
+
+def get_shared_variant_id(key: tuple, variant: Variant) -> int:
+    # Returns the id of the variant with the given key, registering the variant if it is new
+    variant_id = SHARED_VARIANT_IDS.get(key)
+    if variant_id is None:
+        with SHARED_TABLES_LOCK:
+            variant_id = SHARED_VARIANT_IDS.get(key)
+            if variant_id is None:
+                variant_id = len(SHARED_VARIANTS)
+                SHARED_VARIANTS.append(variant)
+                SHARED_VARIANT_IDS[key] = variant_id
+    return variant_id
+
+
+def get_shared_variant(variant_id: int) -> Variant:
+    # Returns a registered variant, raising a ValueError for an id this process doesn't know
+    if not 0 <= variant_id < len(SHARED_VARIANTS):
+        raise ValueError(f"Unknown variant id {variant_id}")
+    return SHARED_VARIANTS[variant_id]
+
+
+def freeze_shared_tables():
+    # Keeps the garbage collector away from everything allocated so far, call before forking workers
+    gc.collect()
+    gc.freeze()
+
+
+def get_object_size(obj, seen: Optional[Set[int]] = None) -> int:
+    # Returns the size of an object in bytes, counting everything it holds that isn't counted yet
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (list, tuple)):
+        size += sum(get_object_size(item, seen) for item in obj)
+    elif isinstance(obj, dict):
+        size += sum(get_object_size(key, seen) + get_object_size(value, seen) for key, value in obj.items())
+    elif hasattr(obj, '__dict__'):
+        size += get_object_size(vars(obj), seen)
+    return size
+
+
+def get_shared_tables_size() -> int:
+    # Returns the number of bytes held by the shared registry
+    return get_object_size([SHARED_ATTACK_TABLES, SHARED_ZOBRIST_TABLES])
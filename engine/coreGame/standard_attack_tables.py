@@ -0,0 +1,148 @@
+import hashlib
+from typing import List
+from .attack_tables import AttackTables
+from .geometry import STANDARD_GEOMETRY
+
+'''
+Attack tables for the 8x8 geometry.  Plain chess is by far the most common variant, and positions on the
+STANDARD_GEOMETRY store every bitboard in 64 bits (index = 8 * y + x), so the sliding pieces can use
+magic bitboards instead of the generic line lookups.
+
+StandardAttackTables is a drop in replacement for AttackTables(STANDARD_GEOMETRY), the knight, king and
+pawn tables as well as the sliding moves of custom pieces are inherited, only the rook, bishop and queen
+lookups are replaced.
+'''
+
+BOARD_MASK = (1 << 64) - 1
+
+ROOK_DIRECTIONS = [(0, 1), (1, 0), (0, -1), (-1, 0)]
+BISHOP_DIRECTIONS = [(1, 1), (-1, 1), (1, -1), (-1, -1)]
+
+'''
+Magic multipliers for the 8x8 layout.  For every square, (occupancy & mask) * magic places a unique
+index for each relevant occupancy (or at least one that maps to the same attack set) in the top bits
+of the 64 bit product.  They were found with the usual trial and error search over sparse random
+numbers, and the table construction below checks them, so a bad constant can't slip through.
+'''
+ROOK_MAGICS = [
+    0x128012c0008000e0, 0x0240002000401001, 0x4100200041001008, 0x8280100008018004,
+    0x2080080002040080, 0x1300010004008208, 0x04000208a9101408, 0x020000204a018f04,
+    0x1080800040008020, 0x0000c01000402001, 0x0080808010002000, 0x0408800800801000,
+    0x0010800801040080, 0x4804800400804200, 0x0304800d00800200, 0x010200040081006a,
+    0x8280044020084000, 0x042000c010004021, 0x2010002004080020, 0x0040210010000900,
+    0x0008004004020041, 0x0004008080040200, 0x1c20040070610208, 0x1020a20000508104,
+    0x0100c00380008120, 0x4001200280400080, 0x0200100080200080, 0x0000401200082200,
+    0xc02c080080040080, 0x0840040080020080, 0x2102004040800100, 0x0042079a00004104,
+    0x0000400424800280, 0x4820100020400040, 0x5010002000801880, 0x9061080081801002,
+    0x208a050011000800, 0x000200080e003094, 0xa010018204003008, 0x2000288042001401,
+    0x400181c000228000, 0x0200402010004000, 0x8388928600420021, 0x400021001001000a,
+    0x2100080011010004, 0x1002020004008080, 0x0802000804020001, 0x88004410408a0001,
+    0x010508c030800100, 0x4000400080310100, 0x0030200010048080, 0x2000800800100080,
+    0x0100040008008080, 0x0022000204008080, 0x0108020170284400, 0x1001010084004200,
+    0x0004890141902202, 0x0100881100220042, 0x0100102001000841, 0x4408050020081001,
+    0x0002008884201002, 0x2002000490410802, 0x0020014800900204, 0x0100082081044402,
+]
+
+BISHOP_MAGICS = [
+    0x0010104088840042, 0x0110104081004062, 0x0091142082000100, 0x0108208821008100,
+    0x0101104000080000, 0x010104200404001c, 0x0c01040202c00010, 0x0001004800841080,
+    0xca8b46100e280102, 0x001010d00085024c, 0x4180089881020120, 0x8010082050411000,
+    0x0800020210100000, 0x0002120905201200, 0xc000040404040510, 0x0110410101100200,
+    0x0042201408020c27, 0xa882000404440c20, 0x0002000102040100, 0x800200202202c200,
+    0x4002005012101401, 0x2441014880600200, 0x0214020104018400, 0x000180004414410a,
+    0x0105410c10020800, 0x0004200084013400, 0x200582045004001b, 0x1000404004010200,
+    0x0001001081004021, 0x2400430202008628, 0x000604c144230800, 0x04004840008a1804,
+    0x4010045000220210, 0x2012100400500120, 0x10001c0205900081, 0x0020880800360a00,
+    0x8500460020060080, 0x0420008209010110, 0x0010020250008c00, 0x8010a40100004104,
+    0x00008208400022c8, 0x0008410450402100, 0x0008920110004104, 0x43a8011044002024,
+    0x0029102021900602, 0x2270101000212040, 0x0020c41112004040, 0x3004840550c42200,
+    0x5002022202404480, 0x0402822309200840, 0x0032010423240048, 0x2000ca0384110008,
+    0x4001140410440000, 0x2092e50810011010, 0x0140040852005041, 0x00200200c1010104,
+    0x40120202020104e0, 0xa000010042300500, 0x400048004a009001, 0x4200800400411081,
+    0x0010040604105400, 0x0107004210024080, 0x0004423004210040, 0xc220023088010040,
+]
+
+
+def get_ray(index: int, dx: int, dy: int) -> List[int]:
+    # Returns the single bit bitboards of the squares in one direction from index, nearest first
+    x, y = STANDARD_GEOMETRY.from_index(index)
+    ray = []
+    x, y = x + dx, y + dy
+    while 0 <= x < 8 and 0 <= y < 8:
+        ray.append(1 << STANDARD_GEOMETRY.to_index(x, y))
+        x, y = x + dx, y + dy
+    return ray
+
+
+class StandardAttackTables(AttackTables):
+    TABLE_NAMES = AttackTables.TABLE_NAMES + [
+        'rook_masks', 'rook_shifts', 'rook_table', 'bishop_masks', 'bishop_shifts', 'bishop_table',
+    ]
+
+    def __init__(self, use_cache: bool = True):
+        super().__init__(STANDARD_GEOMETRY, use_cache)
+
+    def cache_key(self) -> str:
+        # The magic tables are only valid for the magics they were built with
+        digest = hashlib.sha256(repr((ROOK_MAGICS, BISHOP_MAGICS)).encode()).hexdigest()[:16]
+        return f'{super().cache_key()}-{digest}'
+
+    def build_tables(self):
+        super().build_tables()
+        self.rook_masks: List[int] = [0] * 64
+        self.rook_shifts: List[int] = [0] * 64
+        self.rook_table: List[List[int]] = [[] for _ in range(64)]
+        self.bishop_masks: List[int] = [0] * 64
+        self.bishop_shifts: List[int] = [0] * 64
+        self.bishop_table: List[List[int]] = [[] for _ in range(64)]
+
+        for index in range(64):
+            self.rook_masks[index], self.rook_shifts[index], self.rook_table[index] = \
+                StandardAttackTables.build_magic_table(index, ROOK_DIRECTIONS, ROOK_MAGICS[index])
+            self.bishop_masks[index], self.bishop_shifts[index], self.bishop_table[index] = \
+                StandardAttackTables.build_magic_table(index, BISHOP_DIRECTIONS, BISHOP_MAGICS[index])
+
+    @staticmethod
+    def build_magic_table(index, directions, magic):
+        # Builds the relevant occupancy mask, the shift and the attack table of a slider on index.
+        # The last square of each ray never blocks anything beyond it, so it is left out of the mask.
+        rays = [get_ray(index, dx, dy) for dx, dy in directions]
+        mask = 0
+        for ray in rays:
+            mask |= sum(ray[:-1])
+        bits = mask.bit_count()
+        shift = 64 - bits
+        table = [None] * (1 << bits)
+
+        # Walk every subset of the mask with the carry-rippler trick
+        occ = 0
+        while True:
+            attacks = 0
+            for ray in rays:
+                for square in ray:
+                    attacks |= square
+                    if occ & square:
+                        break
+            magic_index = ((occ * magic) & BOARD_MASK) >> shift
+            if table[magic_index] is None:
+                table[magic_index] = attacks
+            elif table[magic_index] != attacks:
+                raise ValueError(f"Bad magic number for square {index}")
+            occ = (occ - mask) & mask
+            if occ == 0:
+                break
+
+        return mask, shift, [attacks or 0 for attacks in table]
+
+    def get_rook_attack(self, loc_index, occ, _enemies):
+        return self.rook_table[loc_index][
+            (((occ & self.rook_masks[loc_index]) * ROOK_MAGICS[loc_index]) & BOARD_MASK) >> self.rook_shifts[loc_index]
+        ]
+
+    def get_bishop_attack(self, loc_index, occ, _enemies):
+        return self.bishop_table[loc_index][
+            (((occ & self.bishop_masks[loc_index]) * BISHOP_MAGICS[loc_index]) & BOARD_MASK) >> self.bishop_shifts[loc_index]
+        ]
+
+    def get_queen_attack(self, loc_index, occ, enemies):
+        return self.get_rook_attack(loc_index, occ, enemies) | self.get_bishop_attack(loc_index, occ, enemies)
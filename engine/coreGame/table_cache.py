@@ -0,0 +1,180 @@
+import hashlib
+import inspect
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Dict, List, Optional, Tuple, Union
+
+'''
+Building the attack tables in pure python takes a noticeable amount of time, and it is repeated by
+every process that creates a MoveGenerator.  The tables never change for a given geometry, so they are
+written to disk the first time they are built and loaded from there afterwards.
+
+A cache file holds every table listed in TABLE_NAMES of the tables object, laid out as:
+    header:  FILE_MAGIC, the TABLE_CACHE_VERSION, the sha256 of the payload and the cache key
+    payload: one record per table, the table name, the size of one entry in bytes, the length of
+             every row (a flat table is a single row) and the entries themselves, little endian
+Entries that fit in a machine word are read back with array.frombytes, wider ones (the bitboards of
+large geometries) go through int.from_bytes.
+
+The key names the class and the geometry the tables were built for, a digest of the builder source
+(see get_builder_digest) and anything else the builder depends on (the magics of the standard tables,
+for example), so a file that doesn't match the key, the version or the hash is simply rebuilt.  Editing
+a builder therefore invalidates its files on its own, TABLE_CACHE_VERSION only needs a bump when the
+file format changes.
+
+The cache lives in $CHESSBOT_TABLE_CACHE, or ~/.cache/chessbot when that isn't set.  Setting it to an
+empty string turns the cache off.  Failing to write the cache is not an error, the tables are built
+in memory either way.
+'''
+
+TABLE_CACHE_VERSION = 1
+FILE_MAGIC = b'CBTC'
+HEADER = struct.Struct('<4sI32sH') # magic, version, payload hash, key length
+RECORD = struct.Struct('<HHI') # name length, entry size, number of rows
+
+Table = Union[List[int], List[List[int]], Tuple[int, ...], Tuple[Tuple[int, ...], ...]]
+
+# array typecodes by entry size, only used when the entries are stored in machine byte order
+ARRAY_TYPECODES = {array(code).itemsize: code for code in 'QLIHB'}
+
+
+def get_table_cache_dir() -> Optional[str]:
+    # Returns the directory the tables are cached in, None if caching is turned off
+    cache_dir = os.environ.get('CHESSBOT_TABLE_CACHE')
+    if cache_dir is None:
+        return os.path.join(os.path.expanduser('~'), '.cache', 'chessbot')
+    return cache_dir or None
+
+
+def get_builder_digest(cls) -> str:
+    # Hashes the source of every build_* method a tables class uses, its own and inherited ones
+    digest = hashlib.sha256()
+    for klass in cls.__mro__:
+        for name, method in sorted(vars(klass).items()):
+            if not name.startswith('build'):
+                continue
+            method = getattr(method, '__func__', method)
+            try:
+                digest.update(inspect.getsource(method).encode())
+            except (OSError, TypeError):
+                # No source around (a frozen or bytecode only install), the bytecode works just as well
+                digest.update(method.__code__.co_code)
+    return digest.hexdigest()[:16]
+
+
+def get_cache_path(cache_dir: str, key: str) -> str:
+    return os.path.join(cache_dir, f'{key}.v{TABLE_CACHE_VERSION}.tables')
+
+
+def encode_tables(tables: Dict[str, Table]) -> bytes:
+    # Serializes the tables into the payload of a cache file
+    chunks = []
+    for name, table in tables.items():
+        nested = len(table) > 0 and isinstance(table[0], (list, tuple))
+        rows = table if nested else [table]
+        largest = max((max(row, default=0) for row in rows), default=0)
+        size = max(1, (largest.bit_length() + 7) // 8)
+        name_bytes = name.encode()
+        chunks.append(RECORD.pack(len(name_bytes), size, len(rows) if nested else 0))
+        chunks.append(name_bytes)
+        chunks.append(struct.pack(f'<{len(rows)}I', *(len(row) for row in rows)))
+        for row in rows:
+            chunks.append(b''.join(value.to_bytes(size, 'little') for value in row))
+    return b''.join(chunks)
+
+
+def decode_tables(payload: memoryview) -> Dict[str, Table]:
+    # Reads the tables back out of the payload of a cache file
+    tables = {}
+    pos = 0
+    while pos < len(payload):
+        name_length, size, num_rows = RECORD.unpack_from(payload, pos)
+        pos += RECORD.size
+        name = bytes(payload[pos:pos + name_length]).decode()
+        pos += name_length
+        row_count = num_rows or 1
+        lengths = struct.unpack_from(f'<{row_count}I', payload, pos)
+        pos += 4 * row_count
+        rows = []
+        for length in lengths:
+            with payload[pos:pos + size * length] as data:
+                code = ARRAY_TYPECODES.get(size)
+                if code is not None:
+                    values = array(code)
+                    values.frombytes(data)
+                    if sys.byteorder != 'little':
+                        values.byteswap()
+                    rows.append(values.tolist())
+                else:
+                    raw = bytes(data)
+                    rows.append([int.from_bytes(raw[i:i + size], 'little') for i in range(0, len(raw), size)])
+            pos += size * length
+        tables[name] = rows if num_rows else rows[0]
+    return tables
+
+
+def save_tables(path: str, key: str, tables: Dict[str, Table]):
+    # Writes the tables to path.  The file is written next to its final location and moved into
+    # place, so a process reading the cache never sees a half written file.
+    payload = encode_tables(tables)
+    key_bytes = key.encode()
+    header = HEADER.pack(FILE_MAGIC, TABLE_CACHE_VERSION, hashlib.sha256(payload).digest(), len(key_bytes))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(header)
+            f.write(key_bytes)
+            f.write(payload)
+        os.replace(temp_path, path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def load_tables(path: str, key: str) -> Optional[Dict[str, Table]]:
+    # Returns the tables stored at path, or None if the file is missing, stale or corrupt
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, memoryview(mm) as view:
+            if len(view) < HEADER.size:
+                return None
+            magic, version, digest, key_length = HEADER.unpack_from(view, 0)
+            if magic != FILE_MAGIC or version != TABLE_CACHE_VERSION:
+                return None
+            if bytes(view[HEADER.size:HEADER.size + key_length]) != key.encode():
+                return None
+            with view[HEADER.size + key_length:] as payload:
+                if hashlib.sha256(payload).digest() != digest:
+                    return None
+                return decode_tables(payload)
+    except (OSError, ValueError, struct.error, UnicodeDecodeError):
+        return None
+
+
+def load_cached_tables(tables) -> bool:
+    # Fills in the TABLE_NAMES of a tables object from the cache, returns whether it succeeded
+    cache_dir = get_table_cache_dir()
+    if cache_dir is None:
+        return False
+    key = tables.cache_key()
+    cached = load_tables(get_cache_path(cache_dir, key), key)
+    if cached is None or any(name not in cached for name in tables.TABLE_NAMES):
+        return False
+    for name in tables.TABLE_NAMES:
+        setattr(tables, name, cached[name])
+    return True
+
+
+def save_cached_tables(tables):
+    # Writes the TABLE_NAMES of a tables object to the cache, if it is turned on and writable
+    cache_dir = get_table_cache_dir()
+    if cache_dir is None:
+        return
+    key = tables.cache_key()
+    try:
+        save_tables(get_cache_path(cache_dir, key), key, {name: getattr(tables, name) for name in tables.TABLE_NAMES})
+    except OSError:
+        pass
@@ -1,11 +1,42 @@
+import gc
+import multiprocessing
+import os
+import tempfile
 import unittest
 from unittest import *
-from .bitboard import Bitboard
+from unittest import mock
+from .bitboard import Bitboard, bb_value, bit, lowest_one, count_ones, iter_ones
 from .piece import Piece, PieceType
 from .move import *
-from .position_properties import CastleRights, PositionProperties
+from .position_properties import CastleRights, PositionProperties, UNDO_STACK_SIZE
 from .position import Position
+from .geometry import Geometry, GENERIC_GEOMETRY, STANDARD_GEOMETRY
+from .movement_pattern import MovementPatternExternal
+from .fen_loader import load_positions, split_epd
+from .attack_tables import AttackTables
+from .standard_attack_tables import StandardAttackTables
+from .table_cache import get_cache_path, load_cached_tables
+from .shared_tables import get_shared_attack_tables, get_shared_tables_size, freeze_shared_tables
+from .move_generator import MoveGenerator, new_move_buffer
+from .evaluator import Evaluator
 from engine.engine import Engine
+from engine.move_picker import MovePicker
+from engine.transposition_table import (TranspositionTable, SharedTranspositionTable, ENTRIES_PER_CLUSTER, FLAG_ALPHA, FLAG_EXACT, FLAG_BETA,
+                                        entry_move, entry_value, entry_depth, entry_flag)
+
+# Keep the tests from writing attack table caches into the real cache directory
+MODULE_CACHE_DIR = None
+MODULE_CACHE_ENV = None
+
+def setUpModule():
+    global MODULE_CACHE_DIR, MODULE_CACHE_ENV
+    MODULE_CACHE_DIR = tempfile.TemporaryDirectory()
+    MODULE_CACHE_ENV = mock.patch.dict(os.environ, {'CHESSBOT_TABLE_CACHE': MODULE_CACHE_DIR.name})
+    MODULE_CACHE_ENV.start()
+
+def tearDownModule():
+    MODULE_CACHE_ENV.stop()
+    MODULE_CACHE_DIR.cleanup()
 
 class TestPiece(unittest.TestCase):
     def test_blank_custom(self):
@@ -57,21 +88,45 @@ class TestPiece(unittest.TestCase):
         self.assertEqual(piece.piece_type, PieceType.Queen)
         self.assertEqual(piece.bitboard, Bitboard.zero())
 
+class TestBitboardHelpers(unittest.TestCase):
+    def test_helpers(self):
+        bb = (1 << 3) | (1 << 17) | (1 << 255)
+        self.assertEqual(bit(bb, 17), 1)
+        self.assertEqual(bit(bb, 16), 0)
+        self.assertEqual(lowest_one(bb), 3)
+        self.assertEqual(lowest_one(0), -1)
+        self.assertEqual(count_ones(bb), 3)
+        self.assertEqual(list(iter_ones(bb)), [3, 17, 255])
+
+    def test_facade(self):
+        board = Bitboard.zero()
+        board.set_coord(1, 2)
+        self.assertEqual(bb_value(board), 1 << 33)
+        self.assertEqual(bb_value(1 << 33), 1 << 33)
+        self.assertEqual(board, 1 << 33)
+        self.assertEqual(bb_value(~0), (1 << 256) - 1)
+
 class TestMove(unittest.TestCase):
     def test_new(self):
         move = Move.new(0, 1, 2, 'Capture', 'q')
         self.assertEqual(move.get_from(), 0)
         self.assertEqual(move.get_to(), 1)
         self.assertEqual(move.get_target(), 2)
-        self.assertEqual(move.get_move_type(), 'Capture')
+        self.assertEqual(move.get_move_type(), MOVE_CAPTURE)
         self.assertEqual(move.get_promotion_char(), 'q')
 
+    def test_to_string_reads_the_geometry(self):
+        move = Move.new(STANDARD_GEOMETRY.to_index(4, 1), STANDARD_GEOMETRY.to_index(4, 3))
+        self.assertEqual(move.to_string(STANDARD_GEOMETRY), f"(from: {to_rank_file(4, 1)}, to:{to_rank_file(4, 3)})")
+        generic = Move.new(GENERIC_GEOMETRY.to_index(4, 1), GENERIC_GEOMETRY.to_index(4, 3))
+        self.assertEqual(str(generic), move.to_string(STANDARD_GEOMETRY))
+
     def test_null(self):
         move = Move.null()
         self.assertEqual(move.get_from(), 0)
         self.assertEqual(move.get_to(), 0)
         self.assertEqual(move.get_target(), 0)
-        self.assertEqual(move.get_move_type(), 'Null')
+        self.assertEqual(move.get_move_type(), MOVE_NULL)
         self.assertIsNone(move.get_promotion_char())
 
     def test_get_is_capture(self):
@@ -81,6 +136,21 @@ class TestMove(unittest.TestCase):
         move = Move.new(0, 1, 2, 'Quiet', None)
         self.assertFalse(move.get_is_capture())
 
+        move = Move.new(4, 6, 7, MOVE_KINGSIDE_CASTLE)
+        self.assertFalse(move.get_is_capture())
+
+    def test_plain_int_encoding(self):
+        move = Move.new(3, 59, 59, MOVE_PROMOTION_CAPTURE, 'n')
+        self.assertIsInstance(move, int)
+        self.assertEqual(move, new_move(3, 59, 59, MOVE_PROMOTION_CAPTURE, PROMOTION_CODES['n']))
+        self.assertEqual(hash(move), hash(int(move)))
+        self.assertEqual((move_from(move), move_to(move), move_target(move)), (3, 59, 59))
+        self.assertEqual(move_type(move), MOVE_PROMOTION_CAPTURE)
+        self.assertEqual(move_promo(move), 'n')
+        self.assertTrue(is_capture(move))
+        self.assertTrue(is_promotion(move))
+        self.assertLess(move, 1 << 32)
+
     def test_equality(self):
         move1 = Move.new(0, 1, 2, 'Capture', 'q')
         move2 = Move.new(0, 1, 2, 'Capture', 'q')
@@ -215,6 +285,713 @@ class TestFENPositions(unittest.TestCase):
         self.assertEqual(self.engine.perft(4), 3894594)
         self.assertEqual(self.engine.perft(5), 164075551)
 
+class TestGeometry(unittest.TestCase):
+    def setUp(self):
+        self.engine = Engine.default()
+
+    def test_fen_uses_standard_geometry(self):
+        position = Position.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - ")
+        self.assertIs(position.geometry, STANDARD_GEOMETRY)
+        self.assertEqual(position.bounds, (1 << 64) - 1)
+        self.assertEqual(position.piece_at(STANDARD_GEOMETRY.to_index(4, 7))[1].piece_type, PieceType.King)
+
+    def test_compiled_geometry(self):
+        geometry = Geometry.compile(10, 8)
+        self.assertIs(Geometry.compile(10, 8), geometry)
+        self.assertIs(Geometry.compile(8, 8), STANDARD_GEOMETRY)
+        self.assertEqual(geometry.num_squares, 80)
+        self.assertEqual(Geometry.compile(6, 10).stride, 10)
+        self.assertEqual(geometry.from_index(geometry.to_index(9, 7)), (9, 7))
+
+    def test_custom_position_is_compiled(self):
+        mpe = MovementPatternExternal(attack_north=True, translate_north=True, promotion_squares=[(0, 5)], promo_vals=['q'])
+        pieces = [(0, GENERIC_GEOMETRY.to_index(2, 0), PieceType.King), (1, GENERIC_GEOMETRY.to_index(3, 5), PieceType.King),
+                  (0, GENERIC_GEOMETRY.to_index(0, 2), PieceType.Custom1)]
+        bounds = sum(1 << GENERIC_GEOMETRY.to_index(x, y) for x in range(6) for y in range(6))
+        position = Position.custom(Dimensions(6, 6), bounds, {'a': mpe}, pieces)
+        self.assertEqual(position.geometry.num_squares, 36)
+        self.assertEqual(position.bounds, (1 << 36) - 1)
+        self.assertEqual(position.movement_rules[PieceType.Custom1].promotion_squares, 1 << 30)
+        self.assertEqual(position.piece_at(position.geometry.to_index(0, 2))[1].piece_type, PieceType.Custom1)
+        self.assertEqual(position.get_zobrist(), position.compute_zobrist_key())
+
+    def test_perft_matches_generic_geometry(self):
+        fen = "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10"
+        self.engine.current_position = Position.from_fen(fen)
+        standard_nodes = self.engine.perft(2)
+        self.engine.current_position = Position.from_fen(fen)
+        self.engine.current_position.relayout(GENERIC_GEOMETRY)
+        self.assertEqual(self.engine.perft(2), standard_nodes)
+        self.assertEqual(standard_nodes, 2079)
+
+class TestTableCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.env = mock.patch.dict(os.environ, {'CHESSBOT_TABLE_CACHE': self.cache_dir.name})
+        self.env.start()
+
+    def tearDown(self):
+        self.env.stop()
+        self.cache_dir.cleanup()
+
+    def test_cache_round_trip(self):
+        built = StandardAttackTables()
+        self.assertTrue(os.path.exists(get_cache_path(self.cache_dir.name, built.cache_key())))
+        loaded = StandardAttackTables()
+        for name in StandardAttackTables.TABLE_NAMES:
+            self.assertEqual(getattr(loaded, name), getattr(built, name))
+
+    def test_corrupt_cache_is_rebuilt(self):
+        geometry = Geometry.compile(10, 8)
+        built = AttackTables(geometry)
+        path = get_cache_path(self.cache_dir.name, built.cache_key())
+        with open(path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+        rebuilt = AttackTables(geometry)
+        self.assertEqual(rebuilt.slider_attacks, built.slider_attacks)
+        self.assertEqual(rebuilt.knight_attacks, built.knight_attacks)
+
+    def test_changed_builder_is_rebuilt(self):
+        tables = AttackTables(Geometry.compile(6, 6))
+        self.assertTrue(load_cached_tables(tables))
+        with mock.patch('engine.coreGame.table_cache.inspect.getsource', return_value='def build_tables(self): ...'):
+            self.assertFalse(load_cached_tables(tables))
+
+class TestMoveBuffers(unittest.TestCase):
+    def test_buffer_is_reused_and_grows(self):
+        position = Position.from_fen("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 b - - ")
+        movegen = MoveGenerator()
+        moves = new_move_buffer(4)
+        n = movegen.generate_pseudo_moves(position, moves)
+        self.assertGreaterEqual(len(moves), n)
+        self.assertEqual(sorted(moves[:n]), sorted(movegen.get_pseudo_moves(position)))
+        self.assertEqual(movegen.generate_pseudo_moves(position, moves, n), 2 * n)
+
+    def test_capture_moves(self):
+        position = Position.from_fen("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 b - - ")
+        movegen = MoveGenerator()
+        captures = movegen.get_capture_moves(position)
+        self.assertEqual(sorted(captures), sorted(move_ for move_ in movegen.get_pseudo_moves(position) if is_capture(move_)))
+        self.assertEqual(len(captures), 1)
+
+    def test_captures_are_victim_first(self):
+        position = Position.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - ")
+        movegen = MoveGenerator()
+        captures = movegen.get_capture_moves(position)
+        self.assertEqual(sorted(captures), sorted(move_ for move_ in movegen.get_pseudo_moves(position) if is_capture(move_)))
+        values = {PieceType.Pawn: 1, PieceType.Knight: 3, PieceType.Bishop: 3, PieceType.Rook: 5, PieceType.Queen: 9, PieceType.King: 100}
+        victims = [values[position.piece_at(move_target(move_))[1].piece_type] for move_ in captures]
+        attackers = [values[position.piece_at(move_from(move_))[1].piece_type] for move_ in captures]
+        self.assertEqual(victims, sorted(victims, reverse=True))
+        self.assertEqual(list(zip(victims, attackers)), sorted(zip(victims, attackers), key=lambda va: (-va[0], va[1])))
+
+class TestLegalMoves(unittest.TestCase):
+    def brute_force_legal_moves(self, position):
+        # The legal moves found by playing every pseudo move and looking for a reply that takes the king
+        movegen = MoveGenerator()
+        legal = []
+        for move_ in movegen.get_pseudo_moves(position):
+            if is_capture(move_) and position.piece_at(move_target(move_))[1].piece_type == PieceType.King:
+                continue
+            position.make_move(move_)
+            king_bb = position.pieces[1 - position.whos_turn].king.bitboard
+            if not any(is_capture(reply) and (king_bb >> move_target(reply)) & 1 for reply in movegen.get_pseudo_moves(position)):
+                legal.append(move_)
+            position.unmake_move()
+        return sorted(legal)
+
+    def custom_position(self):
+        # A custom rider that slides along (1, 2) runs and a jumper, both pinning and checking the white king
+        rider = MovementPatternExternal(attack_sliding_deltas=[[(i, 2 * i) for i in range(1, 4)], [(-i, -2 * i) for i in range(1, 4)]],
+                                        translate_sliding_deltas=[[(i, 2 * i) for i in range(1, 4)]])
+        jumper = MovementPatternExternal(attack_jump_deltas=[(3, 1), (-3, -1)], translate_jump_deltas=[(0, 1), (0, -1)])
+        to_index = GENERIC_GEOMETRY.to_index
+        pieces = [(0, to_index(1, 0), PieceType.King), (0, to_index(2, 2), PieceType.Rook), (0, to_index(4, 2), PieceType.Knight),
+                  (0, to_index(0, 5), PieceType.Custom2), (1, to_index(3, 4), PieceType.Custom1), (1, to_index(7, 7), PieceType.King),
+                  (1, to_index(4, 5), PieceType.Custom2), (1, to_index(7, 1), PieceType.Rook), (1, to_index(5, 3), PieceType.Queen)]
+        bounds = sum(1 << to_index(x, y) for x in range(8) for y in range(8))
+        return Position.custom(Dimensions(8, 8), bounds, {'a': rider, 'b': jumper}, pieces)
+
+    def test_custom_pieces_pin_and_check(self):
+        position = self.custom_position()
+        movegen = MoveGenerator()
+        self.assertEqual(movegen.get_check_info(position).blockers, 1 << position.geometry.to_index(2, 2))
+        checks = 0
+        for move_ in movegen.get_legal_moves(position):
+            position.make_move(move_)
+            self.assertEqual(sorted(movegen.get_legal_moves(position)), self.brute_force_legal_moves(position))
+            for reply in movegen.get_legal_moves(position):
+                position.make_move(reply)
+                checks += movegen.in_check(position)
+                self.assertEqual(sorted(movegen.get_legal_moves(position)), self.brute_force_legal_moves(position))
+                position.unmake_move()
+            position.unmake_move()
+        self.assertEqual(sorted(movegen.get_legal_moves(position)), self.brute_force_legal_moves(position))
+        self.assertGreater(checks, 0)
+
+    def test_pins_and_evasions(self):
+        movegen = MoveGenerator()
+        for fen in ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - ", "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                    "4k3/8/8/q2pP2K/8/8/8/4R3 w - d6 0 1", "4k3/4r3/8/8/8/4B3/4K3/8 w - - 0 1"):
+            position = Position.from_fen(fen)
+            self.assertEqual(sorted(movegen.get_legal_moves(position)), self.brute_force_legal_moves(position))
+            self.assertEqual(movegen.count_legal_moves(position), len(self.brute_force_legal_moves(position)))
+
+class TestPawnMoves(unittest.TestCase):
+    def test_double_push_follows_the_board_height(self):
+        to_index = GENERIC_GEOMETRY.to_index
+        pieces = [(0, to_index(0, 0), PieceType.King), (1, to_index(5, 5), PieceType.King),
+                  (0, to_index(1, 1), PieceType.Pawn), (1, to_index(3, 4), PieceType.Pawn), (1, to_index(4, 3), PieceType.Pawn)]
+        position = Position.custom(Dimensions(6, 6), sum(1 << to_index(x, y) for x in range(6) for y in range(6)), {}, pieces)
+        geometry = position.geometry
+        movegen = MoveGenerator()
+        pawn_moves = lambda: sorted(geometry.from_index(move_to(move_)) for move_ in movegen.get_pseudo_moves(position)
+                                    if position.pieces[position.whos_turn].pawn.bitboard >> move_from(move_) & 1)
+        self.assertEqual(pawn_moves(), [(1, 2), (1, 3)])
+        position.make_move(Move.new(geometry.to_index(0, 0), geometry.to_index(0, 1)))
+        self.assertEqual(pawn_moves(), [(3, 2), (3, 3), (4, 2)])
+
+    def test_promotions_and_en_passant(self):
+        movegen = MoveGenerator()
+        position = Position.from_fen("r3k3/1P6/8/8/8/8/8/4K3 w - - 0 1")
+        promotions = [move_ for move_ in movegen.get_pseudo_moves(position) if is_promotion(move_)]
+        self.assertEqual(sorted(move_type(move_) for move_ in promotions), [MOVE_PROMOTION] * 4 + [MOVE_PROMOTION_CAPTURE] * 4)
+        self.assertEqual(sorted(move_ for move_ in promotions if is_capture(move_)), sorted(movegen.get_capture_moves(position)))
+        position = Position.from_fen("4k3/8/8/8/2p5/8/1P1P4/4K3 w - - 0 1")
+        position.make_move(Move.new(STANDARD_GEOMETRY.to_index(1, 1), STANDARD_GEOMETRY.to_index(1, 3)))
+        en_passant = [move_ for move_ in movegen.get_capture_moves(position) if move_target(move_) != move_to(move_)]
+        self.assertEqual(en_passant, [new_move(STANDARD_GEOMETRY.to_index(2, 3), STANDARD_GEOMETRY.to_index(1, 2),
+                                               STANDARD_GEOMETRY.to_index(1, 3), MOVE_CAPTURE)])
+
+class TestCompiledMovementPatterns(unittest.TestCase):
+    def reference_moves(self, position, mp, index, occupied, enemies):
+        # Walks the deltas of the pattern square by square, the way moves were generated before compiling
+        x, y = position.geometry.from_index(index)
+        on_board = lambda x2, y2: 0 <= x2 < position.dimensions.width and 0 <= y2 < position.dimensions.height and position.xy_in_bounds(x2, y2)
+        to_index = position.geometry.to_index
+        moves = 0
+        for dx, dy in mp.translate_jump_deltas:
+            if on_board(x + dx, y + dy) and not (occupied >> to_index(x + dx, y + dy)) & 1:
+                moves |= 1 << to_index(x + dx, y + dy)
+        for dx, dy in mp.attack_jump_deltas:
+            if on_board(x + dx, y + dy) and (enemies >> to_index(x + dx, y + dy)) & 1:
+                moves |= 1 << to_index(x + dx, y + dy)
+        for run in mp.attack_sliding_deltas:
+            for dx, dy in run:
+                if not on_board(x + dx, y + dy):
+                    break
+                to = to_index(x + dx, y + dy)
+                if (occupied >> to) & 1:
+                    moves |= (1 << to) & enemies
+                    break
+        for run in mp.translate_sliding_deltas:
+            for dx, dy in run:
+                if not on_board(x + dx, y + dy) or (occupied >> to_index(x + dx, y + dy)) & 1:
+                    break
+                moves |= 1 << to_index(x + dx, y + dy)
+        return moves
+
+    def test_tables_match_walking_the_deltas(self):
+        mpe = MovementPatternExternal(attack_jump_deltas=[(2, 1), (-1, -2), (5, 5)], translate_jump_deltas=[(0, 2), (-3, 0)],
+                                      attack_sliding_deltas=[[(1, 1), (2, 2), (3, 3)], [(0, -1), (0, -2), (-1, -3)]],
+                                      translate_sliding_deltas=[[(-1, 0), (-2, 0), (-3, 0)], [(1, 2), (2, 4)]])
+        to_index = GENERIC_GEOMETRY.to_index
+        holes = {(3, 3), (1, 4), (5, 0)}
+        bounds = sum(1 << to_index(x, y) for x in range(7) for y in range(6) if (x, y) not in holes)
+        pieces = [(0, to_index(0, 0), PieceType.King), (1, to_index(6, 5), PieceType.King), (0, to_index(2, 2), PieceType.Pawn),
+                  (1, to_index(4, 4), PieceType.Pawn), (1, to_index(3, 1), PieceType.Knight), (0, to_index(5, 3), PieceType.Rook)]
+        position = Position.custom(Dimensions(7, 6), bounds, {'a': mpe}, pieces)
+        mp = position.movement_rules[PieceType.Custom1]
+        movegen = MoveGenerator()
+        enemies = position.pieces[1].occupied
+        for x in range(7):
+            for y in range(6):
+                index = position.geometry.to_index(x, y)
+                if position.xy_in_bounds(x, y) and not (position.occupied >> index) & 1:
+                    self.assertEqual(movegen.get_custom_moves_bb(position, mp, index, position.occupied, enemies),
+                                     self.reference_moves(position, mp, index, position.occupied, enemies), (x, y))
+
+    def test_patterns_follow_the_bounds(self):
+        mpe = MovementPatternExternal(translate_jump_deltas=[(1, 0)])
+        to_index = GENERIC_GEOMETRY.to_index
+        position = Position.custom(Dimensions(4, 4), sum(1 << to_index(x, y) for x in range(4) for y in range(4)), {'a': mpe},
+                                   [(0, to_index(0, 0), PieceType.King), (1, to_index(3, 3), PieceType.King)])
+        mp = position.movement_rules[PieceType.Custom1]
+        self.assertEqual(mp.translate_jumps[position.geometry.to_index(0, 1)], 1 << position.geometry.to_index(1, 1))
+        position.set_bounds(Dimensions(4, 4), sum(1 << to_index(x, y) for x in range(4) for y in range(4) if x != 1))
+        mp = position.movement_rules[PieceType.Custom1]
+        self.assertEqual(mp.translate_jumps[position.geometry.to_index(0, 1)], 0)
+
+class TestAttackMaps(unittest.TestCase):
+    def test_starting_position(self):
+        position = Position.default()
+        movegen = MoveGenerator()
+        rank = lambda y: sum(1 << STANDARD_GEOMETRY.to_index(x, y) for x in range(8))
+        corners = (1 << STANDARD_GEOMETRY.to_index(0, 0)) | (1 << STANDARD_GEOMETRY.to_index(7, 0))
+        self.assertEqual(movegen.get_attack_map(position, 0), (rank(0) | rank(1) | rank(2)) & ~corners)
+        self.assertIs(position.properties.attack_maps[0], movegen.get_attack_map(position, 0))
+
+    def test_in_check_plays_no_null_move(self):
+        position = Position.from_fen("4k3/8/8/8/8/8/8/R3K2r w Q - 0 1")
+        movegen = MoveGenerator()
+        with mock.patch.object(position, 'make_move') as make_move:
+            self.assertTrue(movegen.in_check(position))
+        make_move.assert_not_called()
+
+    def test_castling_through_check(self):
+        movegen = MoveGenerator()
+        position = Position.from_fen("4k3/8/8/8/8/8/5r2/R3K2R w KQ - 0 1")
+        castles = [move_ for move_ in movegen.get_legal_moves(position) if move_type(move_) in (MOVE_KINGSIDE_CASTLE, MOVE_QUEENSIDE_CASTLE)]
+        self.assertEqual([move_type(move_) for move_ in castles], [MOVE_QUEENSIDE_CASTLE])
+
+    def test_maps_follow_the_position(self):
+        position = Position.default()
+        movegen = MoveGenerator()
+        before = movegen.get_attack_map(position, 0)
+        position.make_move(Move.new(STANDARD_GEOMETRY.to_index(4, 1), STANDARD_GEOMETRY.to_index(4, 3)))
+        self.assertNotEqual(movegen.get_attack_map(position, 0), before)
+        position.unmake_move()
+        self.assertEqual(movegen.get_attack_map(position, 0), before)
+
+class TestMovePicker(unittest.TestCase):
+    def pick_all(self, position, hash_move, captures_only=False):
+        movegen = MoveGenerator()
+        picker = MovePicker()
+        killer_moves = [[NULL_MOVE, NULL_MOVE] for _ in range(4)]
+        picker.reset(position, Evaluator(), movegen,
+                     1, hash_move, killer_moves, [0] * (FROM_TO_MASK + 1), captures_only)
+        moves = []
+        while True:
+            move_ = picker.next_move()
+            if move_ is None:
+                return moves
+            moves.append(move_)
+
+    def test_picks_every_move_once_hash_move_first(self):
+        position = Position.from_fen("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - ")
+        pseudo_moves = MoveGenerator().get_pseudo_moves(position)
+        hash_move = pseudo_moves[-1]
+        moves = self.pick_all(position, hash_move)
+        self.assertEqual(moves[0], hash_move)
+        self.assertEqual(sorted(moves), sorted(pseudo_moves))
+
+    def test_captures_only(self):
+        position = Position.from_fen("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10")
+        captures = MoveGenerator().get_capture_moves(position)
+        self.assertEqual(sorted(self.pick_all(position, NULL_MOVE, True)), sorted(captures))
+
+class TestMailbox(unittest.TestCase):
+    def assert_mailbox_matches_bitboards(self, position):
+        expected = [None] * position.geometry.num_squares
+        for owner, ps in enumerate(position.pieces):
+            for piece in ps.get_piece_refs():
+                self.assertEqual(sorted(piece.squares), list(iter_ones(piece.bitboard)))
+                for index in iter_ones(piece.bitboard):
+                    expected[index] = (owner, piece)
+        self.assertEqual(position.mailbox, expected)
+
+    def walk(self, position, movegen, depth):
+        self.assert_mailbox_matches_bitboards(position)
+        if depth == 0:
+            return
+        for move_ in movegen.get_legal_moves(position):
+            position.make_move(move_)
+            self.walk(position, movegen, depth - 1)
+            position.unmake_move()
+
+    def test_mailbox_follows_make_and_unmake(self):
+        movegen = MoveGenerator()
+        for fen in ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - ",
+                    "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1"):
+            position = Position.from_fen(fen)
+            before = position.to_string()
+            self.walk(position, movegen, 2)
+            self.assertEqual(position.to_string(), before)
+
+    def test_piece_at(self):
+        position = Position.default()
+        owner, piece = position.piece_at(STANDARD_GEOMETRY.to_index(4, 7))
+        self.assertEqual((owner, piece.piece_type), (1, PieceType.King))
+        self.assertIsNone(position.piece_at(STANDARD_GEOMETRY.to_index(4, 4)))
+        position.remove_piece(STANDARD_GEOMETRY.to_index(4, 7))
+        self.assertIsNone(position.piece_at(STANDARD_GEOMETRY.to_index(4, 7)))
+        self.assert_mailbox_matches_bitboards(position)
+
+class TestMakeUnmake(unittest.TestCase):
+    def walk(self, position, movegen, depth):
+        self.assertEqual(position.get_zobrist(), position.compute_zobrist_key())
+        self.assertEqual(position.properties.pawn_key, position.compute_pawn_key())
+        self.assertEqual(position.properties.material_key, position.compute_material_key())
+        self.assertEqual(position.occupied, position.pieces[0].occupied | position.pieces[1].occupied)
+        if depth == 0:
+            return
+        rights = position.properties.castling_rights
+        before = (rights.kingside_rights, rights.queenside_rights, rights.castled,
+                  position.properties.ep_square, position.get_zobrist(), position.occupied)
+        for move_ in movegen.get_legal_moves(position):
+            position.make_move(move_)
+            self.walk(position, movegen, depth - 1)
+            position.unmake_move()
+            self.assertEqual((rights.kingside_rights, rights.queenside_rights, rights.castled,
+                              position.properties.ep_square, position.get_zobrist(), position.occupied), before)
+
+    def test_unmake_restores_the_properties(self):
+        movegen = MoveGenerator()
+        for fen in ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - ",
+                    "n1n5/PPPk4/8/8/8/8/4Kppp/5N1N b - - 0 1"):
+            position = Position.from_fen(fen)
+            self.walk(position, movegen, 2)
+            self.assertEqual(position.ply, 0)
+
+    def test_castling_rights_are_not_shared(self):
+        position = Position.from_fen("r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1")
+        copy = position.properties.copy()
+        position.make_move(Move.new(STANDARD_GEOMETRY.to_index(4, 0), STANDARD_GEOMETRY.to_index(4, 1)))
+        self.assertFalse(position.properties.castling_rights.can_player_castle(0))
+        self.assertTrue(copy.castling_rights.can_player_castle(0))
+
+    def test_stack_grows_past_its_size(self):
+        position = Position.default()
+        plies = 4 * UNDO_STACK_SIZE + 4
+        knight_moves = [Move.new(STANDARD_GEOMETRY.to_index(6, 0), STANDARD_GEOMETRY.to_index(5, 2)),
+                        Move.new(STANDARD_GEOMETRY.to_index(6, 7), STANDARD_GEOMETRY.to_index(5, 5)),
+                        Move.new(STANDARD_GEOMETRY.to_index(5, 2), STANDARD_GEOMETRY.to_index(6, 0)),
+                        Move.new(STANDARD_GEOMETRY.to_index(5, 5), STANDARD_GEOMETRY.to_index(6, 7))]
+        key = position.get_zobrist()
+        for i in range(plies):
+            position.make_move(knight_moves[i % 4])
+        self.assertEqual(len(position.undo_stack), 8 * UNDO_STACK_SIZE)
+        for _ in range(plies):
+            position.unmake_move()
+        self.assertEqual(position.get_zobrist(), key)
+        self.assertEqual(position.to_string(), Position.default().to_string())
+
+class TestSnapshots(unittest.TestCase):
+    def perft(self, position, movegen, depth):
+        if depth == 0:
+            return 1
+        nodes = 0
+        for move_ in movegen.get_legal_moves(position):
+            position.make_move(move_)
+            nodes += self.perft(position, movegen, depth - 1)
+            position.unmake_move()
+        return nodes
+
+    def assert_same_position(self, a, b):
+        self.assertEqual(a.to_string(), b.to_string())
+        self.assertEqual(a.whos_turn, b.whos_turn)
+        self.assertEqual(a.properties.ep_square, b.properties.ep_square)
+        self.assertEqual(a.get_zobrist(), b.get_zobrist())
+        movegen = MoveGenerator()
+        self.assertEqual(self.perft(a, movegen, 2), self.perft(b, movegen, 2))
+
+    def test_round_trip(self):
+        position = Position.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - ")
+        position.make_move(Move.new(STANDARD_GEOMETRY.to_index(0, 1), STANDARD_GEOMETRY.to_index(0, 3)))
+        data = position.to_bytes()
+        self.assertEqual(len(data), position.snapshot_size())
+        copy = Position.from_bytes(data)
+        self.assertEqual(copy.variant_id, 0)
+        self.assertEqual(copy.properties.ep_square, STANDARD_GEOMETRY.to_index(0, 2))
+        self.assert_same_position(copy, position)
+
+    def test_custom_variant_from_a_shared_buffer(self):
+        position = TestLegalMoves().custom_position()
+        buffer = memoryview(bytearray(3 * position.snapshot_size()))
+        size = position.pack_into(buffer, position.snapshot_size())
+        copy = Position.from_bytes(buffer, size)
+        self.assertNotEqual(copy.variant_id, 0)
+        self.assertEqual(copy.variant_id, TestLegalMoves().custom_position().get_variant_id())
+        self.assertIs(copy.movement_rules[PieceType.Custom1], position.movement_rules[PieceType.Custom1])
+        self.assert_same_position(copy, position)
+        buffer.release()
+
+    def test_unknown_variant(self):
+        data = bytearray(Position.default().to_bytes())
+        data[1] = 255
+        with self.assertRaises(ValueError):
+            Position.from_bytes(data)
+
+    def test_clone_is_independent(self):
+        position = TestLegalMoves().custom_position()
+        clone = position.clone()
+        self.assert_same_position(clone, position)
+        move_ = MoveGenerator().get_legal_moves(clone)[0]
+        clone.make_move(move_)
+        self.assertNotEqual(clone.to_string(), position.to_string())
+        clone.unmake_move()
+        self.assertEqual(clone.to_string(), position.to_string())
+        mp = position.movement_rules[PieceType.Custom1]
+        tables = mp.attack_runs
+        clone.set_bounds(Dimensions(7, 7), sum(1 << GENERIC_GEOMETRY.to_index(x, y) for x in range(7) for y in range(7)))
+        self.assertIs(position.movement_rules[PieceType.Custom1], mp)
+        self.assertIs(mp.attack_runs, tables)
+
+class TestFENLoader(unittest.TestCase):
+    def test_en_passant_square(self):
+        position = Position.default()
+        position.make_move(Move.new(STANDARD_GEOMETRY.to_index(4, 1), STANDARD_GEOMETRY.to_index(4, 3)))
+        position.make_move(Move.new(STANDARD_GEOMETRY.to_index(4, 6), STANDARD_GEOMETRY.to_index(4, 4)))
+        from_fen = Position.from_fen(E4E5_FEN)
+        self.assertEqual(from_fen.properties.ep_square, STANDARD_GEOMETRY.to_index(4, 5))
+        self.assertEqual(from_fen.get_zobrist(), position.get_zobrist())
+
+    def test_extended_fen_matches_custom(self):
+        jumper = MovementPatternExternal(attack_jump_deltas=[(1, 2), (2, 1)], translate_jump_deltas=[(0, 1)])
+        to_index = GENERIC_GEOMETRY.to_index
+        bounds = sum(1 << to_index(x, y) for x in range(10) for y in range(6) if (x, y) != (4, 2))
+        custom = Position.custom(Dimensions(10, 6), bounds, {'a': jumper},
+                                 [(0, to_index(0, 0), PieceType.King), (0, to_index(1, 1), PieceType.Custom1),
+                                  (1, to_index(9, 5), PieceType.King), (1, to_index(5, 3), PieceType.Rook)])
+        position = Position.from_fen("9k/10/5r4/4x5/1A8/K9 w - - 0 1", {'a': jumper})
+        self.assertEqual(position.to_string(), custom.to_string())
+        self.assertEqual(position.bounds, custom.bounds)
+        movegen = MoveGenerator()
+        self.assertEqual(sorted(movegen.get_legal_moves(position)), sorted(movegen.get_legal_moves(custom)))
+        with self.assertRaises(ValueError):
+            Position.from_fen("9k/10/5r4/4x5/1A8/K9 w - - 0 1")
+        with self.assertRaises(ValueError):
+            Position.from_fen("9k/10/5r4/4x4/1A8/K9 w - - 0 1", {'a': jumper})
+
+    def test_load_positions(self):
+        lines = ["# perft positions", "", STARTING_FEN,
+                 "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - bm e2a6; id \"kiwipete\";"]
+        self.assertEqual(split_epd(lines[3])[1], {'bm': 'e2a6', 'id': 'kiwipete'})
+        positions = list(load_positions(lines))
+        self.assertEqual([p.to_string() for p in positions],
+                         [Position.default().to_string(), Position.from_fen(lines[3]).to_string()])
+        snapshots = list(load_positions(lines, snapshots=True))
+        self.assertEqual([Position.from_bytes(s).get_zobrist() for s in snapshots], [p.get_zobrist() for p in positions])
+
+    def test_load_custom_positions_share_their_variant(self):
+        jumper = MovementPatternExternal(attack_jump_deltas=[(1, 2)], translate_jump_deltas=[(0, 1)])
+        positions = list(load_positions(["k5/6/6/A5/6/K5 w - -", "k5/6/2A3/6/6/K5 b - -"], {'a': jumper}))
+        self.assertEqual(positions[0].variant_id, positions[1].variant_id)
+        self.assertIs(positions[0].movement_rules[PieceType.Custom1], positions[1].movement_rules[PieceType.Custom1])
+        self.assertEqual(positions[1].whos_turn, 1)
+
+class TestPieceIds(unittest.TestCase):
+    def test_ids_follow_piece_types(self):
+        self.assertEqual([PIECE_IDS[pt] for pt in PIECE_TYPES], list(range(NUM_PIECE_IDS)))
+        self.assertEqual(PIECE_IDS[PieceType.Rook], ROOK_ID)
+        self.assertTrue(all(PIECE_IDS[pt] >= FIRST_CUSTOM_ID for pt in CUSTOM_PIECE_TYPES))
+        position = Position.default()
+        for ps in position.pieces:
+            for piece in ps.get_piece_refs():
+                self.assertIs(ps.pieces_by_id[piece.piece_id], piece)
+
+    def test_custom_pieces_are_hashed(self):
+        jumper = MovementPatternExternal(attack_jump_deltas=[(1, 2), (2, 1)], translate_jump_deltas=[(0, 1)])
+        with_jumper = Position.from_fen("k5/6/6/A5/6/K5 w - -", {'a': jumper})
+        without_jumper = Position.from_fen("k5/6/6/6/6/K5 w - -", {'a': jumper})
+        self.assertNotEqual(with_jumper.get_zobrist(), without_jumper.get_zobrist())
+        movegen = MoveGenerator()
+        for move_ in movegen.get_legal_moves(with_jumper):
+            with_jumper.make_move(move_)
+            self.assertEqual(with_jumper.get_zobrist(), with_jumper.compute_zobrist_key())
+            with_jumper.unmake_move()
+
+    def test_custom_pieces_are_valued_from_their_pattern(self):
+        jumper = MovementPatternExternal(attack_jump_deltas=[(1, 2), (2, 1)], translate_jump_deltas=[(0, 1)])
+        position = Position.from_fen("k5/6/6/A5/6/K5 w - -", {'a': jumper})
+        evaluator = Evaluator()
+        value = evaluator.get_material_score(PieceType.Custom1, position)
+        self.assertGreater(value, 0)
+        self.assertEqual(evaluator.piece_values[PIECE_IDS[PieceType.Custom1]], value)
+
+class TestZobristKeys(unittest.TestCase):
+    def test_custom_keys_follow_the_definition(self):
+        jumper = MovementPatternExternal(attack_jump_deltas=[(1, 2), (2, 1)], translate_jump_deltas=[(0, 1)])
+        slider = MovementPatternExternal(attack_sliding_deltas=[[(1, 1), (2, 2)]])
+        first = Position.from_fen("k5/6/6/6/6/K5 w - -", {'a': jumper, 'c': slider})
+        second = Position.from_fen("k5/6/6/6/6/K5 w - -", {'a': slider, 'c': jumper})
+        custom1, custom2 = PIECE_IDS[PieceType.Custom1], PIECE_IDS[PieceType.Custom2]
+        for owner in range(2):
+            self.assertEqual(first.ZOBRIST_TABLE.zobrist[owner][custom1], second.ZOBRIST_TABLE.zobrist[owner][custom2])
+            self.assertNotEqual(first.ZOBRIST_TABLE.zobrist[owner][custom1], first.ZOBRIST_TABLE.zobrist[owner][custom2])
+        twins = Position.from_fen("k5/6/6/6/6/K5 w - -", {'a': jumper, 'c': jumper})
+        self.assertNotEqual(twins.ZOBRIST_TABLE.zobrist[0][custom1], twins.ZOBRIST_TABLE.zobrist[0][custom2])
+        self.assertIs(twins.ZOBRIST_TABLE, Position.from_fen("k5/6/6/6/6/K5 b - -", {'a': jumper, 'c': jumper}).ZOBRIST_TABLE)
+
+    def test_material_and_pawn_keys(self):
+        position = Position.from_fen("4k3/pp6/8/8/8/8/PP6/R3K3 w - - 0 1")
+        moved = Position.from_fen("4k3/1p6/p7/8/8/8/1P6/R3K1P1 w - - 0 1")
+        self.assertEqual(position.properties.material_key, moved.properties.material_key)
+        self.assertNotEqual(position.properties.pawn_key, moved.properties.pawn_key)
+        position.remove_piece(STANDARD_GEOMETRY.to_index(0, 0))
+        self.assertEqual(position.properties.material_key, position.compute_material_key())
+        self.assertNotEqual(position.properties.material_key, moved.properties.material_key)
+        position.add_piece(0, PieceType.Pawn, STANDARD_GEOMETRY.to_index(3, 3))
+        self.assertEqual(position.properties.pawn_key, position.compute_pawn_key())
+        self.assertEqual(position.properties.material_key, position.compute_material_key())
+        self.assertEqual(position.get_zobrist(), position.compute_zobrist_key())
+        restored = Position.from_bytes(position.to_bytes())
+        self.assertEqual((restored.properties.pawn_key, restored.properties.material_key),
+                         (position.properties.pawn_key, position.properties.material_key))
+
+class TestTranspositionTable(unittest.TestCase):
+    def test_entries_round_trip(self):
+        table = TranspositionTable(1)
+        self.assertEqual(table.size_mb(), 1)
+        move_ = Move.new(STANDARD_GEOMETRY.to_index(4, 1), STANDARD_GEOMETRY.to_index(4, 3))
+        table.insert(12345, FLAG_BETA, -99999, move_, 7)
+        entry = table.retrieve(12345)
+        self.assertEqual((entry_move(entry), entry_value(entry), entry_depth(entry), entry_flag(entry)),
+                         (move_, -99999, 7, FLAG_BETA))
+        self.assertEqual(table.retrieve(12346), 0)
+        table.insert(12346, FLAG_EXACT, float('inf'), NULL_MOVE, 1)
+        self.assertGreater(entry_value(table.retrieve(12346)), 99999)
+        table.clear()
+        self.assertEqual(table.retrieve(12345), 0)
+
+    def test_replacement_prefers_earlier_searches(self):
+        table = TranspositionTable(1)
+        key = 77
+        table.insert(key, FLAG_EXACT, 10, 1, 5)
+        table.insert(key, FLAG_ALPHA, 20, 2, 3)
+        self.assertEqual(entry_value(table.retrieve(key)), 10)
+        table.new_search()
+        table.insert(key, FLAG_ALPHA, 20, 2, 3)
+        self.assertEqual(entry_value(table.retrieve(key)), 20)
+
+        # a full cluster drops the shallowest entry of an earlier search before any entry of this search
+        keys = [key + table.num_clusters * i for i in range(1, ENTRIES_PER_CLUSTER + 1)]
+        table.new_search()
+        for i, k in enumerate(keys[:-1]):
+            table.insert(k, FLAG_EXACT, 0, 0, 1 + i)
+        table.insert(keys[-1], FLAG_EXACT, 0, 0, 1)
+        self.assertEqual(table.retrieve(key), 0)
+        self.assertTrue(all(table.retrieve(k) for k in keys))
+
+    def test_save_and_load(self):
+        position = Position.default()
+        table = TranspositionTable(1)
+        table.insert(position.get_zobrist(), FLAG_EXACT, 42, 7, 3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'table.tt')
+            table.save(path, position.get_variant_digest())
+            loaded = TranspositionTable.load(path, Position.from_fen(STARTING_FEN).get_variant_digest())
+            self.assertEqual(loaded.num_entries, table.num_entries)
+            self.assertEqual(loaded.retrieve(position.get_zobrist()), table.retrieve(position.get_zobrist()))
+            loaded.insert(1, FLAG_BETA, 1, 1, 1)
+            loaded.release()
+
+            engine = Engine()
+            engine.load_table(path)
+            self.assertEqual(engine.searcher.table_size_mb, 1)
+            self.assertIsInstance(engine.searcher.table_size_mb, int)
+            engine.searcher.transposition_table.release()
+
+            other = Position.from_fen("k5/6/6/6/6/K5 w - -")
+            with self.assertRaises(ValueError):
+                TranspositionTable.load(path, other.get_variant_digest())
+            with open(path, 'r+b') as f:
+                f.seek(-1, os.SEEK_END)
+                f.write(b'\x01')
+            with self.assertRaises(ValueError):
+                TranspositionTable.load(path, position.get_variant_digest())
+
+    def test_shared_table(self):
+        table = SharedTranspositionTable(1)
+        try:
+            context = multiprocessing.get_context()
+            process = context.Process(target=store_entry, args=(table, 12345))
+            process.start()
+            process.join()
+            self.assertEqual(process.exitcode, 0)
+            self.assertEqual(entry_value(table.retrieve(12345)), 42)
+
+            # an entry whose words were written by two different stores is a miss
+            index = (12345 % table.num_clusters) * ENTRIES_PER_CLUSTER
+            table.data[index] ^= 1
+            self.assertEqual(table.retrieve(12345), 0)
+        finally:
+            table.release()
+
+
+def store_entry(table, key):
+    table.insert(key, FLAG_EXACT, 42, 7, 3)
+    table.release()
+
+
+class TestLazySMP(unittest.TestCase):
+    def test_parallel_search_plays_a_legal_move(self):
+        engine = Engine.from_fen("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - ")
+        engine.searcher.table_size_mb = 1
+        geometry = engine.current_position.geometry
+        legal = {(geometry.from_index(move_from(m)), geometry.from_index(move_to(m)))
+                 for m in engine.move_generator.get_legal_moves(engine.current_position)}
+        x1, y1, x2, y2 = engine.get_best_move(2, threads=2)
+        self.assertIn(((x1, y1), (x2, y2)), legal)
+        self.assertIsInstance(engine.searcher.transposition_table, SharedTranspositionTable)
+        self.assertTrue(engine.play_best_move(2, threads=2))
+        engine.searcher.transposition_table.release()
+
+    def test_parallel_search_keeps_a_loaded_table(self):
+        engine = Engine()
+        engine.searcher.table_size_mb = 1
+        engine.get_best_move(2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'table.tt')
+            engine.save_table(path)
+            loaded = Engine()
+            loaded.load_table(path)
+        key = loaded.current_position.get_zobrist()
+        entry = loaded.searcher.transposition_table.retrieve(key)
+        self.assertTrue(entry)
+        table = loaded.searcher.share_table()
+        try:
+            self.assertEqual(table.retrieve(key), entry)
+            self.assertIsNotNone(loaded.get_best_move(2, threads=2))
+        finally:
+            table.release()
+
+class TestEngineSetup(unittest.TestCase):
+    def test_construction_is_quiet_and_lazy(self):
+        with mock.patch('builtins.print') as printed:
+            engine = Engine()
+        printed.assert_not_called()
+        self.assertIsNone(engine.searcher._transposition_table)
+
+    def test_from_fen(self):
+        engine = Engine.from_fen("8/8/8/8/8/8/8/K6k w - - 0 1")
+        self.assertEqual(engine.perft(2), 9)
+
+class TestSharedTables(unittest.TestCase):
+    def test_engines_share_tables(self):
+        first = Position.default()
+        second = Position.default()
+        self.assertIs(first.ZOBRIST_TABLE, second.ZOBRIST_TABLE)
+        self.assertIs(MoveGenerator().get_attack_tables(first), MoveGenerator().get_attack_tables(second))
+
+    def test_shared_tables_are_read_only(self):
+        attack_tables = get_shared_attack_tables(STANDARD_GEOMETRY)
+        with self.assertRaises(TypeError):
+            attack_tables.knight_attacks[0] = 0
+        with self.assertRaises(TypeError):
+            attack_tables.masks.north[0] = 0
+        with self.assertRaises(TypeError):
+            Position.default().ZOBRIST_TABLE.zobrist[0][0][0] = 0
+
+    def test_more_positions_cost_no_table_memory(self):
+        MoveGenerator().get_attack_tables(Position.default())
+        size = get_shared_tables_size()
+        self.assertGreater(size, 0)
+        for _ in range(4):
+            MoveGenerator().get_attack_tables(Position.default())
+        self.assertEqual(get_shared_tables_size(), size)
+
+    def test_freeze_shared_tables(self):
+        get_shared_attack_tables(STANDARD_GEOMETRY)
+        freeze_shared_tables()
+        try:
+            self.assertGreater(gc.get_freeze_count(), 0)
+        finally:
+            gc.unfreeze()
+
 if __name__ == '__main__':
     unittest.main()
 
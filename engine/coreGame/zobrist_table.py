@@ -1,6 +1,10 @@
+import hashlib
 import random
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Sequence, Tuple
 from .piece import Piece, PieceType
+from .move import PIECE_IDS, NUM_PIECE_IDS, FIRST_CUSTOM_ID
+from .geometry import Geometry
+from .movement_pattern import MovementPattern, internal_mp_to_external
 
 '''
 This class is used to generate zobrist keys for a position.  A zobrist key is a semi-unique number that represents a position.  It is used to store the values of positions that have been evaluated before, so that they do not need to be re-evaluated.  The zobrist key is used as an index in the transposition table.
@@ -8,23 +12,47 @@ This class is used to generate zobrist keys for a position.  A zobrist key is a
 The way this works is you generate a random number for each square/piece combination, the EP square, the player to move, and the castling rights.  Then, to get the zobrist key for a position, you XOR together the random numbers for each piece on the board.  You also XOR together the random numbers for the player to move, the castling rights, and the en passant square.  The advantage to using XOR here is that it is its own inverse, so you can easily revert some transformation of the board by XORing the same random number again.
 
 This is a very efficient way to store the values of positions, and is used in many chess engines.
+
+Every key comes from a fixed seed, so a position hashes the same in every engine and every process, which keeps keys
+stored in a transposition table file or shared between workers valid.  The keys of a custom piece are seeded from the
+definition of the piece (its movement pattern) rather than from the order the pieces were registered in.
+
+The same keys give two smaller keys that a position keeps alongside its zobrist key:
+    - the pawn key, the keys of the pawns of both players on their squares
+    - the material key, for every piece of which a player has n, the keys of that piece on the squares 0 to n - 1,
+      so it only depends on how many pieces of each kind are on the board
 '''
 
+ZOBRIST_SEED = 5435651169991665628
+
 class ZobristTable:
-    def __init__(self):
-        self.rng = random.Random(5435651169991665628)
+    def __init__(self, num_squares: int = 256, custom_definitions: Sequence[Optional[str]] = ()):
+        # Only the squares of the geometry the table is built for get keys, see geometry.py
+        # custom_definitions holds the definition of each custom piece in id order, see get_custom_definitions
+        self.num_squares = num_squares
+        self.custom_definitions = tuple(custom_definitions)
+        self.rng = random.Random(ZOBRIST_SEED)
         self.ep_zobrist = [self.rng.getrandbits(64) for _ in range(17)]
         self.zobrist = [[] for _ in range(2)]
         for i in range(2):
             for j in range(6):
-                randoms = [self.rng.getrandbits(64) for _ in range(256)]
+                randoms = [self.rng.getrandbits(64) for _ in range(num_squares)]
                 self.zobrist[i].append(randoms)
-        self.custom_zobrist: Dict[Tuple[int, PieceType], List[int]] = {}
         self.white_to_move = self.rng.getrandbits(64)
         self.w_q_castle = self.rng.getrandbits(64)
         self.b_q_castle = self.rng.getrandbits(64)
         self.w_k_castle = self.rng.getrandbits(64)
         self.b_k_castle = self.rng.getrandbits(64)
+        # the custom pieces come last, so the keys of the standard pieces stay the same
+        # self.zobrist is indexed by [owner][piece id][square], see move.py
+        for i in range(2):
+            for j in range(FIRST_CUSTOM_ID, NUM_PIECE_IDS):
+                self.zobrist[i].append(self._make_randoms())
+        for j, definition in enumerate(self.custom_definitions):
+            if definition is not None:
+                rng = random.Random(get_custom_seed(definition))
+                for i in range(2):
+                    self.zobrist[i][FIRST_CUSTOM_ID + j] = [rng.getrandbits(64) for _ in range(num_squares)]
 
     def get_to_move_zobrist(self, player_num: int) -> int:
         return self.white_to_move
@@ -42,32 +70,30 @@ class ZobristTable:
             return 0
 
     def get_zobrist_sq_from_pt(self, pt: PieceType, owner: int, index: int) -> int:
-        if pt == PieceType.King:
-            return self.zobrist[owner][0][index]
-        elif pt == PieceType.Queen:
-            return self.zobrist[owner][1][index]
-        elif pt == PieceType.Rook:
-            return self.zobrist[owner][2][index]
-        elif pt == PieceType.Bishop:
-            return self.zobrist[owner][3][index]
-        elif pt == PieceType.Knight:
-            return self.zobrist[owner][4][index]
-        elif pt == PieceType.Pawn:
-            return self.zobrist[owner][5][index]
-        else:
-            if (owner, pt) not in self.custom_zobrist:
-                return 0
-            return self.custom_zobrist[(owner, pt)][index]
+        return self.zobrist[owner][PIECE_IDS[pt]][index]
 
     def get_zobrist_sq(self, piece: Piece, index: int) -> int:
-        return self.get_zobrist_sq_from_pt(piece.piece_type, piece.player_num, index)
+        return self.zobrist[piece.player_num][piece.piece_id][index]
 
     def get_ep_zobrist_file(self, rank: int) -> int:
         return self.ep_zobrist[rank]
 
-    def register_piecetype(self, player_num: int, pt: PieceType):
-        randoms = self._make_randoms()
-        self.custom_zobrist[(player_num, pt)] = randoms
-
     def _make_randoms(self) -> List[int]:
-        return [self.rng.getrandbits(64) for _ in range(256)]
\ No newline at end of file
+        return [self.rng.getrandbits(64) for _ in range(self.num_squares)]
+
+
+def get_custom_seed(definition: str) -> int:
+    # Returns the seed of the keys of a custom piece, the built in hash of a str changes with every process
+    digest = hashlib.blake2b(definition.encode(), digest_size=8, key=ZOBRIST_SEED.to_bytes(8, 'little')).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def get_custom_definitions(movement_rules: Dict[PieceType, MovementPattern], custom_types: Sequence[PieceType],
+                           geometry: Geometry) -> Tuple[str, ...]:
+    # Returns the definition of every custom piece type in id order, the pattern of a piece in the generic
+    # layout, numbered when a variant has several pieces that move alike
+    definitions = []
+    for pt in custom_types:
+        definition = str(internal_mp_to_external(movement_rules[pt], geometry))
+        definitions.append(f"{definition}#{sum(d.startswith(definition + '#') for d in definitions)}")
+    return tuple(definitions)
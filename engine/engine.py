@@ -6,17 +6,24 @@ from typing import List, Tuple, Dict, Optional
 import time
 
 class Engine:
-    def __init__(self, position = cg.Position.default()):
+    def __init__(self, position: Optional[cg.Position] = None, move_generator: Optional[cg.MoveGenerator] = None,
+                 evaluator: Optional[cg.Evaluator] = None, searcher: Optional[Searcher] = None, verbose: bool = False):
+        # Every part is built here (not as a default argument) and only when it isn't passed in.
+        # The expensive pieces, the attack tables and the transposition table, are built on first use.
         timer = time.time()
-        self.current_position: cg.Position = position
-        print('position setup time:', time.time() - timer)
+        self.current_position: cg.Position = position if position is not None else cg.Position.default()
+        if verbose:
+            print('position setup time:', time.time() - timer)
         timer = time.time()
-        self.move_generator: cg.MoveGenerator = cg.MoveGenerator()
-        print('move generator setup time:', time.time() - timer)
-        self.evaluator: cg.Evaluator = cg.Evaluator()
-        print('evaluator setup time:', time.time() - timer)
-        self.searcher: Searcher = Searcher()
-        print('searcher setup time:', time.time() - timer)
+        self.move_generator: cg.MoveGenerator = move_generator if move_generator is not None else cg.MoveGenerator()
+        if verbose:
+            print('move generator setup time:', time.time() - timer)
+        self.evaluator: cg.Evaluator = evaluator if evaluator is not None else cg.Evaluator()
+        if verbose:
+            print('evaluator setup time:', time.time() - timer)
+        self.searcher: Searcher = searcher if searcher is not None else Searcher()
+        if verbose:
+            print('searcher setup time:', time.time() - timer)
 
     @classmethod
     def default(cls) -> 'Engine':
@@ -32,20 +39,19 @@ class Engine:
         self.current_position.register_piecetype(char_rep, mpe)
 
     def add_piece(self, owner: int, piece_type: cg.PieceType, x: int, y: int):
-        self.current_position.add_piece(owner, piece_type, cg.to_index(x, y))
+        self.current_position.add_piece(owner, piece_type, self.current_position.geometry.to_index(x, y))
 
-    def remove_piece(self, index: int):
-        self.current_position.remove_piece(index)
+    def remove_piece(self, x: int, y: int):
+        self.current_position.remove_piece(self.current_position.geometry.to_index(x, y))
 
     def make_move(self, x1: int, y1: int, x2: int, y2: int) -> bool:
-        from_ = cg.to_index(x1, y1)
-        to = cg.to_index(x2, y2)
+        geometry = self.current_position.geometry
+        from_ = geometry.to_index(x1, y1)
+        to = geometry.to_index(x2, y2)
 
-        moves = self.move_generator.get_pseudo_moves(self.current_position)
+        moves = self.move_generator.get_legal_moves(self.current_position)
         for move_ in moves:
-            if not self.move_generator.is_move_legal(move_, self.current_position):
-                continue
-            if move_.get_from() == from_ and move_.get_to() == to:
+            if cg.move_from(move_) == from_ and cg.move_to(move_) == to:
                 self.current_position.make_move(move_)
                 return True
         return False
@@ -58,23 +64,14 @@ class Engine:
 
     @classmethod
     def from_fen(cls, fen: str) -> 'Engine':
-        return cls(
-            move_generator=cg.MoveGenerator(),
-            evaluator=cg.Evaluator(),
-            searcher=Searcher(),
-            current_position=cg.Position.from_fen(fen)
-        )
+        return cls(cg.Position.from_fen(fen))
 
     def perft(self, depth: int) -> int:
         nodes = 0
 
-        moves = self.move_generator.get_pseudo_moves(self.current_position)
-
         if depth == 1:
             return self.move_generator.count_legal_moves(self.current_position)
-        for move_ in moves:
-            if not self.move_generator.is_move_legal(move_, self.current_position):
-                continue
+        for move_ in self.move_generator.get_legal_moves(self.current_position):
             self.current_position.make_move(move_)
             nodes += self.perft(depth - 1)
             self.current_position.unmake_move()
@@ -83,16 +80,12 @@ class Engine:
     def perft_divide(self, depth: int) -> int:
         nodes = 0
 
-        moves = self.move_generator.get_pseudo_moves(self.current_position)
         if depth == 1:
             return self.move_generator.count_legal_moves(self.current_position)
         printing = []
-        for move_ in moves:
-            if not self.move_generator.is_move_legal(move_, self.current_position):
-                continue
-
-            x, y = cg.from_index(move_.get_from())
-            x2, y2 = cg.from_index(move_.get_to())
+        for move_ in self.move_generator.get_legal_moves(self.current_position):
+            x, y = self.current_position.geometry.from_index(cg.move_from(move_))
+            x2, y2 = self.current_position.geometry.from_index(cg.move_to(move_))
             self.current_position.make_move(move_)
             plus = self.perft(depth - 1)
             nodes += plus
@@ -103,20 +96,21 @@ class Engine:
             print(s)
         return nodes
 
-    def play_best_move(self, depth: int) -> bool:
-        best = self.searcher.get_best_move(self.current_position, self.evaluator, self.move_generator, depth)
+    def play_best_move(self, depth: int, threads: int = 1) -> bool:
+        best = self.searcher.get_best_move(self.current_position, self.evaluator, self.move_generator, depth, threads)
         if best:
-            x1, y1 = cg.from_index(best.get_from())
-            x2, y2 = cg.from_index(best.get_to())
+            x1, y1 = self.current_position.geometry.from_index(cg.move_from(best))
+            x2, y2 = self.current_position.geometry.from_index(cg.move_to(best))
             return self.make_move(x1, y1, x2, y2)
         else:
             return False
 
-    def get_best_move(self, depth: int) -> Optional[Tuple[int, int, int, int]]:
-        best = self.searcher.get_best_move(self.current_position, self.evaluator, self.move_generator, depth)
+    def get_best_move(self, depth: int, threads: int = 1) -> Optional[Tuple[int, int, int, int]]:
+        # threads > 1 searches with that many worker processes, see lazy_smp.py
+        best = self.searcher.get_best_move(self.current_position, self.evaluator, self.move_generator, depth, threads)
         if best:
-            x1, y1 = cg.from_index(best.get_from())
-            x2, y2 = cg.from_index(best.get_to())
+            x1, y1 = self.current_position.geometry.from_index(cg.move_from(best))
+            x2, y2 = self.current_position.geometry.from_index(cg.move_to(best))
             return x1, y1, x2, y2
         else:
             return None
@@ -125,8 +119,8 @@ class Engine:
         result = self.searcher.get_best_move_timeout(self.current_position, self.evaluator, self.move_generator, max_sec)
         if result:
             best, depth = result
-            x1, y1 = cg.from_index(best.get_from())
-            x2, y2 = cg.from_index(best.get_to())
+            x1, y1 = self.current_position.geometry.from_index(cg.move_from(best))
+            x2, y2 = self.current_position.geometry.from_index(cg.move_to(best))
             return self.make_move(x1, y1, x2, y2), depth
         else:
             return False, 0
@@ -135,12 +129,19 @@ class Engine:
         result = self.searcher.get_best_move_timeout(self.current_position, self.evaluator, self.move_generator, max_sec)
         if result:
             best, depth = result
-            x1, y1 = cg.from_index(best.get_from())
-            x2, y2 = cg.from_index(best.get_to())
+            x1, y1 = self.current_position.geometry.from_index(cg.move_from(best))
+            x2, y2 = self.current_position.geometry.from_index(cg.move_to(best))
             return (x1, y1, x2, y2), depth
         else:
             return None
 
+    def save_table(self, path: str):
+        # Saves what the searcher learned, so an engine started later can pick it up with load_table
+        self.searcher.save_table(path, self.current_position)
+
+    def load_table(self, path: str):
+        self.searcher.load_table(path, self.current_position)
+
     def moves_from(self, x: int, y: int) -> List[Tuple[int, int]]:
         moves = self.move_generator.get_legal_moves_as_tuples(self.current_position)
         possible_moves = []
@@ -171,14 +172,14 @@ class Engine:
     def get_pieces(self):
         # returns a list of tuples of the form (owner, x, y, piece_char)
         pieces = []
-        for x in range(self.current_position.dimensions.width):
-            for y in range(self.current_position.dimensions.height):
-                index = cg.to_index(x, y)
-                pos_info = self.current_position.piece_at(index)
-                if pos_info is not None:
-                    owner, piece = pos_info
-                    color = 'white' if owner == 0 else 'black'
+        from_index = self.current_position.geometry.from_index
+        for owner, ps in enumerate(self.current_position.pieces):
+            color = 'white' if owner == 0 else 'black'
+            for piece in ps.get_piece_refs():
+                for index in piece.squares:
+                    x, y = from_index(index)
                     pieces.append((color, x, y, piece.piece_type.name))
+        pieces.sort(key=lambda p: (p[1], p[2]))
         return pieces
 
 
@@ -205,7 +206,7 @@ if __name__ == '__main__':
 
 
     start = time.time()
-    engine = Engine(cg.Position.default())
+    engine = Engine(cg.Position.default(), verbose=True)
     print(engine.current_position.to_string())
     print('engine_setup_time:', time.time() - start)
 
@@ -64,16 +64,13 @@ class Game:
         return self.current_position.get_zobrist()
 
     def make_move(self, move_generator: cg.MoveGenerator, x1: int, y1: int, x2: int, y2: int) -> bool:
-        from_ = cg.to_index(x1, y1)
-        to = cg.to_index(x2, y2)
-        moves = move_generator.get_pseudo_moves(self.current_position)
-        print('We made it past get_pseudo_moves')
+        geometry = self.current_position.geometry
+        from_ = geometry.to_index(x1, y1)
+        to = geometry.to_index(x2, y2)
+        moves = move_generator.get_legal_moves(self.current_position)
 
-        i = 0
         for move_ in moves:
-            if not move_generator.is_move_legal(move_, self.current_position):
-                continue
-            if move_.get_from() == from_ and move_.get_to() == to:
+            if cg.move_from(move_) == from_ and cg.move_to(move_) == to:
                 self.current_position.make_move(move_)
                 return True
         
@@ -0,0 +1,115 @@
+import multiprocessing
+import random
+import time
+from multiprocessing.connection import wait
+from typing import Optional
+from . import coreGame as cg
+from .transposition_table import SharedTranspositionTable, entry_move, entry_value
+
+'''
+Lazy SMP, the parallel search behind Searcher.get_best_move(..., threads=n).  The GIL keeps threads from searching at
+the same time, so the workers are processes.  Every worker runs its own iterative deepening search of the same root,
+and they only talk to each other through a SharedTranspositionTable: whatever one worker stores, the others pick up
+as cutoffs and hash moves, so together they get through the tree faster than one of them alone.
+
+The workers are made to search differently, otherwise they would all walk the same tree in the same order:
+    - the odd workers search one ply deeper than asked
+    - every worker but the first starts with a little noise in its history table, which changes its quiet move order
+After every completed iteration a worker writes the depth and the best move of the root to its slot of a shared
+array.  As soon as one worker completes the asked depth the others are stopped, and the move of the deepest completed
+iteration is played.  The workers are started on every call, which on short searches is a sizeable part of the time,
+so every worker also records when its search began and the summary line reports how long the start-up took.
+
+Workers are forked where the platform allows it, so they start with the tables (and registered variants, see
+shared_tables.py) of the parent.  Elsewhere they are spawned, and can only read snapshots of standard chess.
+'''
+
+
+def get_context():
+    # Returns the multiprocessing context the workers are started with
+    return multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+
+
+def search_worker(searcher_class, table: SharedTranspositionTable, snapshot: bytes, eval: cg.Evaluator,
+                  movegen: cg.MoveGenerator, depth: int, index: int, results, connection):
+    # Runs the iterative deepening of one worker, see the notes above.  results[3 * index] is the last completed
+    # iteration packed as depth << 32 | move, results[3 * index + 1] the number of nodes searched so far and
+    # results[3 * index + 2] the time.monotonic_ns() the search began at.
+    position = cg.Position.from_bytes(snapshot)
+    searcher = searcher_class(transposition_table=table)
+    table.read_generation()
+    if index:
+        rng = random.Random(index)
+        history_moves = searcher.history_moves
+        history_moves[:] = [b & 1 for b in rng.randbytes(len(history_moves))]
+
+    zobrist_key = position.get_zobrist()
+    results[3 * index + 2] = time.monotonic_ns()
+    for d in range(1, depth + index % 2 + 1):
+        searcher.alphabeta(position, eval, movegen, d, -float('inf'), float('inf'), True)
+        entry = table.retrieve(zobrist_key)
+        if entry:
+            results[3 * index] = d << 32 | entry_move(entry)
+        results[3 * index + 1] = searcher.nodes_searched
+        if d == depth:
+            connection.send_bytes(b'')
+    connection.close()
+
+
+def get_best_move(searcher, position: cg.Position, eval: cg.Evaluator, movegen: cg.MoveGenerator, depth: int,
+                  threads: int) -> Optional[int]:
+    # Searches position with threads workers, returns the move of the deepest iteration any of them completed
+    called = time.monotonic_ns()
+    table = searcher.share_table()
+    table.new_search()
+    context = get_context()
+    results = context.RawArray('Q', 3 * threads)
+    snapshot = position.to_bytes()
+
+    workers = []
+    readers = []
+    try:
+        for index in range(threads):
+            reader, writer = context.Pipe(duplex=False)
+            worker = context.Process(target=search_worker, daemon=True,
+                                     args=(type(searcher), table, snapshot, eval, movegen, depth, index, results, writer))
+            worker.start()
+            writer.close()
+            workers.append(worker)
+            readers.append(reader)
+
+        # wait for a worker to complete the depth, a worker that exits without doing so has failed
+        reached = False
+        waiting = list(readers)
+        while not reached and waiting:
+            for reader in wait(waiting):
+                try:
+                    reader.recv_bytes()
+                    reached = True
+                except EOFError:
+                    waiting.remove(reader)
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+        for worker in workers:
+            worker.join()
+        for reader in readers:
+            reader.close()
+
+    best_depth = 0
+    best_move = None
+    nodes = 0
+    startup = 0
+    for index in range(threads):
+        completed = results[3 * index]
+        nodes += results[3 * index + 1]
+        startup = max(startup, results[3 * index + 2] - called)
+        if completed >> 32 > best_depth:
+            best_depth = completed >> 32
+            best_move = completed & 0xFFFFFFFF
+    entry = table.retrieve(position.get_zobrist())
+    score = entry_value(entry) if entry else None
+    print(f"score:{score} depth: {best_depth}, nodes: {nodes}, workers: {threads}, "
+          f"startup: {startup // 1000000} ms of {(time.monotonic_ns() - called) // 1000000} ms")
+    return best_move
@@ -0,0 +1,146 @@
+from . import coreGame as cg
+from array import array
+from typing import List, Optional
+
+'''
+The MovePicker hands the moves of a node to the searcher one at a time, in stages, so the work of
+generating and ordering the later stages is skipped whenever an earlier move causes a cutoff:
+    1. the hash move from the transposition table, checked with is_pseudo_legal before anything is generated
+    2. the captures, in the order generate_capture_moves writes them (most valuable victim, least valuable attacker)
+    3. the killer moves of the depth, also checked with is_pseudo_legal
+    4. the quiet moves, ordered by the history heuristic
+The quiescence search only runs the first two stages, with a hash move that is a capture.  A move handed
+out in one stage is skipped in the later ones.
+
+The searcher keeps one picker per ply, so the move and score buffers of a picker are reused by every
+node searched at its ply.
+'''
+
+STAGE_HASH = 0
+STAGE_GEN_CAPTURES = 1
+STAGE_CAPTURES = 2
+STAGE_KILLERS = 3
+STAGE_GEN_QUIETS = 4
+STAGE_QUIETS = 5
+STAGE_DONE = 6
+
+
+class MovePicker:
+    def __init__(self):
+        self.moves = cg.new_move_buffer()
+        self.scores = array('q', bytes(8 * cg.MAX_MOVES))
+        self.stage = STAGE_DONE
+
+    def reset(self, position: cg.Position, eval: cg.Evaluator, movegen: cg.MoveGenerator, depth: int,
+              hash_move: int, killer_moves: List[List[int]], history_moves: List[int], captures_only: bool = False):
+        # Starts picking the moves of a new node, hash_move is NULL_MOVE when there is none
+        self.position = position
+        self.eval = eval
+        self.movegen = movegen
+        self.depth = depth
+        self.killer_moves = killer_moves
+        self.history_moves = history_moves
+        self.captures_only = captures_only
+        if captures_only and not cg.is_capture(hash_move):
+            hash_move = cg.NULL_MOVE
+        self.hash_move = hash_move
+        self.killer_index = 0
+        self.played_killer_1 = cg.NULL_MOVE
+        self.played_killer_2 = cg.NULL_MOVE
+        self.index = 0
+        self.end = 0
+        self.stage = STAGE_HASH
+
+    def next_move(self) -> Optional[int]:
+        # Returns the next move to search, None once every stage is done
+        while True:
+            stage = self.stage
+            if stage == STAGE_HASH:
+                self.stage = STAGE_GEN_CAPTURES
+                hash_move = self.hash_move
+                if hash_move != cg.NULL_MOVE and self.movegen.is_pseudo_legal(self.position, hash_move):
+                    return hash_move
+                self.hash_move = cg.NULL_MOVE
+
+            elif stage == STAGE_GEN_CAPTURES:
+                self.index = 0
+                self.end = self.movegen.generate_capture_moves(self.position, self.moves)
+                self.stage = STAGE_CAPTURES
+
+            elif stage == STAGE_CAPTURES:
+                moves = self.moves
+                while self.index < self.end:
+                    move_ = moves[self.index]
+                    self.index += 1
+                    if move_ != self.hash_move:
+                        return move_
+                self.stage = STAGE_DONE if self.captures_only else STAGE_KILLERS
+
+            elif stage == STAGE_QUIETS:
+                move_ = self.pick_best()
+                if move_ is not None:
+                    return move_
+                self.stage = STAGE_DONE
+
+            elif stage == STAGE_KILLERS:
+                killers = self.killer_moves[self.depth]
+                while self.killer_index < 2:
+                    killer = killers[self.killer_index]
+                    self.killer_index += 1
+                    if killer == cg.NULL_MOVE or killer == self.hash_move or killer == self.played_killer_1:
+                        continue
+                    if cg.is_capture(killer) or not self.movegen.is_pseudo_legal(self.position, killer):
+                        continue
+                    if self.played_killer_1 == cg.NULL_MOVE:
+                        self.played_killer_1 = killer
+                    else:
+                        self.played_killer_2 = killer
+                    return killer
+                self.stage = STAGE_GEN_QUIETS
+
+            elif stage == STAGE_GEN_QUIETS:
+                self.index = 0
+                self.end = self.movegen.generate_quiet_moves(self.position, self.moves)
+                self.score_moves()
+                self.stage = STAGE_QUIETS
+
+            else:
+                return None
+
+    def score_moves(self):
+        # Scores the quiet moves for ordering
+        moves = self.moves
+        scores = self.scores
+        end = self.end
+        if end > len(scores):
+            scores.frombytes(bytes(8 * (len(moves) - len(scores))))
+        position = self.position
+        depth = self.depth
+        history_moves = self.history_moves
+        killer_moves = self.killer_moves
+        score_move = self.eval.score_move
+        for i in range(end):
+            scores[i] = score_move(depth, history_moves, killer_moves, position, moves[i])
+
+    def pick_best(self) -> Optional[int]:
+        # Selection sort step, hands out the best scored remaining quiet move
+        moves = self.moves
+        scores = self.scores
+        end = self.end
+        while self.index < end:
+            current = self.index
+            best_score = scores[current]
+            best_index = current
+            for i in range(current + 1, end):
+                if scores[i] > best_score:
+                    best_score = scores[i]
+                    best_index = i
+            move_ = moves[best_index]
+            if best_index != current:
+                moves[best_index] = moves[current]
+                scores[best_index] = scores[current]
+            self.index = current + 1
+            if move_ == self.hash_move or move_ == self.played_killer_1 or move_ == self.played_killer_2:
+                continue
+            return move_
+        return None
@@ -1,27 +1,78 @@
 from . import coreGame as cg
-from .transposition_table import TranspositionTable, Entry, EntryFlag
+from .transposition_table import (TranspositionTable, SharedTranspositionTable, DEFAULT_TABLE_MB, FLAG_ALPHA,
+                                  FLAG_EXACT, FLAG_BETA, entry_move, entry_value, entry_depth, entry_flag)
+from . import lazy_smp
+from .move_picker import MovePicker
 from datetime import time, timedelta as dt
 from typing import Optional
 
+MAX_PLY = 128 # initial number of per ply move pickers, more are added if a search goes deeper
+
 
 class Searcher:
-    def __init__(self):
-        self.transposition_table = TranspositionTable()
+    def __init__(self, table_size_mb: int = DEFAULT_TABLE_MB, transposition_table: Optional[TranspositionTable] = None):
+        # The transposition table is large, so it is only built once a search needs it.  A table can be passed in
+        # instead, like a SharedTranspositionTable that several searchers store into.
+        self.table_size_mb = table_size_mb
+        self._transposition_table: Optional[TranspositionTable] = transposition_table
         # stores two killer moves for each ply
         # indexed by killer_moves[depth][0] and killer_moves[depth][1]
-        self.killer_moves = [[cg.Move.null(), cg.Move.null()] for _ in range(64)]
-        # stores the history heuristic values for each move
-        self.history_moves = [[0] * 256 for _ in range(256)]
+        self.killer_moves = [[cg.NULL_MOVE, cg.NULL_MOVE] for _ in range(64)]
+        # stores the history heuristic values for each move, indexed by its from and to squares
+        # (move & cg.FROM_TO_MASK)
+        self.history_moves = [0] * (cg.FROM_TO_MASK + 1)
+
+        # one staged move picker per ply, each owning the move and score buffers of its ply (see move_picker.py).
+        # self.ply is the distance from the root of the search, see make_move and unmake_move
+        self.ply = 0
+        self.move_pickers = [MovePicker() for _ in range(MAX_PLY)]
 
         # tracks the number of nodes searched for efficiency analysis
         self.nodes_searched = 0
         self.nodes_fail_high_first = 0
         self.nodes_fail_high = 0
 
-    def get_best_move(self, position: cg.Position, eval: cg.Evaluator, movegen: cg.MoveGenerator, depth: int) -> cg.Move:
-        # iterative deepening
+    @property
+    def transposition_table(self) -> TranspositionTable:
+        if self._transposition_table is None:
+            self._transposition_table = TranspositionTable(self.table_size_mb)
+        return self._transposition_table
+
+    def share_table(self) -> SharedTranspositionTable:
+        # Moves the transposition table into shared memory, keeping its entries, and returns it
+        table = self._transposition_table
+        if not isinstance(table, SharedTranspositionTable):
+            if table is None:
+                shared = SharedTranspositionTable(self.table_size_mb)
+            else:
+                shared = SharedTranspositionTable(num_clusters=table.num_clusters)
+                shared.keys[:] = table.keys
+                shared.data[:] = table.data
+                shared.generation = table.generation
+                table.release()
+            self._transposition_table = table = shared
+        return table
+
+    def save_table(self, path: str, position: cg.Position):
+        # Saves the transposition table to a file, for the variant of position (see TranspositionTable.save)
+        self.transposition_table.save(path, position.get_variant_digest())
+
+    def load_table(self, path: str, position: cg.Position):
+        # Replaces the transposition table with one saved for the variant of position, raising a ValueError
+        # if the file was saved for another variant or is damaged
+        table = TranspositionTable.load(path, position.get_variant_digest())
+        if self._transposition_table is not None:
+            self._transposition_table.release()
+        self._transposition_table = table
+        self.table_size_mb = table.size_mb()
+
+    def get_best_move(self, position: cg.Position, eval: cg.Evaluator, movegen: cg.MoveGenerator, depth: int,
+                      threads: int = 1) -> int:
+        # iterative deepening, with more than one thread the search runs in parallel processes (see lazy_smp.py)
+        if threads > 1:
+            return lazy_smp.get_best_move(self, position, eval, movegen, depth, threads)
         self.clear_heuristics()
-        self.transposition_table.set_ancient()
+        self.transposition_table.new_search()
         for d in range(1, depth + 1):
             alpha = -float('inf')
             beta = float('inf')
@@ -33,12 +84,12 @@ class Searcher:
             self.clear_search_stats()
 
         entry = self.transposition_table.retrieve(position.get_zobrist())
-        return entry.move_ if entry else None
+        return entry_move(entry) if entry else None
 
     def get_best_move_timeout(self, position: cg.Position, eval: cg.Evaluator, movegen: cg.MoveGenerator, time_sec: int):
         # iterative deepening but with a time limit rather than a depth limit
         self.clear_heuristics()
-        self.transposition_table.set_ancient()
+        self.transposition_table.new_search()
         d = 1
         start = time.time()
         max_time = time.fromtimestamp(start.timestamp() + time_sec)
@@ -57,7 +108,7 @@ class Searcher:
             d += 1
 
         entry = self.transposition_table.retrieve(position.get_zobrist())
-        return (entry.move_, d) if entry else None
+        return (entry_move(entry), d) if entry else None
 
     def alphabeta(self, position: cg.Position, eval: cg.Evaluator, movegen: cg.MoveGenerator,
                   depth: int, alpha: int, beta: int, do_null: bool) -> int:
@@ -73,18 +124,20 @@ class Searcher:
 
         # check if the current position is in the transposition table
         entry = self.transposition_table.retrieve(position.get_zobrist())
-        if entry and entry.depth >= depth:
-            if entry.flag == EntryFlag.EXACT:
-                if entry.value < alpha:
+        if entry and entry_depth(entry) >= depth:
+            flag = entry_flag(entry)
+            value = entry_value(entry)
+            if flag == FLAG_EXACT:
+                if value < alpha:
                     return alpha
-                if entry.value >= beta:
+                if value >= beta:
                     return beta
-                return entry.value
-            elif entry.flag == EntryFlag.BETA:
-                if not is_pv and beta <= entry.value:
+                return value
+            elif flag == FLAG_BETA:
+                if not is_pv and beta <= value:
                     return beta
-            elif entry.flag == EntryFlag.ALPHA:
-                if not is_pv and alpha >= entry.value:
+            elif flag == FLAG_ALPHA:
+                if not is_pv and alpha >= value:
                     return alpha
 
         # If not a PV node, try null move pruning
@@ -93,32 +146,34 @@ class Searcher:
             if beta_result is not None:
                 return beta_result
 
-        # Generate and score pseudo-legal moves if the current node is a PV node
-        moves_and_score = self.get_scored_pseudo_moves(eval, movegen, position, depth)
-        best_move = cg.Move.null()
+        # Pick the moves in stages, the hash move first and the quiet moves last
+        picker = self.move_pickers[self.ply]
+        picker.reset(position, eval, movegen, depth, entry_move(entry) if entry else cg.NULL_MOVE,
+                     self.killer_moves, self.history_moves)
+        best_move = cg.NULL_MOVE
         num_legal_moves = 0
         old_alpha = alpha
         best_score = -float('inf')
         in_check = movegen.in_check(position)
-        # iterate over the scored moves
-        for i in range(len(moves_and_score)):
-            # sort the moves by score
-            Searcher.sort_moves(i, moves_and_score)
-            move_ = moves_and_score[i][1]
+        # iterate over the moves in the order the picker hands them out
+        while True:
+            move_ = picker.next_move()
+            if move_ is None:
+                break
 
             # skip the move if it is not legal
-            if not movegen.is_move_legal(move_, position):
+            if not movegen.is_legal(position, move_):
                 continue
             
             # increment the number of legal moves and make the move
             num_legal_moves += 1
-            position.make_move(move_)
+            self.make_move(position, move_)
             # recursively call the alpha-beta algorithm
             if num_legal_moves == 1:
                 score = -self.alphabeta(position, eval, movegen, depth - 1, -beta, -alpha, True)
             else:
                 # perform late move reduction if the move is a quiet move
-                if num_legal_moves > 4 and move_.get_move_type() == 'Quiet' and not is_pv and depth >= 5 and not in_check:
+                if num_legal_moves > 4 and (move_ >> cg.MOVE_TYPE_SHIFT) & 7 == cg.MOVE_QUIET and not is_pv and depth >= 5 and not in_check:
                     reduced_depth = depth - 2
                     if num_legal_moves > 10:
                         reduced_depth = depth - 3
@@ -132,7 +187,7 @@ class Searcher:
                     if score > alpha and score < beta:
                         score = -self.alphabeta(position, eval, movegen, depth - 1, -beta, -alpha, True)
 
-            position.unmake_move()
+            self.unmake_move(position)
 
             # update the best score and best move
             if score > best_score:
@@ -146,14 +201,7 @@ class Searcher:
                             self.nodes_fail_high_first += 1
                         self.nodes_fail_high += 1
                         self.update_killers(depth, move_)
-                        self.transposition_table.insert(position.get_zobrist(), Entry(
-                            key=position.get_zobrist(),
-                            flag=EntryFlag.BETA,
-                            value=beta,
-                            move_=move_,
-                            depth=depth,
-                            ancient=False
-                        ))
+                        self.transposition_table.insert(position.get_zobrist(), FLAG_BETA, beta, move_, depth)
                         return beta
                     alpha = score
 
@@ -164,23 +212,9 @@ class Searcher:
         
         # store the search result in the transposition table
         if alpha != old_alpha:
-            self.transposition_table.insert(position.get_zobrist(), Entry(
-                key=position.get_zobrist(),
-                flag=EntryFlag.EXACT,
-                value=best_score,
-                move_=best_move,
-                depth=depth,
-                ancient=False
-            ))
+            self.transposition_table.insert(position.get_zobrist(), FLAG_EXACT, best_score, best_move, depth)
         else:
-            self.transposition_table.insert(position.get_zobrist(), Entry(
-                key=position.get_zobrist(),
-                flag=EntryFlag.ALPHA,
-                value=alpha,
-                move_=best_move,
-                depth=depth,
-                ancient=False
-            ))
+            self.transposition_table.insert(position.get_zobrist(), FLAG_ALPHA, alpha, best_move, depth)
         return alpha
 
     def quiesce(self, position: cg.Position, eval: cg.Evaluator, movegen: cg.MoveGenerator,
@@ -194,20 +228,24 @@ class Searcher:
             alpha = score
         
         # generate and score capture moves
-        best_move = cg.Move.null()
+        best_move = cg.NULL_MOVE
         num_legal_moves = 0
-        moves_and_score = self.get_scored_capture_moves(eval, movegen, position, depth)
-        for i in range(len(moves_and_score)):
-            Searcher.sort_moves(i, moves_and_score)
-            move_ = moves_and_score[i][1]
+        entry = self.transposition_table.retrieve(position.get_zobrist())
+        picker = self.move_pickers[self.ply]
+        picker.reset(position, eval, movegen, depth, entry_move(entry) if entry else cg.NULL_MOVE,
+                     self.killer_moves, self.history_moves, captures_only=True)
+        while True:
+            move_ = picker.next_move()
+            if move_ is None:
+                break
 
-            if not movegen.is_move_legal(move_, position):
+            if not movegen.is_legal(position, move_):
                 continue
 
             num_legal_moves += 1
-            position.make_move(move_)
+            self.make_move(position, move_)
             score = -self.quiesce(position, eval, movegen, depth, -beta, -alpha)
-            position.unmake_move()
+            self.unmake_move(position)
 
             if score >= beta:
                 if num_legal_moves == 1:
@@ -220,74 +258,43 @@ class Searcher:
 
         return alpha
 
-    @staticmethod
-    def sort_moves(current_index: int, moves: list):
-        best_score = 0
-        best_score_index = current_index
-        for i in range(current_index, len(moves)):
-            score = moves[i][0]
-            if score >= best_score:
-                best_score = score
-                best_score_index = i
-        if current_index != best_score_index:
-            moves[current_index], moves[best_score_index] = moves[best_score_index], moves[current_index]
+    def make_move(self, position: cg.Position, move_: int):
+        position.make_move(move_)
+        self.ply += 1
+        if self.ply == len(self.move_pickers):
+            self.move_pickers.append(MovePicker())
+
+    def unmake_move(self, position: cg.Position):
+        position.unmake_move()
+        self.ply -= 1
 
     def clear_heuristics(self):
-        for i in range(len(self.killer_moves)):
-            for j in range(len(self.killer_moves[i])):
-                self.killer_moves[i][j] = cg.Move.null()
-        for i in range(len(self.history_moves)):
-            for j in range(len(self.history_moves[i])):
-                self.history_moves[i][j] = 0
+        for killers in self.killer_moves:
+            killers[0] = killers[1] = cg.NULL_MOVE
+        self.history_moves[:] = [0] * len(self.history_moves)
 
     def clear_search_stats(self):
         self.nodes_searched = 0
         self.nodes_fail_high_first = 0
         self.nodes_fail_high = 0
 
-    def update_killers(self, depth: int, move_: cg.Move):
-        if not move_.get_is_capture():
+    def update_killers(self, depth: int, move_: int):
+        if not cg.is_capture(move_):
             if move_ != self.killer_moves[depth][0] and move_ != self.killer_moves[depth][1]:
                 self.killer_moves[depth][1] = self.killer_moves[depth][0]
                 self.killer_moves[depth][0] = move_
 
-    def update_history_heuristic(self, depth: int, move_: cg.Move):
-        if not move_.get_is_capture():
-            self.history_moves[move_.get_from()][move_.get_to()] += depth
-
-    def get_scored_pseudo_moves(self, eval: cg.Evaluator, movegen: cg.MoveGenerator, position: cg.Position, depth: int) -> list:
-        moves_and_score = [(eval.score_move(depth, self.history_moves, self.killer_moves, position, mv), mv) for mv in movegen.get_pseudo_moves(position)]
-
-        entry = self.transposition_table.retrieve(position.get_zobrist())
-        if entry:
-            best_move = entry.move_
-            for i in range(len(moves_and_score)):
-                if moves_and_score[i][1] == best_move:
-                    moves_and_score[i] = (float('inf'), moves_and_score[i][1])
-                    break
-
-        return moves_and_score
-
-    def get_scored_capture_moves(self, eval: cg.Evaluator, movegen: cg.MoveGenerator, position: cg.Position, depth: int) -> list:
-        moves_and_score = [(eval.score_move(depth, self.history_moves, self.killer_moves, position, mv), mv) for mv in movegen.get_capture_moves(position)]
-
-        entry = self.transposition_table.retrieve(position.get_zobrist())
-        if entry:
-            best_move = entry.move_
-            for i in range(len(moves_and_score)):
-                if moves_and_score[i][1] == best_move:
-                    moves_and_score[i] = (float('inf'), moves_and_score[i][1])
-                    break
-
-        return moves_and_score
+    def update_history_heuristic(self, depth: int, move_: int):
+        if not cg.is_capture(move_):
+            self.history_moves[move_ & cg.FROM_TO_MASK] += depth
 
     def try_null_move(self, position: cg.Position, eval: cg.Evaluator, movegen: cg.MoveGenerator,
                       depth: int, alpha: int, beta: int, do_null: bool) -> Optional[int]:
         if do_null:
             if depth > 3 and eval.can_do_null_move(position) and not movegen.in_check(position):
-                position.make_move(cg.Move.null())
+                self.make_move(position, cg.NULL_MOVE)
                 nscore = -self.alphabeta(position, eval, movegen, depth - 3, -beta, -beta + 1, False)
-                position.unmake_move()
+                self.unmake_move(position)
                 if nscore >= beta:
                     return beta
         return None
\ No newline at end of file
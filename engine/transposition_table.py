@@ -1,80 +1,320 @@
-from typing import List, Optional
-from . import coreGame as cg
-from enum import Enum
+import mmap
+import os
+import struct
+import sys
+import zlib
+from multiprocessing import resource_tracker, shared_memory
+from typing import Optional
 
-TABLE_SIZE = 1_000_000
+DEFAULT_TABLE_MB = 64
 ENTRIES_PER_CLUSTER = 4
+ENTRY_BYTES = 16 # a key word and a data word
 
 
 '''
 This file handles the transposition table, which is a hash table that stores the values of positions that have been evaluated before.
 It is used to avoid re-evaluating the same position multiple times.  Eventually, the table will fill up and the oldest entries will be replaced. Alternatively, entries will be replaced once they are no longer evaluated at a high enough depth.
 
-The table is implemented as a list of clusters, where each cluster is a list of entries. Each entry stores the value of a position, as well as the depth at which it was evaluated. The table is indexed by the zobrist key of the position.
+The table is two flat columns of unsigned 64 bit words, the keys and the packed data of the entries, split into
+clusters of ENTRIES_PER_CLUSTER entries.  A position can only be stored in the cluster its zobrist key maps to.
+The key column holds the zobrist key XORed with the data word, so an entry only matches a position if both of its
+words were written together.  Processes sharing a table (see SharedTranspositionTable) can then store and probe
+without a lock: an entry torn by two processes writing it at once fails the check and reads as a miss.
+Like moves (see move.py) an entry is handed out as a plain int, its data word, read with entry_move, entry_value,
+entry_depth and entry_flag:
+    bits 0-31:  the best move found
+    bits 32-51: the value, offset by VALUE_OFFSET
+    bits 52-57: the depth searched
+    bits 58-59: the flag, FLAG_ALPHA, FLAG_EXACT or FLAG_BETA
+    bits 60-63: the generation, the search that stored the entry
+A data word of 0 is an empty entry, stored entries always have a depth of at least 1.
+
+Every search starts a new generation (new_search), entries stored by earlier searches can still be read but are replaced
+first.  The columns live in an anonymous memory map, which the OS hands out zero filled, so building and clearing the
+table don't depend on its size.
+
+A table can be saved to a file and loaded back by a later process.  The file is a header of TABLE_FILE_HEADER_SIZE bytes,
+followed by the two columns as they are in memory.  The header holds the format version, the shape of the table, the
+digest of the variant the entries belong to (see Position.get_variant_digest) and a crc32 of the columns.  A loaded
+table maps the file copy on write, so its pages are only read in as they are probed and the file is left unchanged
+until the table is saved again.
 '''
 
+VALUE_SHIFT = 32
+VALUE_OFFSET = 1 << 19
+VALUE_LIMIT = VALUE_OFFSET - 1 # values are clamped to +-VALUE_LIMIT
+DEPTH_SHIFT = 52
+DEPTH_MASK = 63
+FLAG_SHIFT = 58
+GENERATION_SHIFT = 60
+NUM_GENERATIONS = 16
 
-class EntryFlag(Enum):
-    ALPHA = 0
-    EXACT = 1
-    BETA = 2
-    NULL = 3
+FLAG_ALPHA = 0
+FLAG_EXACT = 1
+FLAG_BETA = 2
 
-class Entry:
-    # Stores the data for a single entry in the transposition table
-    def __init__(self, key: int, flag: EntryFlag, value: int, move_: cg.Move, depth: int, ancient: bool):
-        self.key = key
-        self.flag = flag
-        self.value = value
-        self.move_ = move_
-        self.depth = depth
-        self.ancient = ancient
+TABLE_FILE_MAGIC = b'CBTT'
+TABLE_FILE_VERSION = 2
+# magic, version, entries per cluster, generation, clusters, variant digest, crc32 of the columns
+TABLE_FILE_HEADER = struct.Struct('<4sHBBQ16sI')
+TABLE_FILE_HEADER_SIZE = 64 # the columns start 64 byte aligned
+
+SHARED_TABLE_MAGIC = b'CBST'
+# magic, clusters, generation
+SHARED_TABLE_HEADER = struct.Struct('<4sQB')
+SHARED_TABLE_HEADER_SIZE = 64
+
+
+def entry_move(entry: int) -> int:
+    return entry & 0xFFFFFFFF
+
+
+def entry_value(entry: int) -> int:
+    return ((entry >> VALUE_SHIFT) & 0xFFFFF) - VALUE_OFFSET
+
+
+def entry_depth(entry: int) -> int:
+    return (entry >> DEPTH_SHIFT) & DEPTH_MASK
 
-    @classmethod
-    def null(cls) -> 'Entry':
-        return cls(0, EntryFlag.NULL, 0, cg.Move.null(), 0, True)
 
-class Cluster:
-    def __init__(self):
-        self.entries: List[Entry] = [Entry.null() for _ in range(ENTRIES_PER_CLUSTER)]
+def entry_flag(entry: int) -> int:
+    return (entry >> FLAG_SHIFT) & 3
+
 
 class TranspositionTable:
-    def __init__(self):
-        self.data: List[Cluster] = [Cluster() for _ in range(TABLE_SIZE)]
-
-    def set_ancient(self):
-        for cluster in self.data:
-            for entry in cluster.entries:
-                entry.ancient = True
-
-    def insert(self, zobrist_key: int, entry: Entry):
-        cluster = self.data[zobrist_key % TABLE_SIZE]
-        for i in range(len(cluster.entries)):
-            tentry = cluster.entries[i]
-            if tentry.depth <= entry.depth and tentry.key == zobrist_key and tentry.flag != EntryFlag.NULL:
-                cluster.entries[i] = entry
+    def __init__(self, size_mb: int = DEFAULT_TABLE_MB):
+        # The table takes size_mb megabytes, rounded down to whole clusters
+        self.num_clusters = max(1, size_mb * 1024 * 1024 // (ENTRY_BYTES * ENTRIES_PER_CLUSTER))
+        self.num_entries = self.num_clusters * ENTRIES_PER_CLUSTER
+        self.generation = 0
+        self.buffer = None
+        self.clear()
+
+    def size_mb(self) -> int:
+        # The size in whole megabytes, which TranspositionTable(size_mb) rounds back to the same number of clusters
+        return self.num_entries * ENTRY_BYTES // (1024 * 1024)
+
+    def clear(self):
+        # Empties the table by mapping fresh zero filled columns, the pages are only touched once entries are stored
+        self.release()
+        self.map_columns(mmap.mmap(-1, self.num_entries * ENTRY_BYTES), 0)
+        self.generation = 0
+
+    def map_columns(self, buffer, offset: int):
+        # Uses the num_entries * ENTRY_BYTES bytes of buffer starting at offset as the key and data columns
+        self.buffer = buffer
+        with memoryview(buffer) as view:
+            words = view[offset:offset + self.num_entries * ENTRY_BYTES].cast('Q')
+        self.keys = words[:self.num_entries]
+        self.data = words[self.num_entries:]
+        words.release()
+
+    def checksum(self) -> int:
+        return zlib.crc32(self.data, zlib.crc32(self.keys))
+
+    def save(self, path: str, variant_digest: bytes):
+        # Writes the table to a file, see load.  The file is replaced in one step, so a reader never sees half a table.
+        header = bytearray(TABLE_FILE_HEADER_SIZE)
+        TABLE_FILE_HEADER.pack_into(header, 0, TABLE_FILE_MAGIC, TABLE_FILE_VERSION, ENTRIES_PER_CLUSTER,
+                                    self.generation, self.num_clusters, variant_digest, self.checksum())
+        temp_path = f"{path}.tmp{os.getpid()}"
+        with open(temp_path, 'wb') as f:
+            f.write(header)
+            f.write(self.keys)
+            f.write(self.data)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str, variant_digest: bytes, verify: bool = True) -> 'TranspositionTable':
+        # Maps a table written by save, raising a ValueError for a file of another format or variant,
+        # or (when verify is set) one whose columns don't match their checksum
+        with open(path, 'rb') as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        try:
+            if len(buffer) < TABLE_FILE_HEADER_SIZE:
+                raise ValueError(f"{path} is not a transposition table file")
+            (magic, version, entries_per_cluster, generation, num_clusters, digest,
+             checksum) = TABLE_FILE_HEADER.unpack_from(buffer)
+            if magic != TABLE_FILE_MAGIC:
+                raise ValueError(f"{path} is not a transposition table file")
+            if version != TABLE_FILE_VERSION or entries_per_cluster != ENTRIES_PER_CLUSTER:
+                raise ValueError(f"Unsupported transposition table version {version}")
+            if digest != variant_digest:
+                raise ValueError(f"{path} holds a transposition table of another variant")
+            if len(buffer) != TABLE_FILE_HEADER_SIZE + num_clusters * ENTRIES_PER_CLUSTER * ENTRY_BYTES:
+                raise ValueError(f"{path} is truncated")
+            table = cls.__new__(cls)
+            table.num_clusters = num_clusters
+            table.num_entries = num_clusters * ENTRIES_PER_CLUSTER
+            table.generation = generation
+            table.map_columns(buffer, TABLE_FILE_HEADER_SIZE)
+        except BaseException:
+            buffer.close()
+            raise
+        if verify and table.checksum() != checksum:
+            table.release()
+            raise ValueError(f"{path} is corrupt, its checksum doesn't match")
+        return table
+
+    def release(self):
+        # Drops the columns, the table can't be used again until clear is called
+        if self.buffer is not None:
+            self.keys.release()
+            self.data.release()
+            self.buffer.close()
+            self.buffer = None
+
+    def new_search(self):
+        # Starts a new generation, the entries of earlier searches are replaced first
+        self.generation = (self.generation + 1) % NUM_GENERATIONS
+
+    def insert(self, zobrist_key: int, flag: int, value: int, move_: int, depth: int):
+        if value > VALUE_LIMIT:
+            value = VALUE_LIMIT
+        elif value < -VALUE_LIMIT:
+            value = -VALUE_LIMIT
+        if depth > DEPTH_MASK:
+            depth = DEPTH_MASK
+        generation = self.generation
+        entry = (move_ | (int(value) + VALUE_OFFSET) << VALUE_SHIFT | depth << DEPTH_SHIFT | flag << FLAG_SHIFT |
+                 generation << GENERATION_SHIFT)
+
+        keys = self.keys
+        data = self.data
+        start = (zobrist_key % self.num_clusters) * ENTRIES_PER_CLUSTER
+        end = start + ENTRIES_PER_CLUSTER
+
+        # an entry of the same position is only replaced by a search at least as deep, or by a newer search
+        for i in range(start, end):
+            tentry = data[i]
+            if tentry and keys[i] ^ tentry == zobrist_key:
+                if (tentry >> DEPTH_SHIFT) & DEPTH_MASK <= depth or tentry >> GENERATION_SHIFT != generation:
+                    keys[i] = zobrist_key ^ entry
+                    data[i] = entry
                 return
 
-        lowest_depth_and_ancient = float('inf')
+        # otherwise the shallowest entry of an earlier search, or the shallowest entry, makes room
+        lowest_depth_and_ancient = DEPTH_MASK + 1
         lowest_depth_and_ancient_indx = -1
-        lowest_depth = float('inf')
-        lowest_depth_index = 0
-        for i in range(ENTRIES_PER_CLUSTER):
-            if cluster.entries[i].ancient and cluster.entries[i].depth <= lowest_depth_and_ancient:
-                lowest_depth_and_ancient = cluster.entries[i].depth
+        lowest_depth = DEPTH_MASK + 1
+        lowest_depth_index = start
+        for i in range(start, end):
+            tentry = data[i]
+            if not tentry:
+                lowest_depth_and_ancient_indx = i
+                break
+            tdepth = (tentry >> DEPTH_SHIFT) & DEPTH_MASK
+            if tentry >> GENERATION_SHIFT != generation and tdepth <= lowest_depth_and_ancient:
+                lowest_depth_and_ancient = tdepth
                 lowest_depth_and_ancient_indx = i
-            if cluster.entries[i].depth <= lowest_depth:
-                lowest_depth = cluster.entries[i].depth
+            if tdepth <= lowest_depth:
+                lowest_depth = tdepth
                 lowest_depth_index = i
 
-        if lowest_depth_and_ancient_indx != -1:
-            cluster.entries[lowest_depth_and_ancient_indx] = entry
-        else:
-            cluster.entries[lowest_depth_index] = entry
+        i = lowest_depth_and_ancient_indx if lowest_depth_and_ancient_indx != -1 else lowest_depth_index
+        keys[i] = zobrist_key ^ entry
+        data[i] = entry
 
-    def retrieve(self, zobrist_key: int) -> Optional[Entry]:
-        cluster = self.data[zobrist_key % TABLE_SIZE]
-        for entry in cluster.entries:
-            if entry.key == zobrist_key and entry.flag != EntryFlag.NULL:
+    def retrieve(self, zobrist_key: int) -> int:
+        # Returns the entry of a position, 0 when the table doesn't hold it
+        keys = self.keys
+        data = self.data
+        start = (zobrist_key % self.num_clusters) * ENTRIES_PER_CLUSTER
+        for i in range(start, start + ENTRIES_PER_CLUSTER):
+            entry = data[i]
+            if keys[i] ^ entry == zobrist_key:
                 return entry
-        return None
\ No newline at end of file
+        return 0
+
+
+class SharedTranspositionTable(TranspositionTable):
+    '''
+    A transposition table in a multiprocessing.shared_memory block, which any process on the host can attach to by
+    name and probe and store into without a lock (see the XORed keys above).  The block starts with a small header
+    holding the number of clusters and the generation of the current search, the columns follow it.
+
+    The process that creates the table owns the block and unlinks it once every process is done with it.  A table
+    passed to a process started by multiprocessing (as an argument, for instance) is attached there by name.
+    '''
+    def __init__(self, size_mb: int = DEFAULT_TABLE_MB, name: Optional[str] = None, num_clusters: Optional[int] = None):
+        # Creates the table in a new shared memory block, the OS picks the name unless one is given.  The table takes
+        # size_mb megabytes rounded down to whole clusters, or num_clusters clusters to match another table.
+        if num_clusters is None:
+            num_clusters = int(size_mb * 1024 * 1024) // (ENTRY_BYTES * ENTRIES_PER_CLUSTER)
+        self.num_clusters = max(1, int(num_clusters))
+        self.num_entries = self.num_clusters * ENTRIES_PER_CLUSTER
+        self.shm = shared_memory.SharedMemory(name=name, create=True,
+                                              size=SHARED_TABLE_HEADER_SIZE + self.num_entries * ENTRY_BYTES)
+        self.owner_pid = os.getpid() # a forked process inherits the table, but not its ownership
+        self.generation = 0
+        SHARED_TABLE_HEADER.pack_into(self.shm.buf, 0, SHARED_TABLE_MAGIC, self.num_clusters, 0)
+        self.map_columns(self.shm.buf, SHARED_TABLE_HEADER_SIZE)
+
+    @classmethod
+    def attach(cls, name: str, inherited: bool = False) -> 'SharedTranspositionTable':
+        # Opens a table created by another process, inherited is set when this process was started by the
+        # creator through multiprocessing (see open_shared_memory)
+        shm = open_shared_memory(name, inherited)
+        magic, num_clusters, generation = SHARED_TABLE_HEADER.unpack_from(shm.buf)
+        if magic != SHARED_TABLE_MAGIC:
+            shm.close()
+            raise ValueError(f"Shared memory block {name} is not a transposition table")
+        table = cls.__new__(cls)
+        table.shm = shm
+        table.owner_pid = None
+        table.num_clusters = num_clusters
+        table.num_entries = num_clusters * ENTRIES_PER_CLUSTER
+        table.generation = generation
+        table.map_columns(shm.buf, SHARED_TABLE_HEADER_SIZE)
+        return table
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def __reduce__(self):
+        return SharedTranspositionTable.attach, (self.name, True)
+
+    def new_search(self):
+        # Starts a new generation for every process using the table
+        self.generation = (self.read_generation() + 1) % NUM_GENERATIONS
+        SHARED_TABLE_HEADER.pack_into(self.shm.buf, 0, SHARED_TABLE_MAGIC, self.num_clusters, self.generation)
+
+    def read_generation(self) -> int:
+        # Returns the generation of the current search, and makes it the generation this process stores entries with
+        self.generation = SHARED_TABLE_HEADER.unpack_from(self.shm.buf)[2]
+        return self.generation
+
+    def clear(self):
+        # Empties the table in place, other processes keep using the same block
+        zeros = bytes(1 << 20)
+        with memoryview(self.shm.buf) as view:
+            for start in range(SHARED_TABLE_HEADER_SIZE, len(view), len(zeros)):
+                end = min(start + len(zeros), len(view))
+                view[start:end] = zeros[:end - start]
+
+    def __del__(self):
+        if getattr(self, 'shm', None) is not None:
+            self.release()
+
+    def release(self):
+        # Detaches this process from the table, the owner unlinks the block as well
+        if self.shm is not None:
+            self.keys.release()
+            self.data.release()
+            self.shm.close()
+            if self.owner_pid == os.getpid():
+                self.shm.unlink()
+            self.shm = None
+
+
+def open_shared_memory(name: str, inherited: bool = False) -> shared_memory.SharedMemory:
+    # Attaches to a shared memory block without handing it to the resource tracker of this process, which would
+    # unlink the block when the process exits.  Processes started by multiprocessing (inherited) share the tracker
+    # of the process that created the block, which already tracks it.
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    shm = shared_memory.SharedMemory(name=name)
+    if not inherited:
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm